@@ -1,27 +1,123 @@
 """Flask application serving TikTok video grid."""
 from __future__ import annotations
 
+import json
 import os
 from dataclasses import asdict
-from typing import List, Optional
+from typing import Iterable, List, Optional
 
-from flask import Flask, jsonify, render_template, request
+from flask import Flask, Response, g, jsonify, render_template, request, stream_with_context
 from flask_cors import CORS
 
-from crawler import DEFAULT_KEYWORD, CrawlerResult, get_tiktok_videos
+import crawl_queue
+import metrics
+import response_cache
+import thumbnails
+import warmer
+from cache_codec import FIELDS
+from crawler import (
+    DEFAULT_KEYWORD,
+    BatchQuery,
+    CachedRows,
+    CrawlerResult,
+    TikTokVideo,
+    cache_stats,
+    crawl_jobs,
+    get_cached_rows,
+    get_tiktok_page,
+    get_tiktok_videos,
+    get_tiktok_videos_batch,
+    query_video_index,
+    session_pool_stats,
+    stream_tiktok_videos,
+)
+
+MAX_BATCH_QUERIES = int(os.getenv("TIKTOK_MAX_BATCH_QUERIES", "50"))
+MAX_LIMIT = int(os.getenv("TIKTOK_MAX_LIMIT", "1000"))  # videos per request; larger limits are capped
 
 app = Flask(__name__)
 CORS(app)
 
+
+@app.before_request
+def _start_timings():
+    if metrics.TIMING_HEADER:
+        g.timings, g.timings_token = metrics.start_request()
+
+
+@app.after_request
+def _add_timing_header(response: Response) -> Response:
+    timings = g.get("timings")
+    if timings is not None and not response.is_streamed:
+        response.headers["Server-Timing"] = timings.header()
+    return response
+
+
+@app.teardown_request
+def _end_timings(exc: Optional[BaseException]) -> None:
+    token = g.pop("timings_token", None)
+    if token is not None:
+        metrics.end_request(token)
+
+
+def _serialize_video(video: TikTokVideo) -> dict[str, object]:
+    video_dict = asdict(video)
+    video_dict["thumbnail_url"] = thumbnails.public_url(video.thumbnail_url)
+    # The frontend expects a `mediaUrl` field for direct video playback.
+    video_dict["mediaUrl"] = video_dict.get("play_url") or video_dict.get("download_url")
+    video_dict["authorId"] = video.author_id
+    return video_dict
+
+
 def _serialize_videos(result: CrawlerResult) -> list[dict[str, object]]:
+    return [_serialize_video(video) for video in result.videos]
+
+
+def _videos_payload(keywords: List[str], result: CrawlerResult) -> dict[str, object]:
+    return {
+        "keyword": keywords,
+        "total": len(result.videos),
+        "from_cache": result.from_cache,
+        "stale": result.stale,
+        "cache_age": result.cache_age,
+        "partial": result.partial,
+        "next_cursor": result.next_cursor if result.partial else None,
+        "videos": _serialize_videos(result),
+    }
+
+
+def _cached_rows_body(keywords: List[str], cached: CachedRows) -> bytes:
+    """Serialize a cache hit to the same JSON as :func:`_videos_payload`, straight from rows."""
     videos = []
-    for video in result.videos:
-        video_dict = asdict(video)
-        # The frontend expects a `mediaUrl` field for direct video playback.
-        video_dict["mediaUrl"] = video_dict.get("play_url") or video_dict.get("download_url")
-        video_dict["authorId"] = video.author_id
+    for row in cached.rows:
+        video_dict = dict(zip(FIELDS, row))
+        video_dict["thumbnail_url"] = thumbnails.public_url(row[3])
+        video_dict["mediaUrl"] = row[6] or row[5]  # play_url, then download_url
+        video_dict["authorId"] = row[2]
         videos.append(video_dict)
-    return videos
+    return _json_body({
+        "keyword": keywords,
+        "total": len(videos),
+        "from_cache": True,
+        "stale": cached.stale,
+        "cache_age": cached.cache_age,
+        "partial": cached.partial,
+        "next_cursor": None,
+        "videos": videos,
+    })
+
+
+def _json_body(payload: dict[str, object]) -> bytes:
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _cached_response(cached: response_cache.CachedResponse) -> Response:
+    status, headers, body = response_cache.negotiate(
+        cached,
+        accept_encoding=request.headers.get("Accept-Encoding"),
+        if_none_match=request.headers.get("If-None-Match"),
+    )
+    return Response(body, status=status, headers=headers)
 
 
 @app.route("/")
@@ -60,18 +156,257 @@ def _resolve_keyword(raw_keywords: Optional[str]) -> List[str]:
     return keywords or DEFAULT_KEYWORD
 
 
+def _parse_limit(raw: Optional[str]) -> int:
+    """The `limit` query parameter, capped at MAX_LIMIT; raises ValueError with a message for the client."""
+    try:
+        limit = int(raw if raw is not None else 100)
+    except ValueError:
+        raise ValueError("limit must be an integer") from None
+    if limit <= 0:
+        raise ValueError("limit must be positive")
+    return min(limit, MAX_LIMIT)
+
+
 @app.route("/api/videos")
 def api_videos():
     keywords = _resolve_keyword(request.args.get("q"))
-    limit = int(request.args.get("limit", 100))
+    try:
+        limit = _parse_limit(request.args.get("limit"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     force_refresh = request.args.get("force_refresh", "false").lower() == "true"
     app.logger.info(f"force_refresh: {force_refresh}")
-    result = get_tiktok_videos(keywords, num_videos=limit, force_refresh=force_refresh)
+    cursor = request.args.get("cursor")
+    if cursor is not None:
+        # Paginated mode: one page per call, `cursor=` (empty) starts from the top.
+        try:
+            result = get_tiktok_page(keywords, limit, cursor=cursor or None, force_refresh=force_refresh)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify({
+            "keyword": keywords,
+            "total": len(result.videos),
+            "from_cache": result.from_cache,
+            "cache_age": result.cache_age,
+            "next_cursor": result.next_page,
+            "error": result.error,
+            "videos": _serialize_videos(result),
+        })
+
+    warmer.record_query(keywords, limit)
+    generations = None
+    cached = None
+    if not force_refresh:
+        stored, generations = response_cache.lookup(keywords, limit)
+        if stored is not None:
+            return _cached_response(stored)
+        cached = get_cached_rows(keywords, limit)
+
+    if cached is None and crawl_queue.ENABLED:
+        # Leave the crawl to the worker pool; None means Redis is down and we crawl here as before.
+        # Once a job was accepted this worker never crawls: it serves what the job cached, or its status.
+        try:
+            wait = max(0.0, min(float(request.args.get("wait", crawl_queue.WAIT)), crawl_queue.MAX_WAIT))
+        except ValueError:
+            return jsonify({"error": "wait must be a number of seconds"}), 400
+        job = crawl_jobs.submit(keywords, limit, force_refresh=force_refresh)
+        if job is not None:
+            job = crawl_jobs.wait(job, wait)
+            if not job.finished:
+                return _job_accepted(job)
+            # A rate-limited crawl caches fewer videos than asked for, and a failed keyword
+            # none at all; serve what there is rather than crawling the gap here.
+            cached = None if job.status == "failed" else get_cached_rows(keywords, limit, allow_partial=True)
+            if cached is None:
+                error = job.error or "the crawl finished but its results are no longer cached"
+                return jsonify({"keyword": keywords, "job": _job_payload(job), "error": error}), 502
+
+    if cached is not None:
+        body, cache_age = _cached_rows_body(keywords, cached), cached.cache_age
+        cacheable = not cached.stale and not cached.partial
+    else:
+        result = get_tiktok_videos(keywords, num_videos=limit, force_refresh=force_refresh)
+        body = _json_body(_videos_payload(keywords, result))
+        # Stale bodies are not kept: their refresh will bump the generations anyway.
+        cacheable = bool(result.videos) and not result.stale and not result.error and not result.partial
+        cache_age = result.cache_age
+    if generations is None or not cacheable:
+        return Response(body, mimetype="application/json")
+
+    stored = response_cache.build(body, generations, cache_age=cache_age)
+    response_cache.store(keywords, limit, stored)
+    return _cached_response(stored)
+
+
+def _job_payload(job: crawl_queue.Job) -> dict[str, object]:
+    return {**asdict(job), "status_url": f"/api/jobs/{job.id}"}
+
+
+def _job_accepted(job: crawl_queue.Job) -> Response:
+    response = jsonify(_job_payload(job))
+    response.status_code = 202
+    response.headers["Location"] = f"/api/jobs/{job.id}"
+    response.headers["Retry-After"] = "1"
+    return response
+
+
+@app.route("/api/jobs/<job_id>")
+def api_job(job_id: str):
+    """State of a crawl job queued by `/api/videos`; once `done`, repeat the original request."""
+    if crawl_jobs.client() is None:
+        return jsonify({"error": "crawl queue is unavailable"}), 503
+    job = crawl_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "unknown job"}), 404
+    return jsonify(_job_payload(job))
+
+
+def _batch_query(raw: object) -> BatchQuery:
+    """Parse one query of a batch request; raises ValueError with a message for the client."""
+    if not isinstance(raw, dict):
+        raise ValueError("each query must be an object")
+    q = raw.get("q")
+    if isinstance(q, list) and all(isinstance(k, str) for k in q):
+        keywords = [k.strip() for k in q if k.strip()] or DEFAULT_KEYWORD
+    elif q is None or isinstance(q, str):
+        keywords = _resolve_keyword(q)
+    else:
+        raise ValueError("q must be a string or a list of strings")
+    try:
+        limit = int(raw.get("limit", 100))
+    except (TypeError, ValueError):
+        raise ValueError("limit must be an integer") from None
+    cursor = raw.get("cursor")
+    if cursor is not None and (not isinstance(cursor, int) or isinstance(cursor, bool) or cursor < 0):
+        raise ValueError("cursor must be a non-negative integer")
+    force_refresh = raw.get("force_refresh", False)
+    if isinstance(force_refresh, str):
+        force_refresh = force_refresh.lower() == "true"
+    return BatchQuery(keywords=keywords, num_videos=limit, cursor=cursor, force_refresh=bool(force_refresh))
+
+
+@app.route("/api/videos/batch", methods=["POST"])
+def api_videos_batch():
+    """Resolve several queries at once: `{"queries": [{"q", "limit", "cursor", "force_refresh"}, ...]}`.
+
+    Results come back in query order; a failed query carries its own `error`.
+    """
+    body = request.get_json(silent=True)
+    raw_queries = body.get("queries") if isinstance(body, dict) else None
+    if not isinstance(raw_queries, list):
+        return jsonify({"error": "request body must be a JSON object with a 'queries' list"}), 400
+    if len(raw_queries) > MAX_BATCH_QUERIES:
+        return jsonify({"error": f"at most {MAX_BATCH_QUERIES} queries per batch"}), 400
+
+    results: list[Optional[dict[str, object]]] = [None] * len(raw_queries)
+    valid: list[tuple[int, BatchQuery]] = []
+    for position, raw in enumerate(raw_queries):
+        try:
+            valid.append((position, _batch_query(raw)))
+        except ValueError as e:
+            results[position] = {"error": str(e)}
+    for _, query in valid:
+        if query.cursor is None:
+            warmer.record_query(query.keywords, query.num_videos)
+    answers = get_tiktok_videos_batch([query for _, query in valid]) if valid else []
+    for (position, query), result in zip(valid, answers):
+        results[position] = {**_videos_payload(query.keywords, result), "error": result.error}
+    return jsonify({"results": results})
+
+
+@app.route("/api/videos/index")
+def api_videos_index():
+    """Query the local video index: `q` (one keyword), `author`, `since` (epoch seconds)."""
+    try:
+        since = float(request.args["since"]) if "since" in request.args else None
+        limit = int(request.args.get("limit", 100))
+        videos = query_video_index(
+            keyword=request.args.get("q"),
+            author=request.args.get("author"),
+            since=since,
+            limit=limit,
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if videos is None:
+        return jsonify({"error": "video index is disabled"}), 503
+    return jsonify({"total": len(videos), "videos": [_serialize_video(video) for video in videos]})
+
+
+def _stream_records(keywords: List[str], limit: int, force_refresh: bool) -> Iterable[dict[str, object]]:
+    for event in stream_tiktok_videos(keywords, num_videos=limit, force_refresh=force_refresh):
+        if isinstance(event, CrawlerResult):
+            yield {
+                "type": "summary",
+                "keyword": keywords,
+                "total": len(event.videos),
+                "from_cache": event.from_cache,
+                "stale": event.stale,
+                "cache_age": event.cache_age,
+                "next_cursor": event.next_cursor,
+                "partial": event.partial,
+                "error": event.error,
+            }
+        else:
+            yield {"type": "videos", "videos": [_serialize_video(video) for video in event]}
+
+
+@app.route("/api/videos/stream")
+def api_videos_stream():
+    """Stream videos as NDJSON (default) or Server-Sent Events (`format=sse`)."""
+    keywords = _resolve_keyword(request.args.get("q"))
+    try:
+        limit = _parse_limit(request.args.get("limit"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    force_refresh = request.args.get("force_refresh", "false").lower() == "true"
+    use_sse = request.args.get("format") == "sse" or "text/event-stream" in request.headers.get("Accept", "")
+
+    def generate():
+        for record in _stream_records(keywords, limit, force_refresh):
+            data = json.dumps(record, ensure_ascii=False)
+            yield f"event: {record['type']}\ndata: {data}\n\n" if use_sse else data + "\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream" if use_sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/api/thumbnails/<int:width>/<token>")
+def api_thumbnail(width: int, token: str):
+    """A cover resized for the grid, cached on disk; `token` is the base64url of the TikTok URL."""
+    if not thumbnails.enabled():
+        return jsonify({"error": "thumbnail cache is disabled"}), 404
+    try:
+        url = thumbnails.decode_token(token)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if width not in thumbnails.THUMBNAIL_WIDTHS or not thumbnails.allowed(url):
+        return jsonify({"error": "unknown thumbnail"}), 404
+    try:
+        thumbnail = thumbnails.get(url, width)
+    except (thumbnails.ThumbnailError, OSError) as e:
+        app.logger.warning("Thumbnail unavailable: %s", e)
+        return jsonify({"error": "thumbnail unavailable"}), 502
+    response = Response(thumbnail.body, content_type=thumbnail.content_type)
+    response.set_etag(thumbnail.etag)
+    response.headers["Cache-Control"] = thumbnails.CACHE_CONTROL
+    return response.make_conditional(request)
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.route("/api/crawler/stats")
+def api_crawler_stats():
     return jsonify({
-        "keyword": keywords,
-        "total": len(result.videos),
-        "from_cache": result.from_cache,
-        "videos": _serialize_videos(result),
+        "session_pool": session_pool_stats(),
+        "cache": cache_stats(),
+        "crawl_queue": {"enabled": crawl_queue.ENABLED, "depth": crawl_jobs.depth() if crawl_queue.ENABLED else None},
     })
 
 
@@ -0,0 +1,493 @@
+"""ASGI entry point that serves /api/videos natively on the event loop.
+
+Run with ``uvicorn asgi:app --app-dir api``. Cache lookups go through an async
+Redis client and cache misses await ``_fetch_tiktok_videos_async`` on the server
+loop, so concurrent cold requests no longer pin one worker thread each. Every
+other route (and paginated ``/api/videos?cursor=`` calls) is served by the Flask
+app through asgiref. The synchronous ``get_tiktok_videos`` path is unchanged and
+still backs ``crawler.main()``. With ``TIKTOK_CRAWL_QUEUE=1`` only response-cache
+hits are served here; the rest goes to Flask, which hands crawls to the queue.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from dataclasses import replace
+from typing import Any, Awaitable, Callable, List, Optional
+from urllib.parse import parse_qs
+
+import redis
+import redis.asyncio as aioredis
+from asgiref.wsgi import WsgiToAsgi
+
+import cache_codec
+import crawl_queue
+import crawler
+import metrics
+import response_cache
+import thumbnails
+import warmer
+from app import _json_body, _resolve_keyword, _videos_payload
+from app import app as flask_app
+from circuit_breaker import CircuitBreaker
+from crawler import CrawlerResult
+from local_cache import LocalCache
+from session_pool import SessionPool
+from singleflight import INCR_SCRIPT, AsyncRedisLease
+
+logger = logging.getLogger(__name__)
+
+Scope = dict[str, Any]
+Receive = Callable[[], Awaitable[dict[str, Any]]]
+Send = Callable[[dict[str, Any]], Awaitable[None]]
+ASGIApp = Callable[[Scope, Receive, Send], Awaitable[None]]
+
+
+class AsyncVideoService:
+    """Async counterpart of :func:`crawler.get_tiktok_videos`, sharing its cache layout."""
+
+    def __init__(
+        self,
+        redis_client: Optional[aioredis.Redis],
+        pool: Optional[SessionPool],
+        *,
+        breaker: Optional[CircuitBreaker] = None,
+    ) -> None:
+        self._redis = redis_client
+        self.breaker = breaker
+        self.pool = pool
+        self._inflight: dict[str, tuple[int, asyncio.Future[CrawlerResult]]] = {}
+        self._refreshing: set[str] = set()
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def redis(self) -> Optional[aioredis.Redis]:
+        # While the breaker is open, requests skip Redis instead of waiting out its timeouts.
+        if self.breaker is not None and not self.breaker.closed:
+            return None
+        return self._redis
+
+    async def get_videos(
+        self,
+        keywords: Optional[List[str]] = None,
+        num_videos: int = 200,
+        *,
+        force_refresh: bool = False,
+        cursor: Optional[int] = None,
+    ) -> CrawlerResult:
+        keywords = crawler._normalise_keywords(keywords or crawler.DEFAULT_KEYWORD)
+        if not keywords:
+            raise ValueError("Keywords list must not be empty")
+
+        keys = [crawler._cache_key(keyword, cursor) for keyword in keywords]
+        entries = [None] * len(keys) if force_refresh else await self._read_many(keys, min_videos=num_videos)
+        for index, entry in enumerate(entries):
+            if entry is not None and entry.stale:
+                self._schedule_refresh(keywords[index], num_videos, keys[index], cursor)
+
+        missing = crawler._keywords_to_crawl(entries, num_videos)
+        if missing and not force_refresh and cursor is None and crawler.VIDEO_INDEX_PATH:
+            for index in missing:
+                entries[index] = await asyncio.to_thread(crawler._read_index, keywords[index], num_videos)
+                if entries[index] is not None:
+                    self._schedule_refresh(keywords[index], num_videos, keys[index], cursor)
+            missing = crawler._keywords_to_crawl(entries, num_videos)
+
+        results = await asyncio.gather(
+            *(self._crawl_shared(keywords[i], num_videos, keys[i], cursor) for i in missing),
+            return_exceptions=True,
+        )
+        errors: list[str] = []
+        for index, result in zip(missing, results):
+            if isinstance(result, BaseException):
+                logger.error("An error occurred during TikTok crawling: %s", result)
+                errors.append(str(result))
+                continue
+            if result.error:
+                errors.append(result.error)
+            entries[index] = result
+        return crawler._compose_result(keywords, entries, num_videos, errors)
+
+    async def lookup_response(
+        self, keywords: List[str], limit: int
+    ) -> tuple[Optional[response_cache.CachedResponse], Optional[list[int]]]:
+        if self.redis is None or not response_cache.enabled():
+            return None, None
+        try:
+            with metrics.timed("redis_get"):
+                values = await self.redis.mget(response_cache.lookup_keys(keywords, limit))
+        except redis.exceptions.RedisError as e:
+            logger.error("Redis GET operation failed: %s", e)
+            metrics.cache_result("response", "error")
+            return None, None
+        return response_cache.from_lookup(values)
+
+    async def store_response(self, keywords: List[str], limit: int, response: response_cache.CachedResponse) -> None:
+        ttl = response_cache.store_ttl(response.cache_age)
+        if self.redis is None or ttl <= 0:
+            return
+        try:
+            with metrics.timed("redis_set"):
+                await self.redis.set(response_cache.response_key(keywords, limit), response_cache.encode(response), ex=ttl)
+        except redis.exceptions.RedisError as e:
+            logger.error("Redis SET operation failed: %s", e)
+
+    async def aclose(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    # -- cache ---------------------------------------------------------------
+
+    async def _local_cache(self) -> Optional[LocalCache[cache_codec.CacheEntry]]:
+        local = crawler._get_local_cache(subscribe=False)
+        if local is None:
+            # (Re)subscribing waits up to SUBSCRIBE_TIMEOUT for Redis; keep that off the loop.
+            local = await asyncio.to_thread(crawler._get_local_cache)
+        return local
+
+    async def _read_many(
+        self, keys: List[str], *, min_videos: Optional[int] = None, use_local: bool = True
+    ) -> list[Optional[CrawlerResult]]:
+        entries: list[Optional[CrawlerResult]] = [None] * len(keys)
+        if self.redis is None:
+            return entries
+        cached: list[Optional[cache_codec.CacheEntry]] = [None] * len(keys)
+        tiers: list[Optional[str]] = [None] * len(keys)
+        local = await self._local_cache() if use_local else None
+        if local is not None:
+            for index, key in enumerate(keys):
+                cached[index] = local.get(key)
+                if cached[index] is not None:
+                    tiers[index] = "local"
+        missing = [index for index, entry in enumerate(cached) if entry is None]
+        if missing:
+            try:
+                with metrics.timed("redis_get"):
+                    raw_entries = await self.redis.mget([keys[index] for index in missing])
+            except redis.exceptions.RedisError as e:
+                logger.error("Redis GET operation failed: %s", e)
+                raw_entries = []
+                for index in missing:
+                    tiers[index] = "error"
+            for index, cached_data in zip(missing, raw_entries):
+                if not cached_data:
+                    continue
+                try:
+                    cached[index], tiers[index] = cache_codec.decode(cached_data), "redis"
+                except (ValueError, TypeError) as e:
+                    logger.error("Failed to decode Redis cache entry '%s': %s", keys[index], e)
+                    tiers[index] = "error"
+                    continue
+                if local is not None:
+                    crawler._store_local(local, keys[index], cached[index], len(cached_data))
+        crawler._count_lookups(tiers, local is not None)
+        for index, entry in enumerate(cached):
+            if entry is not None:
+                entries[index] = crawler._entry_result(entry, min_videos)
+        return entries
+
+    async def _write(self, key: str, result: CrawlerResult, lease: Optional[AsyncRedisLease], *, limit: int) -> None:
+        if self.redis is None:
+            return
+        payload = crawler._encode_cache_entry(result.videos, result.next_cursor, limit=limit)
+        try:
+            with metrics.timed("redis_set"):
+                if lease is None:
+                    await self.redis.set(key, payload, ex=crawler.CACHE_HARD_TTL)
+                elif not await lease.fenced_set(payload, ex=crawler.CACHE_HARD_TTL):
+                    logger.warning("Discarding crawl result for '%s'; a newer crawl holds the lease", key)
+                    return
+                await self.redis.eval(INCR_SCRIPT, 1, crawler._generation_key(key), crawler.CACHE_HARD_TTL)
+        except redis.exceptions.RedisError as e:
+            logger.error("Redis SET operation failed: %s", e)
+            return
+        crawler._remember_local([(key, payload)])
+        try:
+            await self.redis.publish(crawler.INVALIDATION_CHANNEL, crawler._cache_listener.message(key))
+        except redis.exceptions.RedisError as e:
+            logger.error("Redis PUBLISH operation failed: %s", e)
+
+    # -- crawling -------------------------------------------------------------
+
+    async def _crawl_shared(self, keyword: str, num_videos: int, key: str, cursor: Optional[int]) -> CrawlerResult:
+        # Concurrent misses for the same key on this loop share one crawl; a crawl
+        # too small for this caller is waited out and then crawled again.
+        while key in self._inflight:
+            size, future = self._inflight[key]
+            if size >= num_videos:
+                result = await asyncio.shield(future)
+                return replace(result, videos=result.videos[:num_videos])
+            await asyncio.wait([future])
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = (num_videos, future)
+        try:
+            result = await self._crawl(keyword, num_videos, key, cursor)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            future.exception()  # mark retrieved when nobody else was waiting
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._inflight[key]
+
+    async def _acquire_lease(self, key: str) -> tuple[Optional[AsyncRedisLease], Optional[CrawlerResult]]:
+        if self.redis is None:
+            return None, None
+        lease = AsyncRedisLease(self.redis, key, ttl=crawler.CRAWL_LEASE_TTL, fence_ttl=crawler.CACHE_HARD_TTL)
+        try:
+            if await lease.acquire():
+                return lease, None
+            logger.info("Another worker is crawling '%s'; waiting for its result", key)
+            if await lease.wait_for_holder(timeout=crawler.COALESCE_WAIT, interval=crawler.COALESCE_POLL_INTERVAL):
+                cached = (await self._read_many([key], use_local=False))[0]
+                if cached is not None:
+                    return None, cached
+            return (lease if await lease.acquire() else None), None
+        except redis.exceptions.RedisError as e:
+            logger.error("Redis lease operation failed: %s", e)
+            return None, None
+
+    async def _crawl(self, keyword: str, num_videos: int, key: str, cursor: Optional[int]) -> CrawlerResult:
+        lease, peer_result = await self._acquire_lease(key)
+        if peer_result is not None:
+            return peer_result
+        try:
+            errors: list[str] = []
+            try:
+                videos, next_cursor = await crawler._fetch_tiktok_videos_async(
+                    [keyword], num_videos, initial_cursor=cursor, pool=self.pool, errors=errors
+                )
+            except Exception as exc:  # noqa: BLE001
+                logger.error("TikTok crawl failed: %s", exc)
+                metrics.CRAWL_FAILURES.inc(reason="exception")
+                videos, next_cursor = [], None
+            if not videos:
+                return CrawlerResult(
+                    videos=[], from_cache=False, next_cursor=next_cursor,
+                    error=f"no video results for keywords: {keyword}",
+                )
+            partial = bool(errors)
+            result = CrawlerResult(videos=videos, from_cache=False, next_cursor=next_cursor, partial=partial)
+            await self._write(key, result, lease, limit=len(videos) if partial else num_videos)
+            await asyncio.to_thread(crawler._index_videos, keyword, videos)
+            await asyncio.to_thread(crawler._save_near_dups)
+            thumbnails.prefetch(v.thumbnail_url for v in videos)
+            return result
+        finally:
+            if lease is not None:
+                await lease.release()
+
+    def _schedule_refresh(self, keyword: str, num_videos: int, key: str, cursor: Optional[int]) -> None:
+        if key in self._refreshing or key in self._inflight:
+            return
+        self._refreshing.add(key)
+        logger.info("Scheduling background refresh for stale key '%s'", key)
+
+        async def refresh() -> None:
+            try:
+                await self._crawl_shared(keyword, num_videos, key, cursor)
+            except Exception as e:  # noqa: BLE001
+                logger.error("Background refresh for '%s' raised: %s", key, e)
+            finally:
+                self._refreshing.discard(key)
+
+        task = asyncio.get_running_loop().create_task(refresh())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+class _BreakerConnection(aioredis.Connection):
+    """Reports connection failures and timeouts to ``crawler.redis_breaker``."""
+
+    async def connect(self) -> None:
+        with crawler.redis_breaker.recording(crawler._CONNECTION_ERRORS, success=False):
+            await super().connect()
+
+    async def read_response(self, *args: Any, **kwargs: Any) -> Any:
+        with crawler.redis_breaker.recording(crawler._CONNECTION_ERRORS):
+            return await super().read_response(*args, **kwargs)
+
+
+def _connect_redis() -> aioredis.Redis:
+    # Connects lazily; crawler.redis_breaker says whether Redis is usable right now.
+    return aioredis.Redis.from_pool(aioredis.ConnectionPool(
+        connection_class=_BreakerConnection,
+        host=crawler.REDIS_HOST,
+        port=crawler.REDIS_PORT,
+        db=crawler.REDIS_DB,
+        max_connections=crawler.REDIS_MAX_CONNECTIONS,
+        socket_timeout=crawler.REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=crawler.REDIS_CONNECT_TIMEOUT,
+        health_check_interval=30,
+    ))
+
+
+def _body(scope: Scope, body: bytes) -> bytes:
+    # HEAD gets the GET headers, Content-Length included, but never the body.
+    return b"" if scope["method"] == "HEAD" else body
+
+
+async def _send_json(send: Send, scope: Scope, status: int, payload: dict[str, object]) -> None:
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("ascii")),
+            (b"access-control-allow-origin", b"*"),
+        ],
+    })
+    await send({"type": "http.response.body", "body": _body(scope, body)})
+
+
+def _header(scope: Scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", []):
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+async def _send_cached(send: Send, scope: Scope, cached: response_cache.CachedResponse) -> None:
+    status, headers, body = response_cache.negotiate(
+        cached,
+        accept_encoding=_header(scope, b"accept-encoding"),
+        if_none_match=_header(scope, b"if-none-match"),
+    )
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers] + [
+            (b"content-length", str(len(body)).encode("ascii")),
+            (b"access-control-allow-origin", b"*"),
+        ],
+    })
+    await send({"type": "http.response.body", "body": _body(scope, body)})
+
+
+def create_app(
+    *,
+    redis_client: Optional[aioredis.Redis] = None,
+    pool: Optional[SessionPool] = None,
+    fallback: Optional[ASGIApp] = None,
+) -> ASGIApp:
+    """Build the ASGI app; injected clients are used as-is and not closed on shutdown."""
+    fallback = fallback or WsgiToAsgi(flask_app)
+    service: Optional[AsyncVideoService] = None
+    owned: list[Any] = []
+    startup_lock = asyncio.Lock()
+
+    async def startup() -> AsyncVideoService:
+        nonlocal service
+        async with startup_lock:
+            if service is not None:
+                return service
+            client, breaker = redis_client, None
+            if client is None:
+                client, breaker = _connect_redis(), crawler.redis_breaker
+                owned.append(client)
+            session_pool = pool
+            if session_pool is None and crawler.POOL_SIZE > 0:
+                session_pool = SessionPool(
+                    crawler._new_api,
+                    size=crawler.POOL_SIZE,
+                    min_warm=crawler.POOL_MIN_WARM,
+                    idle_timeout=crawler.POOL_IDLE_TIMEOUT,
+                    max_age=crawler.POOL_MAX_AGE,
+                )
+                owned.append(session_pool)
+            if session_pool is not None:
+                await session_pool.start_in_running_loop()
+            # Loading a persisted near-duplicate index reads SQLite; keep that off the loop.
+            await asyncio.to_thread(crawler._get_near_dup_index)
+            await asyncio.to_thread(crawler._get_local_cache)
+            service = AsyncVideoService(client, session_pool, breaker=breaker)
+            return service
+
+    async def shutdown() -> None:
+        if service is not None:
+            await service.aclose()
+        for resource in owned:
+            await resource.aclose()
+
+    async def api_videos(scope: Scope, receive: Receive, send: Send) -> None:
+        params = parse_qs(scope.get("query_string", b"").decode("utf-8"))
+        keywords = _resolve_keyword(params.get("q", [None])[0])
+        try:
+            limit = int(params.get("limit", ["100"])[0])
+        except ValueError:
+            await _send_json(send, scope, 400, {"error": "limit must be an integer"})
+            return
+        force_refresh = params.get("force_refresh", ["false"])[0].lower() == "true"
+        videos_service = await startup()
+        stored, generations = None, None
+        if not force_refresh:
+            stored, generations = await videos_service.lookup_response(keywords, limit)
+        if stored is None and crawl_queue.ENABLED:
+            # Misses go to the crawl workers; the Flask handler owns the submit/wait/202 protocol.
+            await fallback(scope, receive, send)
+            return
+        warmer.record_query(keywords, limit)
+        if stored is not None:
+            await _send_cached(send, scope, stored)
+            return
+
+        result = await videos_service.get_videos(keywords, num_videos=limit, force_refresh=force_refresh)
+        payload = _videos_payload(keywords, result)
+        if generations is None or not result.videos or result.stale or result.error or result.partial:
+            await _send_json(send, scope, 200, payload)
+            return
+        stored = await asyncio.to_thread(
+            response_cache.build, _json_body(payload), generations, cache_age=result.cache_age
+        )
+        await videos_service.store_response(keywords, limit, stored)
+        await _send_cached(send, scope, stored)
+
+    async def asgi_app(scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await startup()
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await shutdown()
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+
+        if (
+            scope["type"] == "http"
+            and scope["path"] == "/api/videos"
+            and scope["method"] in ("GET", "HEAD")
+            and "cursor" not in parse_qs(scope.get("query_string", b"").decode("utf-8"), keep_blank_values=True)
+        ):
+            if not metrics.TIMING_HEADER:
+                await api_videos(scope, receive, send)
+                return
+            timings, token = metrics.start_request()
+
+            async def send_with_timings(message: dict[str, Any]) -> None:
+                if message["type"] == "http.response.start":
+                    header = (b"server-timing", timings.header().encode("latin-1"))
+                    message = {**message, "headers": [*message.get("headers", []), header]}
+                await send(message)
+
+            try:
+                await api_videos(scope, receive, send_with_timings)
+            finally:
+                metrics.end_request(token)
+            return
+        await fallback(scope, receive, send)
+
+    return asgi_app
+
+
+app = create_app()
@@ -0,0 +1,151 @@
+"""Versioned binary encoding for cached crawl results.
+
+Entries are stored column by column: author ids and URL prefixes go through a
+shared string table, canonical ``video_url`` values (``/@author/video/id``) are
+not stored at all, and the whole structure is packed with msgpack. Entries
+written before this format existed are plain JSON objects and are still read.
+msgpack is optional; without it new entries are written as JSON.
+"""
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from typing import Any, List, Optional, Sequence
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - exercised only without the optional dependency
+    msgpack = None
+
+# Column order of a row; must match the field order of crawler.TikTokVideo.
+FIELDS = ("video_id", "video_url", "author_id", "thumbnail_url", "title", "download_url", "play_url")
+Row = tuple
+
+MAGIC = b"TKV"
+VERSION = 1
+
+_URL_FIELDS = (3, 5, 6)  # thumbnail_url, download_url, play_url
+
+
+@dataclass(slots=True)
+class CacheEntry:
+    rows: List[Row]
+    next_cursor: Optional[int] = None
+    limit: Optional[int] = None
+    cached_at: Optional[float] = None
+    has_more: Optional[bool] = None
+
+
+def canonical_video_url(author_id: str, video_id: str) -> str:
+    return f"https://www.tiktok.com/@{author_id}/video/{video_id}"
+
+
+class _StringTable:
+    def __init__(self) -> None:
+        self.values: list[str] = []
+        self._index: dict[str, int] = {}
+
+    def add(self, value: str) -> int:
+        index = self._index.get(value)
+        if index is None:
+            index = self._index[value] = len(self.values)
+            self.values.append(value)
+        return index
+
+
+def _split_url(url: Optional[str], table: _StringTable) -> Any:
+    if url is None:
+        return None
+    query = url.find("?")
+    cut = url.rfind("/", 0, query if query >= 0 else len(url)) + 1
+    return [table.add(url[:cut]), url[cut:]]
+
+
+def _join_url(packed: Any, strings: Sequence[str]) -> Optional[str]:
+    if packed is None:
+        return None
+    prefix, suffix = packed
+    return strings[prefix] + suffix
+
+
+def encode(
+    rows: Sequence[Row],
+    *,
+    next_cursor: Optional[int] = None,
+    limit: Optional[int] = None,
+    cached_at: Optional[float] = None,
+    has_more: Optional[bool] = None,
+) -> bytes:
+    if msgpack is None:
+        return json.dumps({
+            "videos": [dict(zip(FIELDS, row)) for row in rows],
+            "next_cursor": next_cursor,
+            "limit": limit,
+            "cached_at": cached_at,
+            "has_more": has_more,
+        }).encode("utf-8")
+
+    table = _StringTable()
+    columns: list[list[Any]] = [[] for _ in FIELDS]
+    for row in rows:
+        video_id, video_url, author_id = row[0], row[1], row[2]
+        columns[0].append(video_id)
+        columns[1].append(None if video_url == canonical_video_url(author_id, video_id) else video_url)
+        columns[2].append(table.add(author_id))
+        columns[4].append(row[4])
+        for position in _URL_FIELDS:
+            columns[position].append(_split_url(row[position], table))
+
+    body = msgpack.packb(
+        [next_cursor, limit, cached_at, has_more, table.values, columns],
+        use_bin_type=True,
+    )
+    return MAGIC + bytes([VERSION]) + body
+
+
+def decode(data: bytes | str) -> CacheEntry:
+    """Decode either format; raises ValueError for anything unreadable."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    if not data.startswith(MAGIC):
+        return _decode_json(data)
+    if msgpack is None:
+        raise ValueError("binary cache entry found but msgpack is not installed")
+    if len(data) <= len(MAGIC) or data[len(MAGIC)] != VERSION:
+        raise ValueError(f"unsupported cache entry version {data[len(MAGIC):len(MAGIC) + 1]!r}")
+
+    try:
+        next_cursor, limit, cached_at, has_more, strings, columns = msgpack.unpackb(
+            data[len(MAGIC) + 1:], raw=False, use_list=True
+        )
+        ids, urls, authors, thumbs, titles, downloads, plays = columns
+        rows: list[Row] = []
+        for i, video_id in enumerate(ids):
+            author_id = strings[authors[i]]
+            rows.append((
+                video_id,
+                urls[i] if urls[i] is not None else canonical_video_url(author_id, video_id),
+                author_id,
+                _join_url(thumbs[i], strings),
+                titles[i],
+                _join_url(downloads[i], strings),
+                _join_url(plays[i], strings),
+            ))
+    except (ValueError, TypeError, IndexError) as exc:  # msgpack's unpack errors are ValueErrors
+        raise ValueError(f"corrupt cache entry: {exc}") from exc
+    return CacheEntry(rows=rows, next_cursor=next_cursor, limit=limit, cached_at=cached_at, has_more=has_more)
+
+
+def _decode_json(data: bytes) -> CacheEntry:
+    try:
+        payload = json.loads(data)
+        rows = [tuple(video.get(name) for name in FIELDS) for video in payload["videos"]]
+    except (KeyError, TypeError, AttributeError) as exc:
+        raise ValueError(f"malformed cache entry: {exc}") from exc
+    return CacheEntry(
+        rows=rows,
+        next_cursor=payload.get("next_cursor"),
+        limit=payload.get("limit"),
+        cached_at=payload.get("cached_at"),
+        has_more=payload.get("has_more"),
+    )
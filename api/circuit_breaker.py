@@ -0,0 +1,129 @@
+"""Circuit breaker that keeps probing a backend in the background instead of giving up on it."""
+from __future__ import annotations
+
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Tracks whether a backend is usable and re-probes it from a daemon thread while it is not.
+
+    The breaker starts open and :meth:`start` probes right away, so nothing
+    blocks on the first connection. ``failure_threshold`` consecutive failures
+    reported with :meth:`record_failure` open it again. While open, ``probe`` is
+    retried after ``retry_interval`` seconds, doubling up to
+    ``max_retry_interval``. ``on_change(closed)`` runs on every transition.
+    """
+
+    def __init__(
+        self,
+        probe: Callable[[], object],
+        *,
+        name: str,
+        errors: tuple[type[BaseException], ...] = (Exception,),
+        failure_threshold: int = 3,
+        retry_interval: float = 1.0,
+        max_retry_interval: float = 30.0,
+        on_change: Optional[Callable[[bool], None]] = None,
+    ) -> None:
+        self.probe = probe
+        self.name = name
+        self.errors = errors
+        self.failure_threshold = max(1, failure_threshold)
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max(retry_interval, max_retry_interval)
+        self.on_change = on_change
+        self.trips = 0
+        self._failures = 0
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._tripped = threading.Event()
+        self._probed = threading.Event()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def closed(self) -> bool:
+        return self._closed.is_set()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"breaker-{self.name}", daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped = True
+        self._tripped.set()
+
+    def wait(self, timeout: float) -> bool:
+        """Wait up to ``timeout`` seconds for the first probe to finish; returns whether the backend is usable."""
+        self._probed.wait(timeout)
+        return self.closed
+
+    def record_success(self) -> None:
+        self._failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            if not self._closed.is_set():
+                return
+            self._failures += 1
+            if self._failures < self.failure_threshold:
+                return
+            self._closed.clear()
+            self.trips += 1
+        logger.error("%s failed %d times in a row; probing it in the background", self.name, self.failure_threshold)
+        self._notify(False)
+        self._tripped.set()
+
+    @contextmanager
+    def recording(self, errors: tuple[type[BaseException], ...], *, success: bool = True) -> Iterator[None]:
+        """Record ``errors`` raised in the block as failures and, with ``success``, a clean exit as a success."""
+        try:
+            yield
+        except errors:
+            self.record_failure()
+            raise
+        if success:
+            self.record_success()
+
+    def stats(self) -> dict[str, object]:
+        return {"available": self.closed, "trips": self.trips}
+
+    def _notify(self, closed: bool) -> None:
+        if self.on_change is not None:
+            self.on_change(closed)
+
+    def _run(self) -> None:
+        delay = self.retry_interval
+        attempts = 0
+        while not self._stopped:
+            if self._closed.is_set():
+                self._tripped.wait()
+                self._tripped.clear()
+                delay, attempts = self.retry_interval, 0
+                continue
+            try:
+                self.probe()
+            except self.errors as e:
+                self._probed.set()
+                attempts += 1
+                # The first failure explains what is going on; the rest would flood the log.
+                (logger.error if attempts == 1 else logger.debug)(
+                    "%s is unavailable, retrying in %.0fs: %s", self.name, delay, e
+                )
+                self._tripped.wait(delay)
+                self._tripped.clear()
+                delay = min(delay * 2, self.max_retry_interval)
+                continue
+            with self._lock:
+                self._failures = 0
+                self._closed.set()
+            logger.info("%s is available", self.name)
+            self._notify(True)
+            self._probed.set()
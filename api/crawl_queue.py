@@ -0,0 +1,360 @@
+"""Redis-backed crawl job queue, consumed by ``python api/crawler.py --worker``.
+
+With ``TIKTOK_CRAWL_QUEUE=1`` web workers no longer crawl cold keys themselves.
+``/api/videos`` submits a job holding the keywords, cursor and limit, waits a
+moment for it, and answers ``202`` with the job id if it is still running.
+Stale entries are refreshed through low-priority jobs instead of the
+in-process refresh threads.
+
+Pending jobs are members of the sorted set ``tiktok:jobs``, scored so that
+higher priorities come first and equal priorities in submission order. A
+second submission of the same query returns the pending job rather than
+queueing another crawl, and moves it up if it asked for a higher priority; a
+forced refresh marks a queued job as forced, or queues behind a running one
+that was not.
+Each job's state lives in the hash ``tiktok:job:<id>`` until ``JOB_TTL``
+after it finished. Workers pop with ``BZPOPMIN``, so scaling out is a matter
+of starting more of them.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Protocol, Sequence
+
+import redis
+
+import metrics
+from singleflight import RELEASE_SCRIPT
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("TIKTOK_CRAWL_QUEUE", "0") == "1"
+WAIT = float(os.getenv("TIKTOK_CRAWL_WAIT", "3"))  # seconds /api/videos waits for a job before answering 202
+MAX_WAIT = float(os.getenv("TIKTOK_CRAWL_MAX_WAIT", "30"))  # seconds; upper bound for ?wait=
+JOB_TIMEOUT = float(os.getenv("TIKTOK_CRAWL_JOB_TIMEOUT", "300"))  # seconds after queueing or starting before a query can be queued again
+JOB_TTL = float(os.getenv("TIKTOK_CRAWL_JOB_TTL", "3600"))  # seconds a job's status is kept
+WORKER_BATCH = max(1, int(os.getenv("TIKTOK_CRAWL_WORKER_BATCH", "4")))  # jobs a worker crawls together
+
+PRIORITY_INTERACTIVE = 10  # a request is waiting for the result
+PRIORITY_REFRESH = 0  # a stale entry is being served meanwhile
+
+QUEUE_KEY = "tiktok:jobs"
+JOB_KEY_PREFIX = "tiktok:job:"
+QUERY_KEY_PREFIX = "tiktok:job:query:"
+POLL_INTERVAL = 0.1  # seconds between status checks while waiting for a job
+POP_TIMEOUT = 1.0  # seconds a worker blocks in BZPOPMIN; must stay below REDIS_SOCKET_TIMEOUT
+_PRIORITY_STEP = 1e10  # larger than any epoch timestamp, so priority always outranks age
+
+# KEYS[1] = queue zset, KEYS[2] = query -> job id, KEYS[3] = new job hash;
+# ARGV = job id, score, query key ttl, job ttl, force_refresh ("1"/"0"), job key prefix,
+# then the job's field/value pairs.
+# Returns the id of the job that will answer the query: the pending one, or the new one.
+# A forced refresh upgrades a queued job, but a running job that may answer from the
+# cache cannot be upgraded any more, so the refresh is queued after it instead.
+ENQUEUE_SCRIPT = """
+local existing = redis.call('GET', KEYS[2])
+if existing then
+    local job = ARGV[6] .. existing
+    local status = redis.call('HGET', job, 'status')
+    if status == 'queued' or (status == 'running' and (ARGV[5] == '0' or redis.call('HGET', job, 'force_refresh') == '1')) then
+        if ARGV[5] == '1' then
+            redis.call('HSET', job, 'force_refresh', '1')
+        end
+        redis.call('ZADD', KEYS[1], 'XX', 'LT', ARGV[2], existing)
+        return existing
+    end
+end
+redis.call('SET', KEYS[2], ARGV[1], 'EX', ARGV[3])
+redis.call('HSET', KEYS[3], unpack(ARGV, 7))
+redis.call('EXPIRE', KEYS[3], ARGV[4])
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+return ARGV[1]
+"""
+
+# KEYS[1] = job hash; ARGV[1] = start time. Marks the job running and returns its fields
+# as a flat list, or nil if the hash expired: HSET alone would recreate it without a TTL.
+CLAIM_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return nil
+end
+redis.call('HSET', KEYS[1], 'status', 'running', 'started_at', ARGV[1])
+return redis.call('HGETALL', KEYS[1])
+"""
+
+# KEYS[1] = query key; ARGV = job id, ttl. Restarts the dedup window when the job starts,
+# so a job that waited long in the queue is not queued a second time while it runs.
+EXTEND_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class _Result(Protocol):
+    videos: Sequence[object]
+    error: Optional[str]
+
+
+@dataclass(slots=True)
+class Job:
+    """One queued crawl and what became of it."""
+
+    id: str
+    keywords: List[str]
+    limit: int
+    cursor: Optional[int] = None
+    force_refresh: bool = False
+    priority: int = PRIORITY_INTERACTIVE
+    status: str = "queued"  # queued, running, done or failed
+    created_at: Optional[float] = None
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    total: Optional[int] = None
+    joined: bool = False  # set by submit() when the query joined an existing job; not stored
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def _fields(self) -> list[str]:
+        # Keywords never contain commas: /api/videos splits q on them.
+        return [
+            "keywords", ",".join(self.keywords),
+            "limit", str(self.limit),
+            "cursor", "" if self.cursor is None else str(self.cursor),
+            "force_refresh", "1" if self.force_refresh else "0",
+            "priority", str(self.priority),
+            "status", self.status,
+            "created_at", repr(self.created_at),
+        ]
+
+    @classmethod
+    def _from_hash(cls, job_id: str, raw: dict) -> Optional["Job"]:
+        fields = {
+            (k.decode("utf-8") if isinstance(k, bytes) else k): (v.decode("utf-8") if isinstance(v, bytes) else v)
+            for k, v in raw.items()
+        }
+        if "keywords" not in fields:
+            return None
+
+        def number(name: str) -> Optional[float]:
+            return float(fields[name]) if fields.get(name) not in (None, "", "None") else None
+
+        return cls(
+            id=job_id,
+            keywords=fields["keywords"].split(","),
+            limit=int(fields["limit"]),
+            cursor=int(fields["cursor"]) if fields.get("cursor") else None,
+            force_refresh=fields.get("force_refresh") == "1",
+            priority=int(fields.get("priority", PRIORITY_INTERACTIVE)),
+            status=fields.get("status", "queued"),
+            created_at=number("created_at"),
+            started_at=number("started_at"),
+            finished_at=number("finished_at"),
+            error=fields.get("error") or None,
+            total=int(fields["total"]) if fields.get("total") else None,
+        )
+
+
+def _query_key(keywords: List[str], limit: int, cursor: Optional[int]) -> str:
+    return f"{QUERY_KEY_PREFIX}{limit}:{'' if cursor is None else cursor}:{','.join(k.lower() for k in keywords)}"
+
+
+def _decode(value: object) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else str(value)
+
+
+class CrawlQueue:
+    """Submits, tracks and hands out crawl jobs; ``client`` returns ``None`` while Redis is unavailable."""
+
+    def __init__(self, client: Callable[[], Optional[redis.Redis]]) -> None:
+        self.client = client
+
+    def submit(
+        self,
+        keywords: List[str],
+        limit: int,
+        *,
+        cursor: Optional[int] = None,
+        force_refresh: bool = False,
+        priority: int = PRIORITY_INTERACTIVE,
+    ) -> Optional[Job]:
+        """Queue a crawl, or join the pending one for the same query; ``None`` if Redis is unavailable."""
+        client = self.client()
+        if client is None:
+            return None
+        job = Job(
+            id=uuid.uuid4().hex,
+            keywords=list(keywords),
+            limit=limit,
+            cursor=cursor,
+            force_refresh=force_refresh,
+            priority=priority,
+            created_at=time.time(),
+        )
+        score = job.created_at - priority * _PRIORITY_STEP
+        try:
+            job_id = _decode(client.eval(
+                ENQUEUE_SCRIPT,
+                3,
+                QUEUE_KEY,
+                _query_key(keywords, limit, cursor),
+                JOB_KEY_PREFIX + job.id,
+                job.id,
+                repr(score),
+                max(1, int(JOB_TIMEOUT)),
+                max(1, int(JOB_TTL)),
+                "1" if force_refresh else "0",
+                JOB_KEY_PREFIX,
+                *job._fields(),
+            ))
+        except redis.exceptions.RedisError as e:
+            logger.error("Redis job submission failed: %s", e)
+            return None
+        if job_id == job.id:
+            metrics.CRAWL_JOBS.inc(event="submitted")
+            return job
+        metrics.CRAWL_JOBS.inc(event="deduplicated")
+        existing = self.get(job_id)
+        if existing is not None:
+            existing.joined = True
+        return existing
+
+    def get(self, job_id: str) -> Optional[Job]:
+        client = self.client()
+        if client is None:
+            return None
+        try:
+            raw = client.hgetall(JOB_KEY_PREFIX + job_id)
+        except redis.exceptions.RedisError as e:
+            logger.error("Redis job lookup failed: %s", e)
+            return None
+        return Job._from_hash(job_id, raw) if raw else None
+
+    def wait(self, job: Job, timeout: float) -> Job:
+        """Poll until ``job`` finishes or ``timeout`` seconds pass; returns its latest known state."""
+        deadline = time.monotonic() + timeout
+        while not job.finished and time.monotonic() < deadline:
+            time.sleep(min(POLL_INTERVAL, max(0.0, deadline - time.monotonic())))
+            job = self.get(job.id) or job
+        return job
+
+    def depth(self) -> Optional[int]:
+        """Jobs waiting for a worker, or ``None`` if Redis is unavailable."""
+        client = self.client()
+        if client is None:
+            return None
+        try:
+            return int(client.zcard(QUEUE_KEY))
+        except redis.exceptions.RedisError as e:
+            logger.error("Redis ZCARD operation failed: %s", e)
+            return None
+
+    def pop(self, count: int = 1, *, timeout: float = POP_TIMEOUT) -> List[Job]:
+        """Take up to ``count`` jobs, most urgent first, blocking up to ``timeout`` seconds for the first."""
+        client = self.client()
+        if client is None:
+            time.sleep(timeout)
+            return []
+        try:
+            popped = client.bzpopmin(QUEUE_KEY, timeout=timeout)
+            if popped is None:
+                return []
+            ids = [_decode(popped[1])]
+            if count > 1:
+                ids.extend(_decode(member) for member, _ in client.zpopmin(QUEUE_KEY, count - 1))
+            now = repr(time.time())
+            pipe = client.pipeline(transaction=False)
+            for job_id in ids:
+                pipe.eval(CLAIM_SCRIPT, 1, JOB_KEY_PREFIX + job_id, now)
+            replies = pipe.execute()
+            jobs = []
+            for job_id, flat in zip(ids, replies):
+                job = Job._from_hash(job_id, dict(zip(flat[::2], flat[1::2]))) if flat else None
+                if job is None:
+                    # Its hash expired while it waited; nobody can be waiting for it any more.
+                    logger.warning("Dropping crawl job %s without a record", job_id)
+                    continue
+                jobs.append(job)
+            if jobs:
+                pipe = client.pipeline(transaction=False)
+                for job in jobs:
+                    pipe.eval(
+                        EXTEND_SCRIPT, 1, _query_key(job.keywords, job.limit, job.cursor), job.id, max(1, int(JOB_TIMEOUT))
+                    )
+                pipe.execute()
+        except redis.exceptions.RedisError as e:
+            logger.error("Redis job pop failed: %s", e)
+            time.sleep(timeout)
+            return []
+        return jobs
+
+    def finish(self, job: Job, result: Optional[_Result], *, error: Optional[str] = None) -> Job:
+        """Record the outcome of a popped job and let the same query be queued again."""
+        if result is not None:
+            error = result.error
+            job.total = len(result.videos)
+        job.status = "failed" if error and not job.total else "done"
+        job.error = error
+        job.finished_at = time.time()
+        metrics.CRAWL_JOBS.inc(event=job.status)
+        client = self.client()
+        if client is None:
+            return job
+        key = JOB_KEY_PREFIX + job.id
+        try:
+            pipe = client.pipeline(transaction=False)
+            pipe.hset(key, mapping={
+                "status": job.status,
+                "finished_at": repr(job.finished_at),
+                "error": error or "",
+                "total": "" if job.total is None else str(job.total),
+            })
+            pipe.expire(key, max(1, int(JOB_TTL)))
+            pipe.execute()
+            client.eval(RELEASE_SCRIPT, 1, _query_key(job.keywords, job.limit, job.cursor), job.id)
+        except redis.exceptions.RedisError as e:
+            logger.error("Redis job update failed: %s", e)
+        return job
+
+
+def work(queue: CrawlQueue, crawl: Callable[[List[Job]], Sequence[_Result]], *, batch: int = WORKER_BATCH) -> int:
+    """Pop up to ``batch`` jobs, crawl them with one ``crawl`` call and record the results; returns how many ran."""
+    jobs = queue.pop(batch)
+    if not jobs:
+        return 0
+    logger.info("Crawling %d queued jobs: %s", len(jobs), "; ".join(",".join(job.keywords) for job in jobs))
+    try:
+        results = crawl(jobs)
+    except Exception as e:  # noqa: BLE001
+        logger.error("Crawl jobs raised: %s", e, exc_info=True)
+        for job in jobs:
+            queue.finish(job, None, error=str(e))
+        return len(jobs)
+    for job, result in zip(jobs, results):
+        queue.finish(job, result)
+    return len(jobs)
+
+
+def run_worker(
+    queue: CrawlQueue,
+    crawl: Callable[[List[Job]], Sequence[_Result]],
+    *,
+    batch: int = WORKER_BATCH,
+    max_jobs: Optional[int] = None,
+) -> int:
+    """Consume jobs until interrupted, or until ``max_jobs`` have run; returns a process exit code."""
+    logger.info("Crawl worker started, taking up to %d jobs at a time", batch)
+    done = 0
+    try:
+        while max_jobs is None or done < max_jobs:
+            done += work(queue, crawl, batch=batch if max_jobs is None else min(batch, max_jobs - done))
+    except KeyboardInterrupt:
+        logger.info("Crawl worker stopped after %d jobs", done)
+    return 0
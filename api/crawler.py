@@ -3,15 +3,38 @@ from __future__ import annotations
 
 import argparse
 import asyncio
+import atexit
+import base64
+import binascii
+import concurrent.futures
+import contextvars
 import json
 import logging
+import math
 import os
+import queue
+import sqlite3
 import sys
+import threading
 import time
-from dataclasses import asdict, dataclass
-from typing import Iterable, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass, field, replace
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, Iterator, List, Optional, TypeVar, Union
 
-from TikTokApi import TikTokApi
+import cache_codec
+import crawl_queue
+import metrics
+import search_parser
+import snapshot
+import thumbnails
+from circuit_breaker import CircuitBreaker
+from local_cache import InvalidationListener, LocalCache
+from near_duplicates import NearDuplicateIndex
+from rate_limit import RateLimited, RateLimiter, backoff_delay
+from session_pool import PooledSession, SessionPool
+from singleflight import INCR_SCRIPT, RedisLease, SingleFlight
+from video_index import VideoIndex
 
 logger = logging.getLogger(__name__)
 if not logger.handlers:
@@ -21,6 +44,47 @@ if not logger.handlers:
 SEARCH_URL = "https://www.tiktok.com/api/search/general/full/"
 WEB_SEARCH_CODE = '{"tiktok":{"client_params_x":{"search_engine":{"ies_mt_user_live_video_card_use_libra":1,"mt_search_general_user_live_video_card":1}},"search_server":{}}}'
 MAX_PAGES = 50
+# Full search payloads are huge; by default DEBUG logs only summarise them.
+LOG_RAW_RESPONSES = os.getenv("TIKTOK_LOG_RAW_RESPONSES", "0") == "1"
+CRAWL_CONCURRENCY = max(1, int(os.getenv("TIKTOK_CRAWL_CONCURRENCY", "3")))  # max in-flight search requests
+
+# Search request pacing, shared by every worker through Redis when it is available.
+RATE_LIMIT = float(os.getenv("TIKTOK_RATE_LIMIT", "5"))  # requests per second; 0 disables pacing
+RATE_LIMIT_BURST = float(os.getenv("TIKTOK_RATE_LIMIT_BURST", "10"))
+RATE_LIMIT_MIN = float(os.getenv("TIKTOK_RATE_LIMIT_MIN", "0.5"))  # floor for the adaptive rate
+RATE_LIMIT_MAX_WAIT = float(os.getenv("TIKTOK_RATE_LIMIT_MAX_WAIT", "30"))  # seconds; past this a crawl stops with what it has
+RATE_LIMIT_SHARED = os.getenv("TIKTOK_RATE_LIMIT_SHARED", "1") == "1"
+SLOW_RESPONSE = float(os.getenv("TIKTOK_SLOW_RESPONSE", "5"))  # seconds; slower pages lower the rate
+RETRY_ATTEMPTS = max(1, int(os.getenv("TIKTOK_RETRY_ATTEMPTS", "3")))  # tries per search page
+RETRY_BASE_DELAY = float(os.getenv("TIKTOK_RETRY_BASE_DELAY", "0.5"))  # seconds
+RETRY_MAX_DELAY = float(os.getenv("TIKTOK_RETRY_MAX_DELAY", "8"))  # seconds
+
+# Warm browser sessions shared by every crawl in this process; 0 disables the pool.
+POOL_SIZE = int(os.getenv("TIKTOK_POOL_SIZE", "4"))
+POOL_MIN_WARM = int(os.getenv("TIKTOK_POOL_MIN_WARM", "1"))
+POOL_IDLE_TIMEOUT = float(os.getenv("TIKTOK_POOL_IDLE_TIMEOUT", "300"))  # seconds
+POOL_MAX_AGE = float(os.getenv("TIKTOK_POOL_MAX_AGE", "1800"))  # seconds
+
+_session_pool: Optional[SessionPool] = None
+_session_pool_lock = threading.Lock()
+_rate_limiter: Optional[RateLimiter] = None
+_rate_limiter_lock = threading.Lock()
+
+# TikTokApi pulls in Playwright, so it is imported by the first crawl rather than at module load.
+TikTokApi: Optional[Callable[[], Any]] = None
+_tiktok_api_lock = threading.Lock()
+
+
+def _new_api() -> Any:
+    """A new TikTokApi instance, importing the library on first use."""
+    global TikTokApi
+    if TikTokApi is None:
+        with _tiktok_api_lock:
+            if TikTokApi is None:
+                from TikTokApi import TikTokApi as api_class
+
+                TikTokApi = api_class
+    return TikTokApi()
 
 def _build_params(keyword: str, cursor: int, count: int) -> dict:
     return {
@@ -55,26 +119,143 @@ class CrawlerResult:
     from_cache: bool
     error: Optional[str] = None
     next_cursor: Optional[int] = None
+    stale: bool = False  # served past the soft TTL while a refresh runs in the background
+    cache_age: Optional[float] = None  # seconds since the cached entry was written
+    next_page: Optional[str] = None  # opaque cursor for the next page of a paginated query
+    partial: bool = False  # the crawl stopped early; next_cursor is where it got to
+
+
+@dataclass(slots=True)
+class SearchPage:
+    """One upstream search page for a single keyword, as cached for pagination."""
+
+    videos: List[TikTokVideo]
+    next_cursor: Optional[int]
+    has_more: bool
+    from_cache: bool = False
+    cache_age: Optional[float] = None
 
 
+T = TypeVar("T")
+
 import redis
 
 
-_CACHE: dict[str, dict[str, object]] = {}
-CACHE_TTL = int(os.getenv("TIKTOK_CACHE_TTL", "1800"))  # seconds
+CACHE_TTL = int(os.getenv("TIKTOK_CACHE_TTL", "1800"))  # seconds; soft TTL, entries older than this are refreshed
+CACHE_HARD_TTL = max(CACHE_TTL, int(os.getenv("TIKTOK_CACHE_HARD_TTL", "86400")))  # seconds; Redis expiry
 DEFAULT_KEYWORD = os.getenv("TIKTOK_KEYWORD", "KPOP DEMON HUNTERS").split(',')
 
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
 REDIS_DB = int(os.getenv("REDIS_DB", "0"))
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "32"))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "5"))  # seconds
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "2"))  # seconds
+
+REDIS_FAILURE_THRESHOLD = int(os.getenv("REDIS_FAILURE_THRESHOLD", "3"))  # consecutive failures before caching is suspended
+REDIS_RETRY_INTERVAL = float(os.getenv("REDIS_RETRY_INTERVAL", "1"))  # seconds; doubles while Redis stays down
+REDIS_MAX_RETRY_INTERVAL = float(os.getenv("REDIS_MAX_RETRY_INTERVAL", "30"))  # seconds
+
+
+# Errors that say Redis itself is unreachable, as opposed to a bad command.
+_CONNECTION_ERRORS = (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError)
+
+
+class _BreakerConnection(redis.Connection):
+    """Reports connection failures and timeouts to ``redis_breaker``."""
+
+    def connect(self) -> None:
+        with redis_breaker.recording(_CONNECTION_ERRORS, success=False):
+            super().connect()
+
+    def read_response(self, *args: Any, **kwargs: Any) -> Any:
+        with redis_breaker.recording(_CONNECTION_ERRORS):
+            return super().read_response(*args, **kwargs)
+
+
+# One bounded pool shared by request threads, refresh workers and keyword crawls;
+# callers wait for a free connection instead of failing when it is exhausted.
+redis_pool = redis.BlockingConnectionPool(
+    connection_class=_BreakerConnection,
+    host=REDIS_HOST,
+    port=REDIS_PORT,
+    db=REDIS_DB,
+    max_connections=REDIS_MAX_CONNECTIONS,
+    timeout=REDIS_SOCKET_TIMEOUT,
+    socket_timeout=REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+    health_check_interval=30,
+)
+_redis = redis.Redis(connection_pool=redis_pool)
+
+# None while Redis is unreachable: every cache path checks it and falls back to crawling.
+# The breaker connects in the background, so importing this module never waits on Redis.
+redis_client: Optional[redis.Redis] = None
 
-try:
-    redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB)
-    redis_client.ping()
-    logger.info("Successfully connected to Redis at %s:%d", REDIS_HOST, REDIS_PORT)
-except redis.exceptions.ConnectionError as e:
-    logger.error("Could not connect to Redis at %s:%d. Caching will be disabled. Error: %s", REDIS_HOST, REDIS_PORT, e)
-    redis_client = None
+
+def _on_redis_change(available: bool) -> None:
+    global redis_client
+    # Leave alone a client someone else installed (tests, benchmarks).
+    if available and redis_client is None:
+        redis_client = _redis
+    elif not available and redis_client is _redis:
+        redis_client = None
+
+
+redis_breaker = CircuitBreaker(
+    _redis.ping,
+    name=f"Redis at {REDIS_HOST}:{REDIS_PORT}",
+    errors=(redis.exceptions.RedisError,),
+    failure_threshold=REDIS_FAILURE_THRESHOLD,
+    retry_interval=REDIS_RETRY_INTERVAL,
+    max_retry_interval=REDIS_MAX_RETRY_INTERVAL,
+    on_change=_on_redis_change,
+)
+redis_breaker.start()
+metrics.REDIS_AVAILABLE.set_function(lambda: 1 if redis_breaker.closed else 0)
+
+# Jobs for `crawler.py --worker`; web workers only submit to it with TIKTOK_CRAWL_QUEUE=1.
+crawl_jobs = crawl_queue.CrawlQueue(lambda: redis_client)
+
+# Decoded entries kept in this process in front of Redis; writes are announced on
+# INVALIDATION_CHANNEL so other processes drop their copy. 0 bytes disables it.
+LOCAL_CACHE_BYTES = int(os.getenv("TIKTOK_LOCAL_CACHE_BYTES", str(32 * 1024 * 1024)))
+LOCAL_CACHE_TTL = float(os.getenv("TIKTOK_LOCAL_CACHE_TTL", "60"))  # seconds
+INVALIDATION_CHANNEL = "tiktok:invalidate"
+_CACHE: LocalCache[cache_codec.CacheEntry] = LocalCache(max_bytes=LOCAL_CACHE_BYTES, ttl=LOCAL_CACHE_TTL)
+_cache_listener = InvalidationListener(_CACHE, INVALIDATION_CHANNEL)
+metrics.LOCAL_CACHE_BYTES.set_function(lambda: _CACHE.size_bytes)
+metrics.LOCAL_CACHE_ENTRIES.set_function(lambda: len(_CACHE))
+
+# Cache-miss coalescing: one crawl per key in this process, one per key across workers.
+CRAWL_LEASE_TTL = float(os.getenv("TIKTOK_CRAWL_LEASE_TTL", "120"))  # seconds
+COALESCE_WAIT = float(os.getenv("TIKTOK_COALESCE_WAIT", "60"))  # seconds a follower waits for the leader
+COALESCE_POLL_INTERVAL = 0.25
+
+_inflight: SingleFlight[CrawlerResult] = SingleFlight()
+
+# Stale entries are refreshed off the request path, at most once per key at a time.
+REFRESH_WORKERS = max(1, int(os.getenv("TIKTOK_REFRESH_WORKERS", "2")))
+_refresh_executor = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix="tiktok-refresh")
+_refreshing: set[str] = set()
+_refreshing_lock = threading.Lock()
+
+# Durable SQLite record of every crawled video; an empty path disables it.
+VIDEO_INDEX_PATH = os.getenv("TIKTOK_VIDEO_INDEX", "")
+VIDEO_INDEX_MAX_AGE = float(os.getenv("TIKTOK_VIDEO_INDEX_MAX_AGE", "604800"))  # seconds; older crawls are not served
+_video_index: Optional[VideoIndex] = None
+_video_index_lock = threading.Lock()
+
+# Reuploads and re-edits of one clip are collapsed when results are merged; a threshold of 0 disables it.
+NEAR_DUP_THRESHOLD = float(os.getenv("TIKTOK_NEAR_DUP_THRESHOLD", "0.6"))  # estimated Jaccard similarity
+NEAR_DUP_INDEX_PATH = os.getenv("TIKTOK_NEAR_DUP_INDEX", "")  # SQLite file; empty keeps signatures in memory
+NEAR_DUP_SYNC_INTERVAL = float(os.getenv("TIKTOK_NEAR_DUP_SYNC_INTERVAL", "30"))  # seconds between loads of other workers' rows
+NEAR_DUP_MAX_AGE = float(os.getenv("TIKTOK_NEAR_DUP_MAX_AGE", str(VIDEO_INDEX_MAX_AGE)))  # seconds; older signatures are dropped, 0 keeps all
+_near_dups: Optional[NearDuplicateIndex] = None
+_near_dups_lock = threading.Lock()
+
+# Uncached keywords of a multi-keyword query are crawled side by side.
+_keyword_executor = ThreadPoolExecutor(max_workers=max(4, CRAWL_CONCURRENCY * 2), thread_name_prefix="tiktok-keyword")
 
 
 def _normalise_keywords(keywords: Optional[List[str]]) -> List[str]:
@@ -83,164 +264,964 @@ def _normalise_keywords(keywords: Optional[List[str]]) -> List[str]:
     return [k.strip() for k in keywords if k.strip()]
 
 
-def _normalise_thumbnail(candidate: object) -> Optional[str]:
-    """Extract the first usable thumbnail URL from TikTok's nested payload."""
-
-    def _pick_from_mapping(mapping: dict) -> Optional[str]:
-        values_to_try = [
-            mapping.get("url"),
-            mapping.get("thumbUrl"),
-            mapping.get("thumb_url"),
-            mapping.get("cover"),
-            mapping.get("origin"),
-            mapping.get("uri"),
-            mapping.get("urlList"),
-            mapping.get("url_list"),
-            mapping.get("urls"),
-        ]
-        for value in values_to_try:
-            normalised = _normalise_thumbnail(value)
-            if normalised:
-                return normalised
-        return None
+def _first_sighting(seen_ids: set[str], video_id: str, cluster: Optional[str]) -> bool:
+    """Mark a video and its near-duplicate cluster as merged; False if either already was."""
+    if video_id in seen_ids or (cluster is not None and cluster in seen_ids):
+        return False
+    seen_ids.add(video_id)
+    if cluster is not None:
+        seen_ids.add(cluster)
+    return True
 
-    if isinstance(candidate, str):
-        candidate = candidate.strip()
-        return candidate or None
 
-    if isinstance(candidate, dict):
-        return _pick_from_mapping(candidate)
+def _extract_videos(data_block: Iterable[dict[str, object]]) -> list[TikTokVideo]:
+    with metrics.timed("extract"):
+        return search_parser.extract_videos(data_block, TikTokVideo)
 
-    if isinstance(candidate, (list, tuple, set)):
-        for item in candidate:
-            normalised = _normalise_thumbnail(item)
-            if normalised:
-                return normalised
-        return None
 
-    return None
+class _CrawlAborted(Exception):
+    """Raised when a search page fails and the crawl has to be abandoned."""
 
 
-def _extract_videos(data_block: Iterable[dict[str, object]]) -> list[TikTokVideo]:
-    videos: list[TikTokVideo] = []
-    for entry in data_block:
-        if not isinstance(entry, dict):
-            continue
-        if entry.get("type") != 1:  # non-video results (users, ads, etc.)
-            continue
-        item = entry.get("item") or {}
-        video_id = str(item.get("id") or "").strip()
-        if not video_id:
-            continue
-        author = item.get("author") or {}
-        author_id = str(author.get("uniqueId") or author.get("id") or "unknown")
-        video_meta = item.get("video") or {}
-        cover = _normalise_thumbnail(
-            video_meta.get("originCover") or video_meta.get("cover") or video_meta.get("dynamicCover")
-        )
-        download_url = (
-            video_meta.get("downloadAddr")
-            or video_meta.get("downloadAddrH265")
-            or video_meta.get("downloadAddrWatermark")
+class _SearchFailed(Exception):
+    """One attempt at a search page failed; it may succeed when retried."""
+
+
+@dataclass(slots=True)
+class _CrawlState:
+    """Shared bookkeeping for the keyword tasks of a single crawl."""
+
+    num_videos: int
+    buckets: list[list[TikTokVideo]]
+    cursors: list[Optional[int]]
+    seen_ids: set[str] = field(default_factory=set)
+    near_dups: Optional[NearDuplicateIndex] = None
+    collected: int = 0
+    filled: asyncio.Event = field(default_factory=asyncio.Event)
+    # Called with (keyword index, parsed videos, response cursor) for every page.
+    on_page: Optional[Callable[[int, List[TikTokVideo], Optional[int]], None]] = None
+    # Set from another thread when nobody wants the rest; checked after every page.
+    stop: Optional[threading.Event] = None
+
+    def accept(self, index: int, videos: Iterable[TikTokVideo]) -> int:
+        added = duplicates = near_duplicates = 0
+        for video in videos:
+            if video.video_id in self.seen_ids:
+                duplicates += 1
+                continue
+            cluster = self.near_dups.assign(video) if self.near_dups is not None else None
+            if not _first_sighting(self.seen_ids, video.video_id, cluster):
+                near_duplicates += 1
+                continue
+            self.buckets[index].append(video)
+            added += 1
+        self.collected += added
+        if duplicates:
+            metrics.VIDEOS_DEDUPLICATED.inc(duplicates)
+        if near_duplicates:
+            metrics.NEAR_DUPLICATES.inc(near_duplicates)
+        if self.collected >= self.num_videos:
+            self.filled.set()
+        return added
+
+
+async def _search(session: PooledSession, keyword: str, params: dict) -> dict:
+    try:
+        with metrics.timed("make_request"):
+            response = await session.api.make_request(url=SEARCH_URL, params=params, session_index=session.session_index)
+    except Exception as exc:  # noqa: BLE001
+        logger.error("Request to TikTok search failed for keyword '%s': %s", keyword, exc)
+        session.failed = True
+        raise _SearchFailed(str(exc)) from exc
+
+    if isinstance(response, (str, bytes)):
+        try:
+            response = search_parser.loads(response)
+        except ValueError as exc:
+            logger.warning("Undecodable TikTok response for keyword '%s': %s", keyword, exc)
+            raise _SearchFailed(f"undecodable response: {exc}") from exc
+    if not isinstance(response, dict):
+        logger.warning("Unexpected TikTok response type for keyword '%s': %s", keyword, type(response))
+        raise _SearchFailed(f"unexpected response type {type(response).__name__}")
+    if response.get("status_code"):
+        # TikTok reports throttling and verification walls in the body with a 200.
+        logger.warning("TikTok search returned status %s for keyword '%s'", response.get("status_code"), keyword)
+        raise _SearchFailed(f"status_code {response.get('status_code')}: {response.get('status_msg')}")
+    return response
+
+
+async def _request_page(
+    session: PooledSession,
+    keyword: str,
+    cursor: int,
+    count: int,
+    *,
+    limiter: asyncio.Semaphore,
+) -> dict:
+    """Fetch one search page, pacing requests and retrying transient failures with backoff."""
+    params = _build_params(keyword, cursor, count)
+    rate_limiter = _get_rate_limiter()
+    for attempt in range(1, RETRY_ATTEMPTS + 1):
+        async with limiter:
+            if rate_limiter is not None:
+                try:
+                    await rate_limiter.acquire()
+                except RateLimited as exc:
+                    logger.warning("Stopping crawl for keyword '%s': %s", keyword, exc)
+                    raise _CrawlAborted(str(exc)) from exc
+            started = time.monotonic()
+            try:
+                response = await _search(session, keyword, params)
+                error = None
+            except _SearchFailed as exc:
+                error = exc
+        if rate_limiter is not None:
+            await rate_limiter.record(ok=error is None, elapsed=time.monotonic() - started)
+        if error is None:
+            break
+        if attempt == RETRY_ATTEMPTS:
+            raise _CrawlAborted(str(error)) from error
+        delay = backoff_delay(attempt, base=RETRY_BASE_DELAY, cap=RETRY_MAX_DELAY)
+        logger.info(
+            "Retrying TikTok search for keyword '%s' in %.2fs (attempt %d/%d)", keyword, delay, attempt + 1, RETRY_ATTEMPTS
         )
-        play_url = (
-            video_meta.get("playAddr")
-            or video_meta.get("playAddrH265")
-            or video_meta.get("playApiHref")
+        metrics.SEARCH_RETRIES.inc()
+        await asyncio.sleep(delay)
+
+    metrics.PAGES_FETCHED.inc()
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "TikTok API response for keyword '%s': %s",
+            keyword,
+            response if LOG_RAW_RESPONSES else search_parser.summarize(response),
         )
-        videos.append(
-            TikTokVideo(
-                video_id=video_id,
-                video_url=f"https://www.tiktok.com/@{author_id}/video/{video_id}",
-                author_id=author_id,
-                thumbnail_url=cover,
-                title=item.get("desc") or None,
-                download_url=download_url,
-                play_url=play_url,
+    return response
+
+
+async def _crawl_keyword(
+    session: PooledSession,
+    index: int,
+    keyword: str,
+    state: _CrawlState,
+    *,
+    initial_cursor: Optional[int],
+    limiter: asyncio.Semaphore,
+) -> None:
+    cursor = initial_cursor if initial_cursor is not None else 0
+    stride: Optional[int] = None
+    page = accepted = 0
+
+    while state.collected < state.num_videos and page < MAX_PAGES:
+        # TikTok's search cursor is a plain offset, so once we know how far a page
+        # moves it we can request the next few pages at once instead of in turn,
+        # but no more than this keyword's yield so far says are still needed.
+        window = 1
+        if stride is not None:
+            per_page = max(1.0, accepted / page)
+            needed = math.ceil((state.num_videos - state.collected) / per_page)
+            window = max(1, min(CRAWL_CONCURRENCY, MAX_PAGES - page, needed))
+        cursors = [cursor + i * (stride or 0) for i in range(window)]
+        responses = await asyncio.gather(
+            *(
+                _request_page(session, keyword, c, state.num_videos, limiter=limiter)
+                for c in cursors
             )
         )
-    return videos
 
+        for requested_cursor, response in zip(cursors, responses):
+            if requested_cursor != cursor:
+                # The prediction diverged from what TikTok returned; refetch from the real cursor.
+                break
 
-async def _fetch_tiktok_videos_async(keywords: List[str], num_videos: int, *, initial_cursor: Optional[int] = None) -> tuple[List[TikTokVideo], Optional[int]]:
-    logger.info("Calling _fetch_tiktok_videos_async for keywords: %s, num_videos: %d", keywords, num_videos)
-    all_videos: list[TikTokVideo] = []
-    seen_ids: set[str] = set()
-    last_cursor: Optional[int] = initial_cursor
+            videos = _extract_videos(response.get("data") or [])
+            accepted += state.accept(index, videos)
+            if state.on_page is not None:
+                state.on_page(index, videos, response.get("cursor"))
+            if state.stop is not None and state.stop.is_set():
+                state.filled.set()  # wind the other keywords down as if the crawl were full
+                return
+            page += 1
+            logger.info(
+                "Fetched %d/%d TikTok videos (page %d, keyword='%s')",
+                state.collected,
+                state.num_videos,
+                page,
+                keyword,
+            )
 
-    async with TikTokApi() as api:
-        await api.create_sessions(num_sessions=1, sleep_after=3)
+            if not response.get("has_more"):
+                logger.info("TikTok search has no more pages (keyword='%s')", keyword)
+                return
 
-        for keyword in keywords:
-            cursor = initial_cursor if initial_cursor is not None else 0
-            page = 0
+            next_cursor = response.get("cursor")
+            if next_cursor is None or next_cursor == cursor:
+                logger.info("TikTok returned stagnant cursor for keyword '%s'; stopping pagination.", keyword)
+                return
+            next_cursor = int(next_cursor)
+            stride = next_cursor - cursor if next_cursor > cursor else None
+            cursor = next_cursor
+            state.cursors[index] = cursor
 
-            while len(all_videos) < num_videos and page < MAX_PAGES:
-                params = _build_params(keyword, cursor, num_videos) # Pass num_videos as count
-                try:
-                    response = await api.make_request(url=SEARCH_URL, params=params)
-                    logger.debug("TikTok API raw response for keyword '%s': %s", keyword, response)
-                except Exception as exc:  # noqa: BLE001
-                    logger.error("Request to TikTok search failed for keyword '%s': %s", keyword, exc)
-                    return [], None # Return empty list and None cursor on error
-
-                if not isinstance(response, dict):
-                    logger.warning("Unexpected TikTok response type for keyword '%s': %s", keyword, type(response))
-                    return [], None # Return empty list and None cursor on unexpected response
-
-                data_block = response.get("data") or []
-                logger.debug("TikTok API data_block for keyword '%s': %s", keyword, data_block)
-                new_videos_from_batch = []
-                for video in _extract_videos(data_block):
-                    if video.video_id in seen_ids:
-                        continue
-                    seen_ids.add(video.video_id)
-                    new_videos_from_batch.append(video)
-
-                all_videos.extend(new_videos_from_batch)
-
-                logger.info(
-                    "Fetched %d/%d TikTok videos (page %d, keyword='%s')",
-                    len(all_videos),
-                    num_videos,
-                    page + 1,
-                    keyword,
-                )
+            if state.collected >= state.num_videos:
+                return
+
+
+@asynccontextmanager
+async def _open_sessions(wanted: int, pool: Optional[SessionPool]) -> AsyncIterator[list[PooledSession]]:
+    """Yield up to ``wanted`` sessions, borrowed from ``pool`` or opened for this crawl only."""
+    if pool is None:
+        async with _new_api() as api:
+            with metrics.timed("create_sessions"):
+                await api.create_sessions(num_sessions=wanted, sleep_after=3)
+            yield [PooledSession(api=api, session_index=i) for i in range(wanted)]
+        return
 
-                page += 1
-                has_more = bool(response.get("has_more"))
-                if not has_more:
-                    logger.info("TikTok search has no more pages (keyword='%s')", keyword)
-                    break
-
-                next_cursor = response.get("cursor")
-                if next_cursor is None or next_cursor == cursor:
-                    logger.info("TikTok returned stagnant cursor for keyword '%s'; stopping pagination.", keyword)
-                    break
-                cursor = int(next_cursor)
-                last_cursor = cursor # Update last_cursor with the latest cursor
-            
-            if len(all_videos) >= num_videos: # If we've reached the overall limit, stop
+    # Block for one session only; extras are taken when idle so that concurrent
+    # crawls cannot deadlock each other while holding part of the pool.
+    with metrics.timed("acquire_session"):
+        sessions = [await pool.acquire()]
+    try:
+        while len(sessions) < wanted:
+            extra = await pool.acquire(wait=False)
+            if extra is None:
                 break
+            sessions.append(extra)
+        yield sessions
+    finally:
+        for session in sessions:
+            await pool.release(session)
+
+
+async def _fetch_tiktok_videos_async(
+    keywords: List[str],
+    num_videos: int,
+    *,
+    initial_cursor: Optional[int] = None,
+    pool: Optional[SessionPool] = None,
+    on_page: Optional[Callable[[int, List[TikTokVideo], Optional[int]], None]] = None,
+    errors: Optional[List[str]] = None,
+    sessions: Optional[List[PooledSession]] = None,
+    limiter: Optional[asyncio.Semaphore] = None,
+    stop: Optional[threading.Event] = None,
+) -> tuple[List[TikTokVideo], Optional[int]]:
+    """Crawl ``keywords`` until ``num_videos`` unique videos are collected or the results run out.
+
+    If a page still fails after its retries (or the rate limit would make it
+    wait too long) the crawl stops and returns what it collected so far, with
+    the cursor it reached; the reason is appended to ``errors``. Concurrent
+    crawls can share already open ``sessions`` and one in-flight ``limiter``.
+    Setting ``stop`` from another thread ends the crawl after its current pages.
+    """
+    logger.info("Calling _fetch_tiktok_videos_async for keywords: %s, num_videos: %d", keywords, num_videos)
+    state = _CrawlState(
+        num_videos=num_videos,
+        buckets=[[] for _ in keywords],
+        cursors=[None for _ in keywords],
+        near_dups=_get_near_dup_index(),
+        on_page=on_page,
+        stop=stop,
+    )
+    limiter = limiter or asyncio.Semaphore(CRAWL_CONCURRENCY)
+
+    with metrics.timed("crawl"):
+        try:
+            await _crawl_with_sessions(
+                keywords, state, initial_cursor=initial_cursor, limiter=limiter, pool=pool, sessions=sessions
+            )
+        except _CrawlAborted as exc:
+            metrics.CRAWL_FAILURES.inc(reason="rate_limited" if isinstance(exc.__cause__, RateLimited) else "search_error")
+            if errors is not None:
+                errors.append(str(exc))
+            if not state.collected:
+                return [], None # Return empty list and None cursor on error
+            logger.warning("Crawl stopped early (%s); returning %d partial results", exc, state.collected)
 
+    all_videos = [video for bucket in state.buckets for video in bucket]
+    last_cursor = next((c for c in reversed(state.cursors) if c is not None), initial_cursor)
     return all_videos[:num_videos], last_cursor
 
 
-def _run_async(keywords: List[str], num_videos: int, *, initial_cursor: Optional[int]) -> tuple[List[TikTokVideo], Optional[int]]:
+async def _crawl_with_sessions(
+    keywords: List[str],
+    state: _CrawlState,
+    *,
+    initial_cursor: Optional[int],
+    limiter: asyncio.Semaphore,
+    pool: Optional[SessionPool],
+    sessions: Optional[List[PooledSession]] = None,
+) -> None:
+    """Run one task per keyword until ``state`` is filled or every keyword is exhausted."""
+    if sessions is None:
+        async with _open_sessions(max(1, min(CRAWL_CONCURRENCY, len(keywords))), pool) as opened:
+            await _crawl_with_sessions(
+                keywords, state, initial_cursor=initial_cursor, limiter=limiter, pool=pool, sessions=opened
+            )
+        return
+
+    tasks = [
+        asyncio.create_task(
+            _crawl_keyword(
+                sessions[index % len(sessions)],
+                index,
+                keyword,
+                state,
+                initial_cursor=initial_cursor,
+                limiter=limiter,
+            )
+        )
+        for index, keyword in enumerate(keywords)
+    ]
+    filled = asyncio.create_task(state.filled.wait())
+    pending: set[asyncio.Task] = set(tasks)
     try:
-        return asyncio.run(_fetch_tiktok_videos_async(keywords, num_videos, initial_cursor=initial_cursor))
+        while pending:
+            finished, pending = await asyncio.wait(pending | {filled}, return_when=asyncio.FIRST_COMPLETED)
+            pending.discard(filled)
+            if filled in finished:
+                logger.info("Collected %d unique videos; cancelling remaining pages.", state.collected)
+                break
+            if any(task.exception() is not None for task in finished):
+                break
+    finally:
+        for task in (*pending, filled):
+            task.cancel()
+        await asyncio.gather(*pending, filled, return_exceptions=True)
+
+    for task in tasks:
+        if task.cancelled():
+            continue
+        exc = task.exception()
+        if exc is not None:
+            raise exc
+
+
+def _get_session_pool() -> Optional[SessionPool]:
+    global _session_pool
+    if POOL_SIZE <= 0:
+        return None
+    with _session_pool_lock:
+        if _session_pool is None:
+            _session_pool = SessionPool(
+                _new_api,
+                size=POOL_SIZE,
+                min_warm=POOL_MIN_WARM,
+                idle_timeout=POOL_IDLE_TIMEOUT,
+                max_age=POOL_MAX_AGE,
+            )
+            atexit.register(_session_pool.close)
+        return _session_pool
+
+
+def _get_rate_limiter() -> Optional[RateLimiter]:
+    global _rate_limiter
+    if RATE_LIMIT <= 0:
+        return None
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter(
+                rate=RATE_LIMIT,
+                burst=RATE_LIMIT_BURST,
+                min_rate=RATE_LIMIT_MIN,
+                slow_after=SLOW_RESPONSE,
+                max_wait=RATE_LIMIT_MAX_WAIT,
+                client=(lambda: redis_client) if RATE_LIMIT_SHARED else None,
+            )
+        return _rate_limiter
+
+
+def session_pool_stats() -> Optional[dict[str, object]]:
+    return _session_pool.stats() if _session_pool is not None else None
+
+
+def cache_stats() -> dict[str, object]:
+    """Per-tier hit and miss counts for keyword cache entries in this process."""
+    return {
+        "local": {"enabled": LOCAL_CACHE_BYTES > 0 and redis_client is not None, **_CACHE.stats()},
+        "redis": {
+            result: int(metrics.CACHE_REQUESTS.value(tier="redis", family="videos", result=result))
+            for result in ("hit", "miss", "error")
+        } | redis_breaker.stats(),
+    }
+
+
+def _run_coroutine(factory: Callable[[Optional[SessionPool]], Awaitable[T]]) -> T:
+    """Run a crawl coroutine on the shared session pool, or on a throwaway loop without one."""
+    pool = _get_session_pool()
+    if pool is not None:
+        # The pool's loop runs on its own thread; carry this request's timings over.
+        return pool.run(metrics.with_timings(metrics.current_timings(), factory(pool)))
+    try:
+        return asyncio.run(factory(None))
     except RuntimeError as exc:
         if "event loop" not in str(exc).lower():
             raise
         loop = asyncio.get_event_loop()
-        return loop.run_until_complete(
-            _fetch_tiktok_videos_async(keywords, num_videos, initial_cursor=initial_cursor)
+        return loop.run_until_complete(factory(None))
+
+
+def _run_async(
+    keywords: List[str],
+    num_videos: int,
+    *,
+    initial_cursor: Optional[int],
+    errors: Optional[List[str]] = None,
+) -> tuple[List[TikTokVideo], Optional[int]]:
+    try:
+        return _run_coroutine(
+            lambda pool: _fetch_tiktok_videos_async(
+                keywords, num_videos, initial_cursor=initial_cursor, pool=pool, errors=errors
+            )
         )
-    except Exception:
+    except Exception as exc:  # noqa: BLE001
         # In case of any other exception during async execution, return empty list and None cursor
+        logger.error("TikTok crawl failed: %s", exc)
+        metrics.CRAWL_FAILURES.inc(reason="exception")
         return [], None
 
 
+async def _fetch_search_page_async(
+    keyword: str,
+    cursor: int,
+    count: int,
+    *,
+    pool: Optional[SessionPool] = None,
+) -> SearchPage:
+    async with _open_sessions(1, pool) as sessions:
+        response = await _request_page(sessions[0], keyword, cursor, count, limiter=asyncio.Semaphore(1))
+    next_cursor = response.get("cursor")
+    return SearchPage(
+        videos=_extract_videos(response.get("data") or []),
+        next_cursor=int(next_cursor) if next_cursor is not None else None,
+        has_more=bool(response.get("has_more")),
+    )
+
+
+def _run_page(keyword: str, cursor: int, count: int) -> SearchPage:
+    return _run_coroutine(lambda pool: _fetch_search_page_async(keyword, cursor, count, pool=pool))
+
+
+def _cache_key(keyword: str, cursor: Optional[int]) -> str:
+    # One entry per keyword (and starting cursor) so overlapping queries share cached work.
+    return "tiktok:" + keyword.lower() + (f"_cursor_{cursor}" if cursor is not None else "")
+
+
+def _video_row(video: TikTokVideo) -> tuple:
+    return (
+        video.video_id,
+        video.video_url,
+        video.author_id,
+        video.thumbnail_url,
+        video.title,
+        video.download_url,
+        video.play_url,
+    )
+
+
+def _entry_covers(entry: cache_codec.CacheEntry, min_videos: Optional[int]) -> bool:
+    # A short entry still answers a bigger query if its crawl already asked for that many.
+    # Entries written before `limit` existed are always accepted.
+    if min_videos is None or entry.limit is None:
+        return True
+    return len(entry.rows) >= min_videos or entry.limit >= min_videos
+
+
+def _entry_age(entry: cache_codec.CacheEntry) -> Optional[float]:
+    # Entries written before cached_at existed count as fresh until Redis expires them.
+    return max(0.0, time.time() - entry.cached_at) if entry.cached_at is not None else None
+
+
+def _generation_key(normalized_key: str) -> str:
+    # Bumped on every write so responses built from an older entry can tell; expires with the entry.
+    return f"{normalized_key}:gen"
+
+
+def _decode_cache_entry(cached_data: bytes, min_videos: Optional[int] = None) -> Optional[CrawlerResult]:
+    """Decode a cache entry in either the binary or the legacy JSON format."""
+    return _entry_result(cache_codec.decode(cached_data), min_videos)
+
+
+def _entry_result(entry: cache_codec.CacheEntry, min_videos: Optional[int] = None) -> Optional[CrawlerResult]:
+    if not _entry_covers(entry, min_videos):
+        return None
+    cache_age = _entry_age(entry)
+    return CrawlerResult(
+        videos=[TikTokVideo(*row) for row in entry.rows],
+        from_cache=True,
+        next_cursor=entry.next_cursor,
+        stale=cache_age is not None and cache_age > CACHE_TTL,
+        cache_age=cache_age,
+    )
+
+
+def _get_local_cache(*, subscribe: bool = True) -> Optional[LocalCache[cache_codec.CacheEntry]]:
+    """The in-process tier, or ``None`` while it cannot be kept coherent with Redis.
+
+    With ``subscribe=False`` a missing subscription is not (re)tried, so the
+    call never blocks on Redis.
+    """
+    if LOCAL_CACHE_BYTES <= 0 or not redis_client:
+        return None
+    if not subscribe:
+        return _CACHE if _cache_listener.listening(redis_client) else None
+    return _CACHE if _cache_listener.ensure(redis_client) else None
+
+
+def _store_local(local: LocalCache[cache_codec.CacheEntry], key: str, entry: cache_codec.CacheEntry, size: int) -> None:
+    # Never keep an entry past the point where Redis would have expired it.
+    cache_age = _entry_age(entry) or 0.0
+    local.set(key, entry, size, ttl=CACHE_HARD_TTL - cache_age)
+
+
+def _lookup_entries(
+    keys: List[str], *, use_local: bool = True
+) -> tuple[list[Optional[cache_codec.CacheEntry]], list[Optional[str]], bool]:
+    """Fetch decoded entries from this process's tier first and one MGET for the rest.
+
+    Returns the entries, where each one came from (``"local"``, ``"redis"``,
+    ``"error"`` or ``None`` for a miss) and whether the local tier was consulted.
+    """
+    entries: list[Optional[cache_codec.CacheEntry]] = [None] * len(keys)
+    tiers: list[Optional[str]] = [None] * len(keys)
+    local = _get_local_cache() if use_local else None
+    if local is not None:
+        for index, key in enumerate(keys):
+            entries[index] = local.get(key)
+            if entries[index] is not None:
+                tiers[index] = "local"
+    missing = [index for index, entry in enumerate(entries) if entry is None]
+    if not missing or not redis_client:
+        return entries, tiers, local is not None
+    try:
+        with metrics.timed("redis_get"):
+            raw_entries = redis_client.mget([keys[index] for index in missing])
+    except redis.exceptions.RedisError as e:
+        logger.error("Redis GET operation failed: %s", e)
+        for index in missing:
+            tiers[index] = "error"
+        return entries, tiers, local is not None
+    for index, cached_data in zip(missing, raw_entries):
+        if not cached_data:
+            continue
+        try:
+            entry = cache_codec.decode(cached_data)
+        except (ValueError, TypeError) as e:
+            logger.error("Failed to decode Redis cache entry '%s': %s", keys[index], e)
+            tiers[index] = "error"
+            continue
+        entries[index], tiers[index] = entry, "redis"
+        if local is not None:
+            _store_local(local, keys[index], entry, len(cached_data))
+    return entries, tiers, local is not None
+
+
+def _count_lookups(tiers: List[Optional[str]], used_local: bool) -> None:
+    if used_local:
+        local_hits = tiers.count("local")
+        metrics.cache_result("videos", "hit", local_hits, tier="local")
+        metrics.cache_result("videos", "miss", len(tiers) - local_hits, tier="local")
+    metrics.cache_result("videos", "hit", tiers.count("redis"))
+    metrics.cache_result("videos", "miss", tiers.count(None))
+    metrics.cache_result("videos", "error", tiers.count("error"))
+
+
+def _read_cache(normalized_key: str) -> Optional[CrawlerResult]:
+    # Straight from Redis: right after another worker wrote the key, its
+    # invalidation may not have reached this process yet.
+    return _read_cache_many([normalized_key], use_local=False)[0]
+
+
+def _read_cache_many(
+    keys: List[str], *, min_videos: Optional[int] = None, use_local: bool = True
+) -> list[Optional[CrawlerResult]]:
+    """Look up several cache entries, from the local tier or in a single MGET round-trip.
+
+    Entries crawled for fewer than ``min_videos`` videos come back as ``None``.
+    """
+    if not redis_client or not keys:
+        return [None] * len(keys)
+    entries, tiers, used_local = _lookup_entries(keys, use_local=use_local)
+    _count_lookups(tiers, used_local)
+    return [None if entry is None else _entry_result(entry, min_videos) for entry in entries]
+
+
+def _encode_cache_entry(videos: List[TikTokVideo], next_cursor: Optional[int], *, limit: int) -> bytes:
+    return cache_codec.encode(
+        [_video_row(v) for v in videos],
+        next_cursor=next_cursor,
+        limit=limit,
+        cached_at=time.time(),
+    )
+
+
+def _remember_local(items: List[tuple[str, bytes]]) -> None:
+    local = _get_local_cache()
+    if local is not None:
+        for normalized_key, cache_payload in items:
+            _store_local(local, normalized_key, cache_codec.decode(cache_payload), len(cache_payload))
+
+
+def _announce_writes(items: List[tuple[str, bytes]]) -> None:
+    """Keep freshly written entries in the local tier and tell other processes to drop theirs."""
+    if not redis_client or not items:
+        return
+    _remember_local(items)
+    _cache_listener.publish(redis_client, [normalized_key for normalized_key, _ in items])
+
+
+def _write_cache(
+    normalized_key: str,
+    videos: List[TikTokVideo],
+    next_cursor: Optional[int],
+    lease: Optional[RedisLease],
+    *,
+    limit: int,
+) -> None:
+    if not redis_client:
+        return
+    cache_payload = _encode_cache_entry(videos, next_cursor, limit=limit)
+    try:
+        with metrics.timed("redis_set"):
+            if lease is None:
+                redis_client.set(normalized_key, cache_payload, ex=CACHE_HARD_TTL)
+            elif not lease.fenced_set(cache_payload, ex=CACHE_HARD_TTL):
+                logger.warning("Discarding crawl result for '%s'; a newer crawl holds the lease", normalized_key)
+                return
+            redis_client.eval(INCR_SCRIPT, 1, _generation_key(normalized_key), CACHE_HARD_TTL)
+    except redis.exceptions.RedisError as e:
+        logger.error("Redis SET operation failed: %s", e)
+        return
+    _announce_writes([(normalized_key, cache_payload)])
+
+
+def _write_cache_many(items: List[tuple[str, bytes, Optional[RedisLease]]]) -> None:
+    """Write several cache entries, each fenced by its lease if it has one, in one pipelined round-trip."""
+    if not redis_client or not items:
+        return
+    try:
+        with metrics.timed("redis_set"):
+            pipe = redis_client.pipeline(transaction=False)
+            for normalized_key, cache_payload, lease in items:
+                if lease is None:
+                    pipe.set(normalized_key, cache_payload, ex=CACHE_HARD_TTL)
+                else:
+                    lease.queue_fenced_set(pipe, cache_payload, ex=CACHE_HARD_TTL)
+                # A rejected write bumps and announces too; that only costs other caches a re-read.
+                pipe.eval(INCR_SCRIPT, 1, _generation_key(normalized_key), CACHE_HARD_TTL)
+                pipe.publish(INVALIDATION_CHANNEL, _cache_listener.message(normalized_key))
+            written = pipe.execute()[::3]
+    except redis.exceptions.RedisError as e:
+        logger.error("Redis SET operation failed: %s", e)
+        return
+    for (normalized_key, _, _), ok in zip(items, written):
+        if not ok:
+            logger.warning("Discarding crawl result for '%s'; a newer crawl holds the lease", normalized_key)
+    _remember_local([(key, payload) for (key, payload, _), ok in zip(items, written) if ok])
+
+
+def _get_video_index() -> Optional[VideoIndex]:
+    global _video_index
+    if not VIDEO_INDEX_PATH:
+        return None
+    with _video_index_lock:
+        if _video_index is None:
+            try:
+                _video_index = VideoIndex(VIDEO_INDEX_PATH)
+            except sqlite3.Error as e:
+                logger.error("Could not open video index at %s: %s", VIDEO_INDEX_PATH, e)
+                return None
+            atexit.register(_video_index.close)
+        return _video_index
+
+
+def _get_near_dup_index() -> Optional[NearDuplicateIndex]:
+    global _near_dups
+    if NEAR_DUP_THRESHOLD <= 0:
+        return None
+    if _near_dups is None:
+        with _near_dups_lock:
+            if _near_dups is None:
+                try:
+                    _near_dups = NearDuplicateIndex(
+                        NEAR_DUP_INDEX_PATH,
+                        threshold=NEAR_DUP_THRESHOLD,
+                        sync_interval=NEAR_DUP_SYNC_INTERVAL,
+                        max_age=NEAR_DUP_MAX_AGE,
+                    )
+                except sqlite3.Error as e:
+                    logger.error("Could not open near-duplicate index at %s; keeping it in memory: %s", NEAR_DUP_INDEX_PATH, e)
+                    _near_dups = NearDuplicateIndex(threshold=NEAR_DUP_THRESHOLD, max_age=NEAR_DUP_MAX_AGE)
+                atexit.register(_near_dups.close)
+    return _near_dups
+
+
+def _save_near_dups() -> None:
+    """Persist signatures from recent crawls and pick up other workers' (both are no-ops without a path)."""
+    if _near_dups is None:
+        return
+    try:
+        _near_dups.flush()
+    except sqlite3.Error as e:
+        logger.error("Near-duplicate index update failed: %s", e)
+
+
+def _cluster_of(near_dups: Optional[NearDuplicateIndex], video_id: str) -> Optional[str]:
+    return near_dups.cluster_of(video_id) if near_dups is not None else None
+
+
+def _index_videos(keyword: str, videos: List[TikTokVideo]) -> None:
+    index = _get_video_index()
+    if index is None or not videos:
+        return
+    try:
+        index.upsert(keyword, [_video_row(v) for v in videos])
+    except sqlite3.Error as e:
+        logger.error("Video index upsert failed for '%s': %s", keyword, e)
+
+
+def _read_index(keyword: str, num_videos: int) -> Optional[CrawlerResult]:
+    """The last indexed crawl of ``keyword`` as a stale result, for when Redis has nothing."""
+    index = _get_video_index()
+    if index is None:
+        return None
+    try:
+        rows, crawled_at = index.keyword_rows(keyword, num_videos)
+    except sqlite3.Error as e:
+        logger.error("Video index query failed for '%s': %s", keyword, e)
+        return None
+    if not rows or crawled_at is None:
+        return None
+    cache_age = max(0.0, time.time() - crawled_at)
+    if cache_age > VIDEO_INDEX_MAX_AGE:
+        return None
+    return CrawlerResult(
+        videos=[TikTokVideo(*row) for row in rows],
+        from_cache=True,
+        stale=True,
+        cache_age=cache_age,
+    )
+
+
+def query_video_index(
+    *,
+    keyword: Optional[str] = None,
+    author: Optional[str] = None,
+    since: Optional[float] = None,
+    limit: int = 100,
+) -> Optional[List[TikTokVideo]]:
+    """Look videos up in the index by author, first-seen time and/or keyword; ``None`` if it is disabled."""
+    if keyword is None and author is None and since is None:
+        raise ValueError("one of keyword, author or since is required")
+    index = _get_video_index()
+    if index is None:
+        return None
+    try:
+        rows = index.query(keyword=keyword, author=author, since=since, limit=limit)
+    except sqlite3.Error as e:
+        logger.error("Video index query failed: %s", e)
+        return []
+    return [TikTokVideo(*row) for row in rows]
+
+
+def _acquire_crawl_lease(normalized_key: str) -> tuple[Optional[RedisLease], Optional[CrawlerResult]]:
+    """Take the cross-worker lease for a key, or wait for the worker that holds it.
+
+    Returns the lease to crawl under, or the result another worker produced.
+    """
+    if not redis_client:
+        return None, None
+    lease = RedisLease(redis_client, normalized_key, ttl=CRAWL_LEASE_TTL, fence_ttl=CACHE_HARD_TTL)
+    try:
+        if lease.acquire():
+            return lease, None
+        logger.info("Another worker is crawling '%s'; waiting for its result", normalized_key)
+        if lease.wait_for_holder(timeout=COALESCE_WAIT, interval=COALESCE_POLL_INTERVAL):
+            cached = _read_cache(normalized_key)
+            if cached is not None:
+                return None, cached
+        # The holder gave up or is taking too long; crawl ourselves.
+        return (lease if lease.acquire() else None), None
+    except redis.exceptions.RedisError as e:
+        logger.error("Redis lease operation failed: %s", e)
+        return None, None
+
+
+def _crawl(keywords: List[str], num_videos: int, normalized_key: str, cursor: Optional[int]) -> CrawlerResult:
+    lease, peer_result = _acquire_crawl_lease(normalized_key)
+    if peer_result is not None:
+        return peer_result
+    try:
+        errors: list[str] = []
+        videos, next_cursor = _run_async(keywords, num_videos, initial_cursor=cursor, errors=errors)
+        return _store_crawl(keywords, num_videos, normalized_key, lease, videos, next_cursor, errors)
+    finally:
+        if lease is not None:
+            lease.release()
+
+
+def _store_crawl(
+    keywords: List[str],
+    num_videos: int,
+    normalized_key: str,
+    lease: Optional[RedisLease],
+    videos: List[TikTokVideo],
+    next_cursor: Optional[int],
+    errors: List[str],
+) -> CrawlerResult:
+    """Cache and index what a crawl found, and turn it into a result."""
+    if videos:
+        # A partial crawl only answers queries it filled; bigger ones crawl again.
+        partial = bool(errors)
+        _write_cache(normalized_key, videos, next_cursor, lease, limit=len(videos) if partial else num_videos)
+        if len(keywords) == 1:
+            _index_videos(keywords[0], videos)
+        _save_near_dups()
+        thumbnails.prefetch(v.thumbnail_url for v in videos)
+        return CrawlerResult(videos=videos, from_cache=False, next_cursor=next_cursor, partial=partial)
+
+    error_message = f"no video results for keywords: {', '.join(keywords)}"
+    return CrawlerResult(videos=[], from_cache=False, next_cursor=next_cursor, error=error_message)
+
+
+def _refresh(keywords: List[str], num_videos: int, normalized_key: str, cursor: Optional[int]) -> None:
+    try:
+        result, _ = _inflight.do(
+            normalized_key, lambda: _crawl(keywords, num_videos, normalized_key, cursor), size=num_videos
+        )
+        if result.error:
+            logger.warning("Background refresh for '%s' failed: %s", normalized_key, result.error)
+    except Exception as e:  # noqa: BLE001
+        logger.error("Background refresh for '%s' raised: %s", normalized_key, e, exc_info=True)
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(normalized_key)
+
+
+def _schedule_refresh(keywords: List[str], num_videos: int, normalized_key: str, cursor: Optional[int]) -> bool:
+    if crawl_queue.ENABLED:
+        job = crawl_jobs.submit(
+            keywords, num_videos, cursor=cursor, force_refresh=True, priority=crawl_queue.PRIORITY_REFRESH
+        )
+        if job is not None:
+            # Joining a job that is already queued or running schedules nothing new.
+            return not job.joined
+    with _refreshing_lock:
+        if normalized_key in _refreshing or _inflight.in_flight(normalized_key):
+            return False
+        _refreshing.add(normalized_key)
+    logger.info("Scheduling background refresh for stale key '%s'", normalized_key)
+    _refresh_executor.submit(_refresh, keywords, num_videos, normalized_key, cursor)
+    return True
+
+
+def _crawl_keyword_shared(keyword: str, num_videos: int, normalized_key: str, cursor: Optional[int]) -> CrawlerResult:
+    # Concurrent misses for the same key in this process share one crawl, unless it is too small for us.
+    result, shared = _inflight.do(
+        normalized_key, lambda: _crawl([keyword], num_videos, normalized_key, cursor), size=num_videos
+    )
+    if shared:
+        result = replace(result, videos=result.videos[:num_videos])
+    return result
+
+
+def _keywords_to_crawl(entries: list[Optional[CrawlerResult]], num_videos: int) -> list[int]:
+    """Indexes of uncached keywords that can still contribute to the merged result."""
+    missing: list[int] = []
+    seen_ids: set[str] = set()
+    for index, entry in enumerate(entries):
+        # Results are merged in keyword order, so once the cached prefix alone fills
+        # num_videos nothing later in the list can make it into the response.
+        if len(seen_ids) >= num_videos:
+            break
+        if entry is None:
+            missing.append(index)
+            continue
+        seen_ids.update(video.video_id for video in entry.videos)
+    return missing
+
+
+def _merge_entries(entries: list[Optional[CrawlerResult]], num_videos: int) -> list[TikTokVideo]:
+    merged: list[TikTokVideo] = []
+    seen_ids: set[str] = set()
+    near_dups = _get_near_dup_index()
+    for entry in entries:
+        if entry is None:
+            continue
+        for video in entry.videos:
+            if not _first_sighting(seen_ids, video.video_id, _cluster_of(near_dups, video.video_id)):
+                continue
+            merged.append(video)
+            if len(merged) >= num_videos:
+                return merged
+    return merged
+
+
+def _keyword_rows(videos: Iterable[TikTokVideo], num_videos: int) -> list[TikTokVideo]:
+    """What a crawl of one keyword would keep of ``videos``: the first ``num_videos`` unique ones."""
+    rows: list[TikTokVideo] = []
+    seen_ids: set[str] = set()
+    near_dups = _get_near_dup_index()
+    for video in videos:
+        if len(rows) >= num_videos:
+            break
+        if _first_sighting(seen_ids, video.video_id, _cluster_of(near_dups, video.video_id)):
+            rows.append(video)
+    return rows
+
+
+def _plan_crawl(
+    keywords: List[str],
+    keys: List[str],
+    entries: list[Optional[CrawlerResult]],
+    num_videos: int,
+    *,
+    force_refresh: bool,
+    cursor: Optional[int],
+    use_index: bool = True,
+) -> list[int]:
+    """Refresh stale entries in the background and fill gaps from the video index.
+
+    Returns the indexes of the keywords that still have to be crawled.
+    """
+    # Stale entries are still served; they are refreshed off the request path.
+    for index, entry in enumerate(entries):
+        if entry is not None and entry.stale:
+            _schedule_refresh([keywords[index]], num_videos, keys[index], cursor)
+
+    missing = _keywords_to_crawl(entries, num_videos)
+    if missing and use_index and not force_refresh and cursor is None and VIDEO_INDEX_PATH:
+        # Redis is cold for these keywords: answer from the video index and crawl in the background.
+        for index in missing:
+            entries[index] = _read_index(keywords[index], num_videos)
+            if entries[index] is not None:
+                _schedule_refresh([keywords[index]], num_videos, keys[index], cursor)
+        missing = _keywords_to_crawl(entries, num_videos)
+    return missing
+
+
+def _compose_result(
+    keywords: List[str],
+    entries: list[Optional[CrawlerResult]],
+    num_videos: int,
+    errors: List[str],
+) -> CrawlerResult:
+    used = [entry for entry in entries if entry is not None]
+    videos = _merge_entries(entries, num_videos)
+    next_cursor = next((e.next_cursor for e in reversed(used) if e.next_cursor is not None), None)
+    ages = [e.cache_age for e in used if e.from_cache and e.cache_age is not None]
+    result = CrawlerResult(
+        videos=videos,
+        from_cache=bool(used) and all(e.from_cache for e in used),
+        next_cursor=next_cursor,
+        stale=any(e.stale for e in used),
+        cache_age=max(ages) if ages else None,
+        partial=any(e.partial for e in used),
+    )
+    if not videos:
+        result.error = "; ".join(errors) or f"no video results for keywords: {', '.join(keywords)}"
+    return result
+
+
+@metrics.timed("get_tiktok_videos")
 def get_tiktok_videos(
     keywords: Optional[List[str]] = None,
     num_videos: int = 200,
@@ -253,45 +1234,564 @@ def get_tiktok_videos(
     if not keywords:
         raise ValueError("Keywords list must not be empty")
 
-    # Cache key will now be based on sorted keywords and cursor
-    normalized_key = "tiktok:" + "_".join(sorted([k.lower() for k in keywords])) + (f"_cursor_{cursor}" if cursor is not None else "")
-    
-    if not force_refresh and redis_client:
+    keys = [_cache_key(keyword, cursor) for keyword in keywords]
+    entries = [None] * len(keys) if force_refresh else _read_cache_many(keys, min_videos=num_videos)
+    missing = _plan_crawl(keywords, keys, entries, num_videos, force_refresh=force_refresh, cursor=cursor)
+
+    if not missing:
+        logger.info("Serving TikTok results for '%s' from cache", ", ".join(keywords))
+    else:
+        logger.info("Bypassing cache for TikTok results for '%s'", ", ".join(keywords[i] for i in missing))
+
+    def crawl(index: int) -> CrawlerResult:
+        return _crawl_keyword_shared(keywords[index], num_videos, keys[index], cursor)
+
+    # The first missing keyword is crawled on this thread, the rest alongside it.
+    futures = {index: _keyword_executor.submit(contextvars.copy_context().run, crawl, index) for index in missing[1:]}
+    errors: list[str] = []
+    for index in missing:
         try:
-            cached_data = redis_client.get(normalized_key)
-            if cached_data:
-                logger.info("Serving TikTok results for '%s' from Redis cache", ", ".join(keywords))
-                cached_entry = json.loads(cached_data)
-                videos = [TikTokVideo(**v) for v in cached_entry["videos"]]
-                return CrawlerResult(videos=videos, from_cache=True, next_cursor=cached_entry.get("next_cursor"))
-        except redis.exceptions.RedisError as e:
-            logger.error("Redis GET operation failed: %s", e)
-        except json.JSONDecodeError as e:
-            logger.error("Failed to decode JSON from Redis cache: %s", e)
-
-
-    logger.info("Bypassing cache for TikTok results for '%s'", ", ".join(keywords))
+            result = futures[index].result() if index in futures else crawl(index)
+        except Exception as e:
+            logger.error("An error occurred during TikTok crawling: %s", e, exc_info=True)
+            errors.append(str(e))
+            continue
+        if result.error:
+            errors.append(result.error)
+        entries[index] = result
+
+    return _compose_result(keywords, entries, num_videos, errors)
+
+
+@dataclass(slots=True)
+class CachedRows:
+    """A cached query as plain rows in :data:`cache_codec.FIELDS` order."""
+
+    rows: List[tuple]
+    stale: bool = False
+    cache_age: Optional[float] = None
+    partial: bool = False  # some keywords were missing or cached short
+
+
+def get_cached_rows(
+    keywords: Optional[List[str]] = None, num_videos: int = 200, *, allow_partial: bool = False
+) -> Optional[CachedRows]:
+    """Answer a query straight from the cache tiers without building :class:`TikTokVideo` objects.
+
+    Returns ``None`` whenever any keyword would need a crawl; callers then fall
+    back to :func:`get_tiktok_videos`. With ``allow_partial`` whatever is cached
+    is served instead, flagged ``partial``, and ``None`` only means nothing is.
+    Stale entries are served and refreshed exactly as there.
+    """
+    keywords = _normalise_keywords(keywords or DEFAULT_KEYWORD)
+    if not keywords or not redis_client:
+        return None
+    keys = [_cache_key(keyword, None) for keyword in keywords]
+    entries, tiers, used_local = _lookup_entries(keys)
+    if "error" in tiers:
+        metrics.cache_result("videos", "error", tiers.count("error"))
+        return None
+
+    rows: list[tuple] = []
+    seen_ids: set[str] = set()
+    near_dups = _get_near_dup_index()
+    ages: list[float] = []
+    stale: list[int] = []
+    partial = False
+    consumed = 0
+    for index, entry in enumerate(entries):
+        if len(rows) >= num_videos:
+            break
+        consumed += 1
+        if entry is None or not _entry_covers(entry, num_videos):
+            if not allow_partial:
+                return None
+            partial = True
+            if entry is None:
+                continue
+        cache_age = _entry_age(entry)
+        if cache_age is not None:
+            ages.append(cache_age)
+            if cache_age > CACHE_TTL:
+                stale.append(index)
+        for row in entry.rows:
+            if not _first_sighting(seen_ids, row[0], _cluster_of(near_dups, row[0])):
+                continue
+            rows.append(row)
+            if len(rows) >= num_videos:
+                break
+
+    # Misses are left for get_tiktok_videos to count when it reads the same keys.
+    _count_lookups(tiers[:consumed], used_local)
+    for index in stale:
+        _schedule_refresh([keywords[index]], num_videos, keys[index], None)
+    if not rows and allow_partial:
+        return None
+    return CachedRows(rows=rows, stale=bool(stale), cache_age=max(ages) if ages else None, partial=partial)
+
+
+@dataclass(slots=True)
+class BatchQuery:
+    """One keyword set of a :func:`get_tiktok_videos_batch` call."""
+
+    keywords: Optional[List[str]] = None
+    num_videos: int = 200
+    cursor: Optional[int] = None
+    force_refresh: bool = False
+
+
+@dataclass(slots=True)
+class _BatchCrawl:
+    """A keyword missing from the cache, crawled once for every query that needs it."""
+
+    keyword: str
+    key: str
+    cursor: Optional[int]
+    num_videos: int
+    lease: Optional[RedisLease] = None
+    result: Optional[CrawlerResult] = None
+
+
+async def _fetch_batch_async(
+    crawls: List[_BatchCrawl], *, pool: Optional[SessionPool]
+) -> list[Union[tuple[List[TikTokVideo], Optional[int], List[str]], BaseException]]:
+    """Crawl every keyword concurrently over one set of sessions and one in-flight limit."""
+    limiter = asyncio.Semaphore(CRAWL_CONCURRENCY)
+    async with _open_sessions(max(1, min(CRAWL_CONCURRENCY, len(crawls))), pool) as sessions:
+
+        async def crawl(position: int, job: _BatchCrawl) -> tuple[List[TikTokVideo], Optional[int], List[str]]:
+            errors: list[str] = []
+            first = position % len(sessions)
+            videos, next_cursor = await _fetch_tiktok_videos_async(
+                [job.keyword],
+                job.num_videos,
+                initial_cursor=job.cursor,
+                errors=errors,
+                sessions=sessions[first:] + sessions[:first],
+                limiter=limiter,
+            )
+            return videos, next_cursor, errors
+
+        return await asyncio.gather(*(crawl(i, job) for i, job in enumerate(crawls)), return_exceptions=True)
+
+
+def _try_crawl_lease(normalized_key: str) -> tuple[bool, Optional[RedisLease]]:
+    """Whether this worker should crawl ``normalized_key`` now, and the lease to crawl under."""
+    if not redis_client:
+        return True, None
+    lease = RedisLease(redis_client, normalized_key, ttl=CRAWL_LEASE_TTL, fence_ttl=CACHE_HARD_TTL)
     try:
-        videos, next_cursor = _run_async(keywords, num_videos, initial_cursor=cursor)
-        if videos:
-            if redis_client:
-                try:
-                    videos_as_dicts = [asdict(v) for v in videos]
-                    cache_payload = {
-                        "videos": videos_as_dicts,
-                        "next_cursor": next_cursor,
-                    }
-                    redis_client.set(normalized_key, json.dumps(cache_payload), ex=CACHE_TTL)
-                except redis.exceptions.RedisError as e:
-                    logger.error("Redis SET operation failed: %s", e)
+        return (True, lease) if lease.acquire() else (False, None)
+    except redis.exceptions.RedisError as e:
+        logger.error("Redis lease operation failed: %s", e)
+        return True, None
+
 
-            return CrawlerResult(videos=videos, from_cache=False, next_cursor=next_cursor)
+def _run_batch_crawls(crawls: List[_BatchCrawl]) -> None:
+    """Fill in ``result`` for every crawl; keys another caller is already crawling wait for it instead."""
+    own: list[_BatchCrawl] = []
+    joined: dict[concurrent.futures.Future, _BatchCrawl] = {}
+    for job in crawls:
+        crawl_here = False
+        if not _inflight.in_flight(job.key):
+            crawl_here, job.lease = _try_crawl_lease(job.key)
+        if crawl_here:
+            own.append(job)
+        else:
+            future = _keyword_executor.submit(
+                contextvars.copy_context().run,
+                _crawl_keyword_shared, job.keyword, job.num_videos, job.key, job.cursor,
+            )
+            joined[future] = job
+
+    try:
+        if own:
+            try:
+                outcomes = _run_coroutine(lambda pool: _fetch_batch_async(own, pool=pool))
+            except Exception as exc:  # noqa: BLE001
+                logger.error("TikTok batch crawl failed: %s", exc)
+                outcomes = [exc] * len(own)
+            for job, outcome in zip(own, outcomes):
+                if isinstance(outcome, BaseException):
+                    metrics.CRAWL_FAILURES.inc(reason="exception")
+                    job.result = CrawlerResult(videos=[], from_cache=False, error=str(outcome))
+                    continue
+                videos, next_cursor, errors = outcome
+                job.result = _store_crawl([job.keyword], job.num_videos, job.key, job.lease, videos, next_cursor, errors)
+    finally:
+        for job in own:
+            if job.lease is not None:
+                job.lease.release()
+
+    for future, job in joined.items():
+        try:
+            job.result = future.result()
+        except Exception as e:  # noqa: BLE001
+            logger.error("An error occurred during TikTok crawling: %s", e, exc_info=True)
+            job.result = CrawlerResult(videos=[], from_cache=False, error=str(e))
 
-        error_message = f"no video results for keywords: {', '.join(keywords)}"
-        return CrawlerResult(videos=[], from_cache=False, next_cursor=next_cursor, error=error_message)
-    except Exception as e:
-        logger.error("An error occurred during TikTok crawling: %s", e, exc_info=True)
-        return CrawlerResult(videos=[], from_cache=False, error=str(e))
+
+@metrics.timed("get_tiktok_videos_batch")
+def get_tiktok_videos_batch(queries: List[BatchQuery], *, use_index: bool = True) -> List[CrawlerResult]:
+    """Answer several queries together, in order.
+
+    The cache entries of every query are fetched in one lookup, and all misses
+    are crawled concurrently over one set of TikTok sessions; a keyword shared
+    by several queries is crawled once. Each query gets its own result, with
+    ``error`` set when it failed, without affecting the others. With
+    ``use_index=False`` cache misses are always crawled, never answered from
+    the video index.
+    """
+    results: list[Optional[CrawlerResult]] = [None] * len(queries)
+    plans: list[tuple[int, List[str], List[str]]] = []
+    for position, query in enumerate(queries):
+        keywords = _normalise_keywords(query.keywords or DEFAULT_KEYWORD)
+        if not keywords:
+            results[position] = CrawlerResult(videos=[], from_cache=False, error="Keywords list must not be empty")
+            continue
+        plans.append((position, keywords, [_cache_key(keyword, query.cursor) for keyword in keywords]))
+
+    lookup = list(dict.fromkeys(key for position, _, keys in plans if not queries[position].force_refresh for key in keys))
+    cached: dict[str, cache_codec.CacheEntry] = {}
+    if lookup and redis_client:
+        entries, tiers, used_local = _lookup_entries(lookup)
+        _count_lookups(tiers, used_local)
+        cached = {key: entry for key, entry in zip(lookup, entries) if entry is not None}
+
+    crawls: dict[str, _BatchCrawl] = {}
+    planned: list[tuple[int, List[str], List[str], list[Optional[CrawlerResult]], list[int]]] = []
+    for position, keywords, keys in plans:
+        query = queries[position]
+        entries = [
+            None if query.force_refresh or key not in cached else _entry_result(cached[key], query.num_videos)
+            for key in keys
+        ]
+        missing = _plan_crawl(
+            keywords,
+            keys,
+            entries,
+            query.num_videos,
+            force_refresh=query.force_refresh,
+            cursor=query.cursor,
+            use_index=use_index,
+        )
+        for index in missing:
+            job = crawls.get(keys[index])
+            if job is None:
+                crawls[keys[index]] = _BatchCrawl(keywords[index], keys[index], query.cursor, query.num_videos)
+            else:
+                job.num_videos = max(job.num_videos, query.num_videos)
+        planned.append((position, keywords, keys, entries, missing))
+
+    if crawls:
+        logger.info("Crawling %d keywords for a batch of %d queries", len(crawls), len(queries))
+        _run_batch_crawls(list(crawls.values()))
+
+    for position, keywords, keys, entries, missing in planned:
+        errors: list[str] = []
+        for index in missing:
+            result = crawls[keys[index]].result
+            if result.error:
+                errors.append(result.error)
+            entries[index] = result
+        results[position] = _compose_result(keywords, entries, queries[position].num_videos, errors)
+    return results
+
+
+def _crawl_jobs(jobs: List[crawl_queue.Job]) -> List[CrawlerResult]:
+    """Worker side of the crawl queue: answer popped jobs like one batch request, writing the cache."""
+    # The web worker reads the job's rows back from Redis, so a miss answered
+    # from the video index would leave it nothing to read: always crawl.
+    return get_tiktok_videos_batch([
+        BatchQuery(keywords=job.keywords, num_videos=job.limit, cursor=job.cursor, force_refresh=job.force_refresh)
+        for job in jobs
+    ], use_index=False)
+
+
+def _page_key(keyword: str, offset: int) -> str:
+    return f"tiktok:page:{keyword.lower()}:{offset}"
+
+
+def encode_page_cursor(keyword_index: int, offset: int, skip: int = 0) -> str:
+    raw = json.dumps([keyword_index, offset, skip], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_page_cursor(token: str) -> tuple[int, int, int]:
+    """Inverse of :func:`encode_page_cursor`; raises ValueError on malformed tokens."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        keyword_index, offset, skip = json.loads(raw)
+    except (ValueError, TypeError, binascii.Error) as exc:
+        raise ValueError(f"invalid page cursor: {token!r}") from exc
+    if not all(isinstance(part, int) and part >= 0 for part in (keyword_index, offset, skip)):
+        raise ValueError(f"invalid page cursor: {token!r}")
+    return keyword_index, offset, skip
+
+
+def _read_page(key: str) -> Optional[SearchPage]:
+    if not redis_client:
+        return None
+    try:
+        with metrics.timed("redis_get"):
+            cached_data = redis_client.get(key)
+        if not cached_data:
+            metrics.cache_result("page", "miss")
+            return None
+        entry = cache_codec.decode(cached_data)
+        metrics.cache_result("page", "hit")
+        return SearchPage(
+            videos=[TikTokVideo(*row) for row in entry.rows],
+            next_cursor=entry.next_cursor,
+            has_more=bool(entry.has_more),
+            from_cache=True,
+            cache_age=_entry_age(entry),
+        )
+    except redis.exceptions.RedisError as e:
+        logger.error("Redis GET operation failed: %s", e)
+        metrics.cache_result("page", "error")
+    except (ValueError, TypeError) as e:
+        logger.error("Failed to decode cached page '%s': %s", key, e)
+        metrics.cache_result("page", "error")
+    return None
+
+
+def _write_page(key: str, page: SearchPage) -> None:
+    if not redis_client:
+        return
+    try:
+        with metrics.timed("redis_set"):
+            redis_client.set(key, cache_codec.encode(
+                [_video_row(v) for v in page.videos],
+                next_cursor=page.next_cursor,
+                has_more=page.has_more,
+                cached_at=time.time(),
+            ), ex=CACHE_TTL)
+    except redis.exceptions.RedisError as e:
+        logger.error("Redis SET operation failed: %s", e)
+
+
+def _get_search_page(keyword: str, offset: int, count: int, *, force_refresh: bool) -> SearchPage:
+    key = _page_key(keyword, offset)
+    if not force_refresh:
+        page = _read_page(key)
+        if page is not None:
+            return page
+
+    def fetch() -> SearchPage:
+        page = _run_page(keyword, offset, count)
+        if page.videos:
+            _write_page(key, page)
+        return page
+
+    page, _ = _inflight.do(key, fetch)
+    return page
+
+
+def get_tiktok_page(
+    keywords: Optional[List[str]] = None,
+    limit: int = 30,
+    *,
+    cursor: Optional[str] = None,
+    force_refresh: bool = False,
+) -> CrawlerResult:
+    """Return one page of up to ``limit`` videos plus the cursor for the next one.
+
+    Keywords are paged through in order, one upstream search page at a time, and
+    every upstream page is cached under its keyword and offset so deeper pages
+    are only crawled when a client actually scrolls to them. Deduplication is
+    per page; the cursor carries no seen-id state.
+    """
+    keywords = _normalise_keywords(keywords or DEFAULT_KEYWORD)
+    if not keywords:
+        raise ValueError("Keywords list must not be empty")
+    keyword_index, offset, skip = decode_page_cursor(cursor) if cursor else (0, 0, 0)
+
+    videos: list[TikTokVideo] = []
+    seen_ids: set[str] = set()
+    from_cache = True
+    ages: list[float] = []
+    error: Optional[str] = None
+    fetched = 0
+
+    while len(videos) < limit and keyword_index < len(keywords) and fetched < MAX_PAGES:
+        keyword = keywords[keyword_index]
+        try:
+            page = _get_search_page(keyword, offset, limit, force_refresh=force_refresh)
+        except Exception as e:  # noqa: BLE001
+            logger.error("Fetching page %d for keyword '%s' failed: %s", offset, keyword, e)
+            error = str(e)
+            break
+        fetched += 1
+        from_cache = from_cache and page.from_cache
+        if page.cache_age is not None:
+            ages.append(page.cache_age)
+
+        consumed = skip
+        for video in page.videos[skip:]:
+            if len(videos) >= limit:
+                break
+            consumed += 1
+            if video.video_id in seen_ids:
+                continue
+            seen_ids.add(video.video_id)
+            videos.append(video)
+
+        if consumed < len(page.videos):
+            skip = consumed  # resume inside this page next time
+            break
+        if page.has_more and page.next_cursor is not None and page.next_cursor != offset:
+            offset, skip = page.next_cursor, 0
+        else:
+            keyword_index, offset, skip = keyword_index + 1, 0, 0
+
+    next_page = encode_page_cursor(keyword_index, offset, skip) if keyword_index < len(keywords) else None
+    if not videos and error is None and next_page is None:
+        error = f"no video results for keywords: {', '.join(keywords)}"
+    return CrawlerResult(
+        videos=videos,
+        from_cache=from_cache,
+        error=error if not videos else None,
+        next_page=next_page,
+        cache_age=max(ages) if ages else None,
+    )
+
+
+def _submit_coroutine(factory: Callable[[Optional[SessionPool]], Awaitable[T]]) -> concurrent.futures.Future:
+    """Like :func:`_run_coroutine` but returns a future instead of blocking."""
+    pool = _get_session_pool()
+    if pool is not None:
+        return asyncio.run_coroutine_threadsafe(factory(pool), pool.loop)
+    return _keyword_executor.submit(lambda: asyncio.run(factory(None)))
+
+
+def stream_tiktok_videos(
+    keywords: Optional[List[str]] = None,
+    num_videos: int = 200,
+    *,
+    force_refresh: bool = False,
+) -> Iterator[Union[List[TikTokVideo], CrawlerResult]]:
+    """Yield batches of newly deduplicated videos as they arrive, then a summary.
+
+    Cached keywords are emitted as a single first batch; uncached ones are crawled
+    together and every search page is forwarded as soon as it is parsed. The final
+    item is a :class:`CrawlerResult` holding all emitted videos. Per-keyword cache
+    entries are written once the crawl completes, under the same leases and fencing
+    as :func:`get_tiktok_videos`; keywords another worker is already crawling are
+    streamed but left for that worker to cache.
+    """
+    keywords = _normalise_keywords(keywords or DEFAULT_KEYWORD)
+    if not keywords:
+        raise ValueError("Keywords list must not be empty")
+
+    keys = [_cache_key(keyword, None) for keyword in keywords]
+    entries = [None] * len(keys) if force_refresh else _read_cache_many(keys, min_videos=num_videos)
+    for index, entry in enumerate(entries):
+        if entry is not None and entry.stale:
+            _schedule_refresh([keywords[index]], num_videos, keys[index], None)
+
+    missing = _keywords_to_crawl(entries, num_videos)
+    emitted: list[TikTokVideo] = []
+    seen_ids: set[str] = set()
+    near_dups = _get_near_dup_index()
+
+    def take(videos: Iterable[TikTokVideo]) -> list[TikTokVideo]:
+        batch = []
+        for video in videos:
+            if len(emitted) >= num_videos:
+                break
+            if not _first_sighting(seen_ids, video.video_id, _cluster_of(near_dups, video.video_id)):
+                continue
+            emitted.append(video)
+            batch.append(video)
+        return batch
+
+    cached_batch = take(_merge_entries(entries, num_videos))
+    if cached_batch:
+        yield cached_batch
+
+    used = [entry for entry in entries if entry is not None]
+    ages = [e.cache_age for e in used if e.cache_age is not None]
+    error: Optional[str] = None
+    cursors: dict[int, int] = {}
+    crawled: Optional[list[str]] = None
+    crawl_errors: list[str] = []
+
+    if missing and len(emitted) < num_videos:
+        crawled = crawl_keywords = [keywords[i] for i in missing]
+        pages: queue.Queue = queue.Queue()
+        raw: list[list[TikTokVideo]] = [[] for _ in missing]
+        done = object()
+
+        def on_page(index: int, videos: list[TikTokVideo], cursor: Optional[int]) -> None:
+            pages.put((index, videos, cursor))
+
+        leases = {index: _try_crawl_lease(keys[index]) for index in missing}
+        stop = threading.Event()
+        try:
+            future = _submit_coroutine(
+                lambda pool: _fetch_tiktok_videos_async(
+                    crawl_keywords, num_videos, pool=pool, on_page=on_page, errors=crawl_errors, stop=stop
+                )
+            )
+            future.add_done_callback(lambda _: pages.put(done))
+            try:
+                while True:
+                    item = pages.get()
+                    if item is done:
+                        break
+                    index, videos, cursor = item
+                    raw[index].extend(videos)
+                    if cursor is not None:
+                        cursors[missing[index]] = int(cursor)
+                    batch = take(videos)
+                    if batch:
+                        yield batch
+                    if len(emitted) >= num_videos:
+                        break
+            finally:
+                # Also reached when the client disconnects mid-stream. Cancelling only
+                # reaches a crawl on the pool's loop; without a pool it sees ``stop``.
+                stop.set()
+                future.cancel()
+
+            if future.done() and not future.cancelled() and future.exception() is not None:
+                error = str(future.exception())
+                logger.error("Streaming crawl failed: %s", error)
+            # Pages were deduplicated across all keywords; each entry gets the rows a crawl of
+            # its keyword alone keeps, and only claims as many videos as were actually crawled.
+            rows = [_keyword_rows(videos, num_videos) for videos in raw]
+            _write_cache_many([
+                (
+                    keys[index],
+                    _encode_cache_entry(rows[position], cursors.get(index), limit=len(rows[position])),
+                    leases[index][1],
+                )
+                for position, index in enumerate(missing)
+                if rows[position] and leases[index][0]
+            ])
+        finally:
+            for _, lease in leases.values():
+                if lease is not None:
+                    lease.release()
+        for position, index in enumerate(missing):
+            _index_videos(keywords[index], rows[position])
+        _save_near_dups()
+        thumbnails.prefetch(v.thumbnail_url for videos in rows for v in videos)
+
+    final_cursors = [cursors[i] if i in cursors else (e.next_cursor if e else None) for i, e in enumerate(entries)]
+    next_cursor = next((c for c in reversed(final_cursors) if c is not None), None)
+    if not emitted and error is None:
+        error = f"no video results for keywords: {', '.join(keywords)}"
+    yield CrawlerResult(
+        videos=emitted,
+        from_cache=crawled is None,
+        error=error if not emitted else None,
+        next_cursor=next_cursor,
+        stale=any(e.stale for e in used),
+        cache_age=max(ages) if ages else None,
+        partial=bool(emitted) and bool(crawl_errors),
+    )
 
 
 def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
@@ -299,11 +1799,67 @@ def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
     parser.add_argument("keywords", nargs="*", default=DEFAULT_KEYWORD, help="Search keywords (comma-separated)")
     parser.add_argument("--count", type=int, default=200, help="Max videos to fetch")
     parser.add_argument("--refresh", action="store_true", help="Bypass in-memory cache")
+    parser.add_argument("--output", help="Snapshot path (default: frontend/public/tiktok_live.json)")
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="Merge into the existing snapshot instead of replacing it, and write compact JSON",
+    )
+    parser.add_argument(
+        "--retention-days",
+        type=float,
+        default=snapshot.RETENTION_DAYS,
+        help="With --snapshot, drop videos not seen for this many days",
+    )
+    parser.add_argument(
+        "--shard-size",
+        type=int,
+        default=0,
+        help="With --snapshot, also write N-video shards plus index.json next to the output",
+    )
+    parser.add_argument(
+        "--warm",
+        action="store_true",
+        help="Re-crawl popular queries before their cache entries expire instead of writing a snapshot",
+    )
+    parser.add_argument(
+        "--warm-interval",
+        type=float,
+        help="With --warm, repeat every N seconds after an immediate first pass (default: TIKTOK_WARM_INTERVAL)",
+    )
+    parser.add_argument("--warm-top", type=int, help="With --warm, popular queries to consider (default: TIKTOK_WARM_TOP)")
+    parser.add_argument("--warm-budget", type=int, help="With --warm, keyword crawls per pass (default: TIKTOK_WARM_BUDGET)")
+    parser.add_argument(
+        "--worker",
+        action="store_true",
+        help="Consume the crawl job queue (TIKTOK_CRAWL_QUEUE=1) until interrupted; run more processes to scale out",
+    )
+    parser.add_argument(
+        "--worker-batch",
+        type=int,
+        help="With --worker, jobs crawled together over one set of sessions (default: TIKTOK_CRAWL_WORKER_BATCH)",
+    )
     return parser.parse_args(argv)
 
 
 def main(argv: Optional[List[str]] = None) -> int:
     args = _parse_args(argv)
+    if redis_client is None:
+        # A one-off run has no later requests to benefit from the cache, so give it a moment to connect.
+        redis_breaker.wait(REDIS_CONNECT_TIMEOUT)
+    if args.warm:
+        import warmer  # warmer imports this module
+
+        return warmer.run(
+            interval=warmer.WARM_INTERVAL if args.warm_interval is None else args.warm_interval,
+            top=warmer.WARM_TOP if args.warm_top is None else args.warm_top,
+            budget=warmer.WARM_BUDGET if args.warm_budget is None else args.warm_budget,
+        )
+    if args.worker:
+        return crawl_queue.run_worker(
+            crawl_jobs, _crawl_jobs, batch=crawl_queue.WORKER_BATCH if args.worker_batch is None else max(1, args.worker_batch)
+        )
+
     # If keywords are passed as a single string (e.g., from shell), split them
     if isinstance(args.keywords, str):
         keywords_list = args.keywords.split(',')
@@ -312,24 +1868,33 @@ def main(argv: Optional[List[str]] = None) -> int:
 
     result = get_tiktok_videos(keywords_list, num_videos=args.count, force_refresh=args.refresh)
 
+    # Determine the path to the frontend/public directory
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    output_path = args.output or os.path.join(os.path.dirname(script_dir), "frontend", "public", "tiktok_live.json")
+
+    videos = [asdict(video) for video in result.videos]
+    if args.snapshot:
+        now = int(time.time())
+        videos = snapshot.merge_videos(
+            snapshot.load_videos(output_path), videos, now=now, retention=args.retention_days * 86400
+        )
     payload = {
         "keywords": keywords_list,
-        "total": len(result.videos),
+        "total": len(videos),
         "from_cache": result.from_cache,
-        "videos": [asdict(video) for video in result.videos],
+        "videos": videos,
     }
+    if args.snapshot:
+        payload["generated_at"] = now
     if result.error:
         payload["error"] = result.error
 
-    # Determine the path to the frontend/public directory
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    output_path = os.path.join(os.path.dirname(script_dir), "frontend", "public", "tiktok_live.json")
-
     try:
-        with open(output_path, "w", encoding="utf-8") as f:
-            json.dump(payload, f, ensure_ascii=False, indent=2)
-        logger.info(f"Successfully wrote {len(result.videos)} videos to {output_path}")
-    except IOError as e:
+        snapshot.write_atomic(output_path, payload, indent=None if args.snapshot else 2)
+        if args.snapshot and args.shard_size > 0:
+            snapshot.write_shards(output_path, payload, args.shard_size)
+        logger.info(f"Successfully wrote {len(videos)} videos to {output_path}")
+    except OSError as e:
         logger.error(f"Failed to write to {output_path}: {e}")
         return 1
 
@@ -0,0 +1,216 @@
+"""Per-process L1 cache in front of Redis, invalidated over Redis pub/sub.
+
+:class:`LocalCache` keeps decoded cache entries in a byte-bounded LRU so hot
+keys are served without a Redis round-trip or decoding. Every Redis write of a
+key is announced on a pub/sub channel and :class:`InvalidationListener` drops
+that key from the other processes' L1; entries also expire on their own after
+a short TTL that never exceeds what Redis itself would keep.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, Generic, Iterable, Optional, TypeVar
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+V = TypeVar("V")
+
+# Rough per-entry bookkeeping cost on top of the encoded size.
+_ENTRY_OVERHEAD = 200
+SUBSCRIBE_TIMEOUT = 1.0  # seconds to wait for Redis to confirm the subscription
+
+
+@dataclass(slots=True)
+class LocalCacheStats:
+    hits: int = 0
+    misses: int = 0
+    expired: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+
+
+class LocalCache(Generic[V]):
+    """Thread-safe LRU bounded by total size in bytes; sizes are supplied by the caller."""
+
+    def __init__(self, *, max_bytes: int, ttl: float) -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[V, float, int]] = OrderedDict()
+        self._bytes = 0
+        self._stats = LocalCacheStats()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def get(self, key: str) -> Optional[V]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self._stats.misses += 1
+                return None
+            value, expires_at, size = item
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self._stats.expired += 1
+                self._stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats.hits += 1
+            return value
+
+    def set(self, key: str, value: V, size: int, *, ttl: Optional[float] = None) -> None:
+        """Store ``value``; ``ttl`` can only shorten the cache-wide TTL."""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        size += _ENTRY_OVERHEAD
+        if ttl <= 0 or size > self.max_bytes:
+            self.delete(key)
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, time.monotonic() + ttl, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._stats.evictions += 1
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            return self._remove(key)
+
+    def invalidate(self, keys: Iterable[str]) -> None:
+        with self._lock:
+            for key in keys:
+                if self._remove(key):
+                    self._stats.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict[str, object]:
+        with self._lock:
+            return {**asdict(self._stats), "entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+    def _remove(self, key: str) -> bool:
+        item = self._entries.pop(key, None)
+        if item is None:
+            return False
+        self._bytes -= item[2]
+        return True
+
+
+class InvalidationListener:
+    """Subscribes to the invalidation channel of one Redis client and drops announced keys.
+
+    Messages are ``"<origin> <key>"``; a process ignores its own announcements
+    because it already updated its L1 when it wrote the key. The origin is tied
+    to the pid, so a forked worker gets its own and subscribes afresh.
+    """
+
+    def __init__(self, cache: LocalCache[Any], channel: str, *, retry_interval: float = 30.0) -> None:
+        self.cache = cache
+        self.channel = channel
+        self.retry_interval = retry_interval
+        self._pid = os.getpid()
+        self.origin = f"{self._pid}-{id(self):x}"
+        self._client: Optional[redis.Redis] = None
+        self._thread: Optional[Any] = None
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def ensure(self, client: redis.Redis) -> bool:
+        """Make sure we listen on ``client``; False while that is impossible and L1 must not be used.
+
+        Every (re)subscription clears the cache, since invalidations sent while
+        nobody listened were missed. L1 is only used again once Redis has
+        confirmed the subscription.
+        """
+        with self._lock:
+            pid = os.getpid()
+            if pid != self._pid:
+                # A forked child inherits this object but not the parent's listener thread.
+                self._pid, self.origin = pid, f"{pid}-{id(self):x}"
+                self._thread, self._client = None, None
+            if client is self._client:
+                if self._thread is not None:
+                    return True
+                if time.monotonic() < self._retry_at:
+                    return False
+            else:
+                self._stop()
+                self._client = client
+            self.cache.clear()
+            try:
+                pubsub = client.pubsub()
+                pubsub.subscribe(**{self.channel: self._on_message})
+                confirmation = pubsub.get_message(timeout=SUBSCRIBE_TIMEOUT)
+                if not confirmation or confirmation["type"] != "subscribe":
+                    pubsub.close()
+                    raise redis.exceptions.TimeoutError("subscription was not confirmed")
+                self._thread = pubsub.run_in_thread(
+                    sleep_time=1.0, daemon=True, exception_handler=self._on_error
+                )
+            except redis.exceptions.RedisError as e:
+                logger.error("Could not subscribe to cache invalidations; local cache disabled: %s", e)
+                self._retry_at = time.monotonic() + self.retry_interval
+                return False
+            return True
+
+    def listening(self, client: redis.Redis) -> bool:
+        """Whether we already listen on ``client``; unlike :meth:`ensure` this never touches Redis."""
+        return client is self._client and self._thread is not None and os.getpid() == self._pid
+
+    def message(self, key: str) -> str:
+        return f"{self.origin} {key}"
+
+    def publish(self, client: redis.Redis, keys: Iterable[str]) -> None:
+        """Announce that ``keys`` changed in Redis; errors are logged, not raised."""
+        try:
+            pipe = client.pipeline(transaction=False)
+            for key in keys:
+                pipe.publish(self.channel, self.message(key))
+            pipe.execute()
+        except redis.exceptions.RedisError as e:
+            logger.error("Redis PUBLISH operation failed: %s", e)
+
+    def close(self) -> None:
+        with self._lock:
+            self._stop()
+            self._client = None
+
+    def _stop(self) -> None:
+        if self._thread is not None:
+            self._thread.stop()
+            self._thread = None
+
+    def _on_message(self, message: dict[str, Any]) -> None:
+        data = message.get("data")
+        if isinstance(data, bytes):
+            data = data.decode("utf-8", "replace")
+        origin, _, key = str(data).partition(" ")
+        if origin != self.origin and key:
+            self.cache.invalidate([key])
+
+    def _on_error(self, exc: BaseException, pubsub: Any, thread: Any) -> None:
+        # Invalidations may be missed from here on, so L1 stays off until ensure() subscribes again.
+        logger.error("Cache invalidation listener failed; local cache disabled until resubscribed: %s", exc)
+        with self._lock:
+            if self._thread is thread:
+                self._thread = None
+                self._retry_at = 0.0
+            self.cache.clear()
+        thread.stop()
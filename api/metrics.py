@@ -0,0 +1,238 @@
+"""Crawl instrumentation exported in the Prometheus text format.
+
+Stage timings, cache outcomes and crawl counters are kept in process memory
+and rendered by ``GET /metrics``; with several worker processes each one
+reports its own numbers, so scrape them per process or aggregate in
+Prometheus. When ``TIKTOK_TIMING_HEADER=1`` the stages a request went through
+are also returned to the client in a ``Server-Timing`` header.
+"""
+from __future__ import annotations
+
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Iterator, Optional, Sequence, TypeVar
+
+T = TypeVar("T")
+
+TIMING_HEADER = os.getenv("TIKTOK_TIMING_HEADER", "0") == "1"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; covers a Redis round-trip up to a long multi-page crawl.
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(tuple(labels[name] for name in self.labelnames), 0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge:
+    """A single value read from ``function`` whenever the metric is rendered."""
+
+    def __init__(self, name: str, documentation: str) -> None:
+        self.name = name
+        self.documentation = documentation
+        self._function: Callable[[], float] = lambda: 0
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self._function = function
+
+    def value(self) -> float:
+        return self._function()
+
+    def render(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} gauge",
+            f"{self.name} {_format_value(self.value())}",
+        ]
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = STAGE_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # Per label set: [per-bucket counts (not cumulative), sum, count]
+        self._series: dict[tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels: str) -> int:
+        series = self._series.get(tuple(labels[name] for name in self.labelnames))
+        return series[2] if series else 0
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, ([*series[0]], series[1], series[2])) for key, series in self._series.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "tiktok_stage_seconds",
+    "Time spent in each stage of serving and crawling a query.",
+    ("stage",),
+)
+CACHE_REQUESTS = Counter(
+    "tiktok_cache_requests_total",
+    "Cache lookups by tier (local, redis), key family (videos, page, response) and result (hit, miss, error).",
+    ("tier", "family", "result"),
+)
+LOCAL_CACHE_BYTES = Gauge("tiktok_local_cache_bytes", "Approximate size of this process's in-memory cache tier.")
+LOCAL_CACHE_ENTRIES = Gauge("tiktok_local_cache_entries", "Entries held in this process's in-memory cache tier.")
+REDIS_AVAILABLE = Gauge("tiktok_redis_available", "1 while Redis answers, 0 while its circuit breaker is open.")
+PAGES_FETCHED = Counter("tiktok_pages_fetched_total", "TikTok search pages fetched successfully.")
+VIDEOS_DEDUPLICATED = Counter("tiktok_videos_deduplicated_total", "Crawled videos dropped as duplicates of earlier results.")
+NEAR_DUPLICATES = Counter("tiktok_near_duplicates_total", "Crawled videos dropped as near-duplicates (reuploads, re-edits) of earlier results.")
+CRAWL_FAILURES = Counter("tiktok_crawl_failures_total", "Crawls stopped by an error, with or without partial results.", ("reason",))
+SEARCH_RETRIES = Counter("tiktok_search_retries_total", "Search page requests retried after a transient failure.")
+CRAWL_JOBS = Counter("tiktok_crawl_jobs_total", "Crawl queue jobs submitted, deduplicated against a pending one, done or failed.", ("event",))
+
+REGISTRY = (
+    STAGE_SECONDS,
+    CACHE_REQUESTS,
+    LOCAL_CACHE_BYTES,
+    LOCAL_CACHE_ENTRIES,
+    REDIS_AVAILABLE,
+    PAGES_FETCHED,
+    VIDEOS_DEDUPLICATED,
+    NEAR_DUPLICATES,
+    CRAWL_FAILURES,
+    SEARCH_RETRIES,
+    CRAWL_JOBS,
+)
+
+
+def render() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+# -- per-request timings ----------------------------------------------------
+
+class RequestTimings:
+    """Seconds spent per stage while serving one request, summed across threads."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.stages: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def header(self) -> str:
+        """``Server-Timing`` value, in milliseconds, ending with the request total."""
+        with self._lock:
+            stages = list(self.stages.items())
+        stages.append(("total", time.perf_counter() - self.started))
+        return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in stages)
+
+
+_timings: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar("tiktok_timings", default=None)
+
+
+def start_request() -> tuple[RequestTimings, contextvars.Token]:
+    timings = RequestTimings()
+    return timings, _timings.set(timings)
+
+
+def end_request(token: contextvars.Token) -> None:
+    _timings.reset(token)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    return _timings.get()
+
+
+async def with_timings(timings: Optional[RequestTimings], awaitable: Awaitable[T]) -> T:
+    """Await ``awaitable`` with ``timings`` as the current request, e.g. on another thread's loop."""
+    if timings is not None:
+        _timings.set(timings)
+    return await awaitable
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        timings = _timings.get()
+        if timings is not None:
+            timings.add(stage, elapsed)
+
+
+def cache_result(family: str, result: str, amount: int = 1, *, tier: str = "redis") -> None:
+    if amount:
+        CACHE_REQUESTS.inc(amount, tier=tier, family=family, result=result)
@@ -0,0 +1,308 @@
+"""Near-duplicate detection for crawled videos: MinHash signatures in an LSH index.
+
+Reuploads and re-edits of one clip come back under new ``video_id``s and other
+authors, so exact deduplication keeps them all. Each video gets a MinHash
+signature over its normalised title words and word pairs, its author and the
+file id of its cover image. Signatures are split into ``BANDS`` bands of
+``ROWS`` values; videos sharing any band are candidates, and a candidate whose
+estimated Jaccard similarity reaches the threshold puts the new video in its
+cluster. The first video of a cluster represents it.
+
+Bands are kept as sorted arrays of 64-bit keys plus a small dict of recent
+inserts that is merged in when it grows, so a few hundred thousand videos take
+tens of megabytes and a lookup is a handful of binary searches. With a path,
+signatures are also written to SQLite and other processes pick new rows up
+incrementally. With ``max_age``, signatures older than that are dropped from
+memory and SQLite and the bands are rebuilt without them, so the index covers
+a sliding window of recent crawls instead of growing forever.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from operator import eq
+from typing import Iterator, List, Optional, Protocol
+from urllib.parse import urlsplit
+
+BANDS = 10
+ROWS = 3
+NUM_PERM = BANDS * ROWS
+MIN_TITLE_WORDS = 3  # shorter titles say too little to call two videos the same clip
+
+_MASK32 = (1 << 32) - 1
+_MASK64 = (1 << 64) - 1
+_EMPTY = 1 << 32
+_OFFSET = 0x9E3779B1  # added per step when an empty bin borrows a neighbour's value
+_WORD = re.compile(r"\w+")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS signatures (
+    video_id TEXT PRIMARY KEY,
+    cluster TEXT NOT NULL,
+    signature BLOB NOT NULL,
+    added_at REAL NOT NULL DEFAULT 0
+);
+"""
+INDEXES = "CREATE INDEX IF NOT EXISTS signatures_added_at ON signatures (added_at);"
+
+
+class _Video(Protocol):
+    video_id: str
+    author_id: str
+    title: Optional[str]
+    thumbnail_url: Optional[str]
+
+
+def tokens(video: _Video) -> Optional[set[str]]:
+    """Tokens a signature is built from, or ``None`` when the title is too short to compare."""
+    words = _WORD.findall((video.title or "").lower())
+    if len(words) < MIN_TITLE_WORDS:
+        return None
+    result = set(words)
+    result.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    result.add(f"@{video.author_id}")
+    if video.thumbnail_url:
+        # Signed CDN URLs change per request; the object name before "~" or the extension does not.
+        name = urlsplit(video.thumbnail_url).path.rsplit("/", 1)[-1]
+        result.add("cover:" + re.split(r"[~.]", name, maxsplit=1)[0])
+    return result
+
+
+def signature(token_set: set[str]) -> array:
+    """One-permutation MinHash: one hash per token instead of one per token and permutation.
+
+    The hash picks one of ``NUM_PERM`` bins and each bin keeps its smallest
+    value. An empty bin borrows the value of the next filled bin to its right,
+    offset by the distance, so equal token sets still give equal signatures.
+    """
+    bins = [_EMPTY] * NUM_PERM
+    for token in token_set:
+        h = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+        index, value = h % NUM_PERM, h >> 32
+        if value < bins[index]:
+            bins[index] = value
+    # Walk right to left twice round the ring, carrying the last filled bin leftwards.
+    sig = array("I", bytes(4 * NUM_PERM))
+    carry = distance = 0
+    for step in range(2 * NUM_PERM - 1, -1, -1):
+        value = bins[step % NUM_PERM]
+        if value != _EMPTY:
+            carry, distance = value, 0
+        else:
+            distance += 1
+        if step < NUM_PERM:
+            sig[step] = (carry + distance * _OFFSET) & _MASK32
+    return sig
+
+
+def similarity(left: array, right: array) -> float:
+    """Estimated Jaccard similarity of the token sets behind two signatures."""
+    return sum(map(eq, left, right)) / NUM_PERM
+
+
+def _band_keys(sig: array) -> Iterator[int]:
+    # Rows are strided: neighbouring bins often hold the same borrowed value.
+    for band in range(BANDS):
+        key = band
+        for value in sig[band::BANDS]:
+            key = ((key * 0x100000001B3) ^ value) & _MASK64
+        yield key
+
+
+class _Band:
+    """Sorted (key, row) arrays plus recent inserts; merging is linear since both sides are sorted."""
+
+    __slots__ = ("keys", "rows", "recent", "pending")
+
+    def __init__(self) -> None:
+        self.keys = array("Q")
+        self.rows = array("I")
+        self.recent: dict[int, list[int]] = {}
+        self.pending = 0
+
+    def add(self, key: int, row: int) -> None:
+        self.recent.setdefault(key, []).append(row)
+        self.pending += 1
+        if self.pending >= max(4096, len(self.keys) // 2):
+            self.compact()
+
+    def find(self, key: int) -> Iterator[int]:
+        index = bisect_left(self.keys, key)
+        while index < len(self.keys) and self.keys[index] == key:
+            yield self.rows[index]
+            index += 1
+        yield from self.recent.get(key, ())
+
+    def compact(self) -> None:
+        if not self.recent:
+            return
+        recent = sorted((key, row) for key, rows in self.recent.items() for row in rows)
+        merged = sorted([*zip(self.keys, self.rows), *recent])
+        self.keys = array("Q", (key for key, _ in merged))
+        self.rows = array("I", (row for _, row in merged))
+        self.recent.clear()
+        self.pending = 0
+
+
+class NearDuplicateIndex:
+    """Assigns videos to near-duplicate clusters; thread-safe, optionally persisted to SQLite at ``path``."""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        *,
+        threshold: float = 0.6,
+        sync_interval: float = 30.0,
+        max_age: float = 0.0,
+    ) -> None:
+        self.path = path
+        self.threshold = threshold
+        self.sync_interval = sync_interval
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._ids: List[str] = []
+        self._rows: dict[str, int] = {}
+        self._clusters = array("I")  # row -> row of its cluster's representative
+        self._signatures = array("I")
+        self._added_at = array("d")  # row -> wall-clock time it was first indexed
+        self._bands = [_Band() for _ in range(BANDS)]
+        self._orphans: dict[str, int] = {}  # aged-out representative -> row that now stands for its cluster
+        self._unsaved: list[tuple[str, str, bytes, float]] = []
+        self._synced_rowid = 0
+        self._synced_at = 0.0
+        self._pruned_at = 0.0
+        self._conn: Optional[sqlite3.Connection] = None
+        if path:
+            if path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(signatures)")}
+            if "added_at" not in columns:
+                # Files from before ageing out; their rows are dropped at the first prune.
+                self._conn.execute("ALTER TABLE signatures ADD COLUMN added_at REAL NOT NULL DEFAULT 0")
+            self._conn.executescript(INDEXES)
+            self.sync()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def cluster_of(self, video_id: str) -> Optional[str]:
+        """The cluster of an already indexed video; never computes a signature."""
+        with self._lock:
+            row = self._rows.get(video_id)
+            return None if row is None else self._ids[self._clusters[row]]
+
+    def assign(self, video: _Video) -> str:
+        """Index ``video`` if it is new and return its cluster: the representative's video id."""
+        cluster = self.cluster_of(video.video_id)
+        if cluster is not None:
+            return cluster
+        token_set = tokens(video)
+        if token_set is None:
+            return video.video_id
+        sig = signature(token_set)
+        with self._lock:
+            if video.video_id in self._rows:
+                return self._ids[self._clusters[self._rows[video.video_id]]]
+            match = self._match(sig)
+            cluster = video.video_id if match is None else self._ids[self._clusters[match]]
+            added_at = time.time()
+            self._append(video.video_id, sig, cluster, added_at)
+            if self._conn is not None:
+                self._unsaved.append((video.video_id, cluster, sig.tobytes(), added_at))
+        return cluster
+
+    def flush(self) -> None:
+        """Write new signatures to disk, then load what other processes added since the last sync."""
+        with self._lock:
+            unsaved, self._unsaved = self._unsaved, []
+            if self._conn is not None and unsaved:
+                with self._conn:
+                    self._conn.executemany(
+                        "INSERT OR IGNORE INTO signatures (video_id, cluster, signature, added_at) VALUES (?, ?, ?, ?)",
+                        unsaved,
+                    )
+        if time.monotonic() - self._synced_at >= self.sync_interval:
+            self.sync()
+
+    def sync(self) -> int:
+        """Load rows other processes added since the last sync and age out old ones; returns how many were new here."""
+        with self._lock:
+            added = 0
+            if self._conn is not None:
+                rows = self._conn.execute(
+                    "SELECT rowid, video_id, cluster, signature, added_at FROM signatures WHERE rowid > ? ORDER BY rowid",
+                    (self._synced_rowid,),
+                ).fetchall()
+                for rowid, video_id, cluster, blob, added_at in rows:
+                    self._synced_rowid = rowid
+                    if video_id in self._rows:
+                        continue
+                    sig = array("I")
+                    sig.frombytes(blob)
+                    if len(sig) != NUM_PERM:
+                        continue
+                    self._append(video_id, sig, cluster, added_at)
+                    added += 1
+            if self.max_age > 0 and time.time() - self._pruned_at >= self.max_age / 10:
+                self._prune(time.time() - self.max_age)
+            self._synced_at = time.monotonic()
+            return added
+
+    def _prune(self, cutoff: float) -> None:
+        """Drop signatures indexed before ``cutoff`` and rebuild the rows and bands without them."""
+        self._pruned_at = time.time()
+        if self._conn is not None:
+            with self._conn:
+                self._conn.execute("DELETE FROM signatures WHERE added_at < ?", (cutoff,))
+        keep = [row for row, added_at in enumerate(self._added_at) if added_at >= cutoff]
+        if len(keep) == len(self._ids):
+            return
+        ids, clusters, signatures, added = self._ids, self._clusters, self._signatures, self._added_at
+        self._ids, self._rows, self._orphans = [], {}, {}
+        self._clusters, self._signatures, self._added_at = array("I"), array("I"), array("d")
+        self._bands = [_Band() for _ in range(BANDS)]
+        for row in keep:
+            sig = signatures[row * NUM_PERM:(row + 1) * NUM_PERM]
+            self._append(ids[row], sig, ids[clusters[row]], added[row])
+        for band in self._bands:
+            band.compact()
+
+    def _match(self, sig: array) -> Optional[int]:
+        best, best_score = None, self.threshold
+        candidates = {row for band, key in zip(self._bands, _band_keys(sig)) for row in band.find(key)}
+        for row in candidates:
+            score = similarity(sig, self._signatures[row * NUM_PERM:(row + 1) * NUM_PERM])
+            if score >= best_score:
+                best, best_score = row, score
+        return best
+
+    def _append(self, video_id: str, sig: array, cluster: str, added_at: float) -> None:
+        row = len(self._ids)
+        # A representative that aged out is succeeded by the oldest member still indexed.
+        cluster_row = self._rows.get(cluster)
+        if cluster_row is None:
+            cluster_row = row if cluster == video_id else self._orphans.setdefault(cluster, row)
+        self._ids.append(video_id)
+        self._clusters.append(cluster_row)
+        self._signatures.extend(sig)
+        self._added_at.append(added_at)
+        self._rows[video_id] = row
+        for band, key in zip(self._bands, _band_keys(sig)):
+            band.add(key, row)
@@ -0,0 +1,164 @@
+"""Pacing and retries for TikTok search requests.
+
+:class:`RateLimiter` is a token bucket whose refill rate adapts AIMD-style: it
+drops multiplicatively whenever a request fails or is slow and climbs back by
+a fixed step after every healthy response, between ``min_rate`` and ``rate``.
+Given a Redis client the bucket and its current rate live in Redis, so every
+worker draws from one budget and backs off together; if Redis is unavailable
+the process falls back to its own bucket.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Callable, Optional
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] = bucket hash; ARGV = max rate, burst, max wait, pending additive increase.
+# Applies the increase, refills by elapsed time and reserves one token. Returns the
+# seconds to wait before using it as a string; nothing is reserved when that would
+# exceed max wait.
+TOKEN_BUCKET_SCRIPT = """
+local max_rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'rate')
+local rate = math.min(max_rate, (tonumber(state[3]) or max_rate) + tonumber(ARGV[4]))
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate) - 1
+local wait = 0
+if tokens < 0 then
+    wait = -tokens / rate
+end
+if wait <= tonumber(ARGV[3]) then
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now), 'rate', tostring(rate))
+    redis.call('EXPIRE', KEYS[1], 3600)
+end
+return tostring(wait)
+"""
+
+# KEYS[1] = bucket hash; ARGV = max rate, factor, min rate. Returns the new rate as a string.
+DECREASE_SCRIPT = """
+local rate = tonumber(redis.call('HGET', KEYS[1], 'rate')) or tonumber(ARGV[1])
+rate = math.max(tonumber(ARGV[3]), rate * tonumber(ARGV[2]))
+redis.call('HSET', KEYS[1], 'rate', tostring(rate))
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(rate)
+"""
+
+
+class RateLimited(Exception):
+    """Raised when the next token is further away than the caller is willing to wait."""
+
+    def __init__(self, wait: float) -> None:
+        super().__init__(f"rate limited; next request allowed in {wait:.1f}s")
+        self.wait = wait
+
+
+class RateLimiter:
+    """Token bucket with an AIMD-adjusted refill rate, optionally shared through Redis.
+
+    ``client`` returns the Redis client to use, or ``None`` for the local bucket;
+    it is looked up on every call so a reconnected client is picked up.
+    """
+
+    def __init__(
+        self,
+        *,
+        rate: float,
+        burst: float,
+        min_rate: float,
+        increase: float = 0.5,
+        decrease: float = 0.5,
+        slow_after: float = 5.0,
+        max_wait: float = 30.0,
+        client: Optional[Callable[[], Optional[redis.Redis]]] = None,
+        key: str = "tiktok:ratelimit",
+    ) -> None:
+        self.max_rate = rate
+        self.burst = max(1.0, burst)
+        self.min_rate = min(min_rate, rate)
+        self.increase = increase
+        self.decrease = decrease
+        self.slow_after = slow_after
+        self.max_wait = max_wait
+        self.client = client
+        self.key = key
+        self._lock = threading.Lock()
+        self._rate = rate
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._pending_increase = 0.0  # successes not yet reported to the shared bucket
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    async def acquire(self) -> float:
+        """Wait for a token; returns the seconds waited, or raises :class:`RateLimited`."""
+        client = self.client() if self.client is not None else None
+        wait = await asyncio.to_thread(self._reserve_shared, client) if client is not None else None
+        if wait is None:
+            wait = self._reserve_local()
+        if wait > self.max_wait:
+            raise RateLimited(wait)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    async def record(self, *, ok: bool, elapsed: float) -> None:
+        """Feed back one response: failures and slow responses cut the rate, the rest raise it."""
+        if ok and elapsed < self.slow_after:
+            with self._lock:
+                self._rate = min(self.max_rate, self._rate + self.increase)
+                self._pending_increase += self.increase
+            return
+        with self._lock:
+            self._rate = max(self.min_rate, self._rate * self.decrease)
+            self._pending_increase = 0.0
+        logger.info("Search %s; lowering request rate to %.2f/s", "failed" if not ok else "was slow", self._rate)
+        client = self.client() if self.client is not None else None
+        if client is not None:
+            rate = await asyncio.to_thread(self._decrease_shared, client)
+            if rate is not None:
+                self._rate = rate
+
+    def _reserve_local(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            tokens = min(self.burst, self._tokens + (now - self._updated) * self._rate) - 1
+            wait = -tokens / self._rate if tokens < 0 else 0.0
+            if wait <= self.max_wait:
+                self._tokens, self._updated = tokens, now
+            return wait
+
+    def _decrease_shared(self, client: redis.Redis) -> Optional[float]:
+        try:
+            return float(client.eval(DECREASE_SCRIPT, 1, self.key, self.max_rate, self.decrease, self.min_rate))
+        except redis.exceptions.RedisError as e:
+            logger.error("Redis rate limit update failed: %s", e)
+            return None
+
+    def _reserve_shared(self, client: redis.Redis) -> Optional[float]:
+        with self._lock:
+            increase, self._pending_increase = self._pending_increase, 0.0
+        try:
+            return float(client.eval(
+                TOKEN_BUCKET_SCRIPT, 1, self.key, self.max_rate, self.burst, self.max_wait, increase
+            ))
+        except redis.exceptions.RedisError as e:
+            logger.error("Redis rate limit failed, using the local bucket: %s", e)
+            return None
+
+
+def backoff_delay(attempt: int, *, base: float, cap: float) -> float:
+    """Exponential backoff with full jitter for retry number ``attempt`` (1-based)."""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
@@ -0,0 +1,170 @@
+"""Precompressed, ETag-tagged copies of serialized /api/videos responses.
+
+A stored response remembers the generation of every per-keyword crawler entry
+it was built from. Cache writes bump those generations (see
+``crawler._write_cache``), so a response built from older data no longer
+matches and is rebuilt on the next request. Generations and the response are
+fetched with one MGET. brotli is optional; without it only gzip is stored.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence
+
+import redis
+from werkzeug.http import parse_accept_header, parse_etags
+
+import crawler
+import metrics
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - exercised only without the optional dependency
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on how long a response is reused; it never outlives the soft TTL of its entries.
+RESPONSE_CACHE_TTL = int(os.getenv("TIKTOK_RESPONSE_CACHE_TTL", "300"))  # seconds; 0 disables
+_VERSION = 1
+
+
+@dataclass(slots=True)
+class CachedResponse:
+    etag: str
+    body: bytes
+    gzip: bytes
+    br: Optional[bytes] = None
+    generations: List[int] = field(default_factory=list)
+    built_at: float = field(default_factory=time.time)
+    cache_age: float = 0.0  # age of the underlying crawler data when the body was built
+
+    def age(self) -> int:
+        return int(self.cache_age + max(0.0, time.time() - self.built_at))
+
+
+def enabled() -> bool:
+    return RESPONSE_CACHE_TTL > 0 and msgpack is not None
+
+
+def response_key(keywords: Sequence[str], limit: int) -> str:
+    return "tiktok:response:" + ",".join(k.lower() for k in keywords) + f":{limit}"
+
+
+def lookup_keys(keywords: Sequence[str], limit: int) -> list[str]:
+    """Keys to MGET for a lookup: one generation counter per keyword, then the response."""
+    return [crawler._generation_key(crawler._cache_key(k, None)) for k in keywords] + [response_key(keywords, limit)]
+
+
+def from_lookup(values: Sequence[Optional[bytes]]) -> tuple[Optional[CachedResponse], list[int]]:
+    """Interpret an MGET of :func:`lookup_keys`; returns the response if still current, and the generations."""
+    generations = [int(v) if v else 0 for v in values[:-1]]
+    raw = values[-1]
+    if not raw:
+        metrics.cache_result("response", "miss")
+        return None, generations
+    try:
+        version, etag, stored_generations, built_at, cache_age, body, gzipped, br = msgpack.unpackb(raw, raw=False)
+    except (ValueError, TypeError) as e:
+        logger.error("Failed to decode cached response: %s", e)
+        metrics.cache_result("response", "error")
+        return None, generations
+    if version != _VERSION or stored_generations != generations:
+        metrics.cache_result("response", "miss")
+        return None, generations
+    metrics.cache_result("response", "hit")
+    return CachedResponse(etag, body, gzipped, br, stored_generations, built_at, cache_age), generations
+
+
+def build(body: bytes, generations: List[int], *, cache_age: Optional[float] = None) -> CachedResponse:
+    with metrics.timed("compress"):
+        return CachedResponse(
+            etag=hashlib.blake2b(body, digest_size=16).hexdigest(),
+            body=body,
+            gzip=gzip.compress(body, compresslevel=9, mtime=0),
+            br=brotli.compress(body, quality=9) if brotli is not None else None,
+            generations=list(generations),
+            cache_age=cache_age or 0.0,
+        )
+
+
+def encode(response: CachedResponse) -> bytes:
+    return msgpack.packb(
+        [_VERSION, response.etag, response.generations, response.built_at, response.cache_age,
+         response.body, response.gzip, response.br],
+        use_bin_type=True,
+    )
+
+
+def store_ttl(cache_age: Optional[float]) -> int:
+    """Seconds a response built from data ``cache_age`` seconds old may be kept."""
+    return int(min(RESPONSE_CACHE_TTL, crawler.CACHE_TTL - (cache_age or 0.0)))
+
+
+def lookup(keywords: Sequence[str], limit: int) -> tuple[Optional[CachedResponse], Optional[list[int]]]:
+    """Fetch a current response; generations are ``None`` when nothing may be stored afterwards."""
+    client = crawler.redis_client
+    if not client or not enabled():
+        return None, None
+    try:
+        with metrics.timed("redis_get"):
+            values = client.mget(lookup_keys(keywords, limit))
+    except redis.exceptions.RedisError as e:
+        logger.error("Redis GET operation failed: %s", e)
+        metrics.cache_result("response", "error")
+        return None, None
+    return from_lookup(values)
+
+
+def store(keywords: Sequence[str], limit: int, response: CachedResponse) -> None:
+    client = crawler.redis_client
+    ttl = store_ttl(response.cache_age)
+    if not client or not enabled() or ttl <= 0:
+        return
+    try:
+        with metrics.timed("redis_set"):
+            client.set(response_key(keywords, limit), encode(response), ex=ttl)
+    except redis.exceptions.RedisError as e:
+        logger.error("Redis SET operation failed: %s", e)
+
+
+def negotiate(
+    response: CachedResponse,
+    *,
+    accept_encoding: Optional[str],
+    if_none_match: Optional[str],
+) -> tuple[int, list[tuple[str, str]], bytes]:
+    """Pick the status, headers and body variant for a request.
+
+    Each coding is its own representation, so it gets its own strong ETag:
+    a shared cache revalidating one must not be told another is current.
+    """
+    accepted = parse_accept_header(accept_encoding or "")
+    body, encoding = response.body, None
+    if response.br is not None and accepted["br"] > 0:
+        body, encoding = response.br, "br"
+    elif accepted["gzip"] > 0:
+        body, encoding = response.gzip, "gzip"
+    etag = response.etag if encoding is None else f"{response.etag}-{encoding}"
+    headers = [
+        ("ETag", f'"{etag}"'),
+        ("Vary", "Accept-Encoding"),
+        ("Age", str(response.age())),
+    ]
+    if if_none_match and parse_etags(if_none_match).contains_weak(etag):
+        return 304, headers, b""
+
+    headers.append(("Content-Type", "application/json"))
+    if encoding is not None:
+        headers.append(("Content-Encoding", encoding))
+    return 200, headers, body
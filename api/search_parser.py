@@ -0,0 +1,117 @@
+"""Projection parser for TikTok search responses.
+
+Only the handful of fields a :class:`crawler.TikTokVideo` needs are read from
+each result; statistics, music, hashtags and the rest of the payload are never
+touched. Raw response bodies are decoded with orjson when it is installed.
+"""
+from __future__ import annotations
+
+import json
+from typing import Any, Callable, Iterable, Optional, TypeVar
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised only without the optional dependency
+    orjson = None
+
+T = TypeVar("T")
+
+# Fallback order for each projected field, most preferred first.
+COVER_KEYS = ("originCover", "cover", "dynamicCover")
+DOWNLOAD_KEYS = ("downloadAddr", "downloadAddrH265", "downloadAddrWatermark")
+PLAY_KEYS = ("playAddr", "playAddrH265", "playApiHref")
+THUMBNAIL_KEYS = ("url", "thumbUrl", "thumb_url", "cover", "origin", "uri", "urlList", "url_list", "urls")
+_THUMBNAIL_KEYS_REVERSED = THUMBNAIL_KEYS[::-1]
+
+
+def loads(raw: bytes | str) -> Any:
+    """Decode a JSON body, preferring orjson."""
+    if orjson is not None:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError as exc:
+            raise ValueError(str(exc)) from exc
+    return json.loads(raw)
+
+
+def resolve_thumbnail(candidate: object) -> Optional[str]:
+    """First non-blank URL in a nested cover value, searched depth-first in key order."""
+    if isinstance(candidate, str):
+        return candidate.strip() or None
+    stack = [candidate]
+    pop, push = stack.pop, stack.append
+    while stack:
+        value = pop()
+        if isinstance(value, str):
+            value = value.strip()
+            if value:
+                return value
+        elif isinstance(value, dict):
+            for key in _THUMBNAIL_KEYS_REVERSED:
+                nested = value.get(key)
+                if nested is not None:
+                    push(nested)
+        elif isinstance(value, (list, tuple)):
+            stack.extend(reversed(value))
+        elif isinstance(value, (set, frozenset)):
+            stack.extend(value)
+    return None
+
+
+def _first(mapping: dict, keys: tuple[str, ...]) -> Any:
+    for key in keys:
+        value = mapping.get(key)
+        if value:
+            return value
+    return None
+
+
+def _fields(*fields: Any) -> tuple:
+    return fields
+
+
+def extract_videos(data_block: Iterable[object], make: Callable[..., T] = _fields) -> list[T]:
+    """Build one ``make(video_id, video_url, author_id, thumbnail_url, title, download_url, play_url)`` per video result."""
+    videos: list[T] = []
+    append = videos.append
+    for entry in data_block:
+        if not isinstance(entry, dict) or entry.get("type") != 1:  # non-video results (users, ads, etc.)
+            continue
+        item = entry.get("item")
+        if not item:
+            continue
+        video_id = item.get("id")
+        if not video_id:
+            continue
+        video_id = str(video_id).strip()
+        if not video_id:
+            continue
+        author = item.get("author")
+        author_id = str((author.get("uniqueId") or author.get("id") or "unknown") if author else "unknown")
+        video_meta = item.get("video")
+        if video_meta:
+            cover = _first(video_meta, COVER_KEYS)
+            thumbnail_url = resolve_thumbnail(cover) if cover else None
+            download_url = _first(video_meta, DOWNLOAD_KEYS)
+            play_url = _first(video_meta, PLAY_KEYS)
+        else:
+            thumbnail_url = download_url = play_url = None
+        append(make(
+            video_id,
+            f"https://www.tiktok.com/@{author_id}/video/{video_id}",
+            author_id,
+            thumbnail_url,
+            item.get("desc") or None,
+            download_url,
+            play_url,
+        ))
+    return videos
+
+
+def summarize(response: dict) -> str:
+    """Short description of a response for logs, instead of the whole payload."""
+    data = response.get("data")
+    return (
+        f"status_code={response.get('status_code')} results={len(data) if isinstance(data, list) else 0} "
+        f"has_more={response.get('has_more')} cursor={response.get('cursor')}"
+    )
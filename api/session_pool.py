@@ -0,0 +1,332 @@
+"""Process-wide pool of warm TikTokApi sessions running on a background event loop."""
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass(slots=True)
+class PooledSession:
+    """A TikTokApi instance plus the session index requests should use."""
+
+    api: Any
+    session_index: int = 0
+    created_at: float = field(default_factory=time.monotonic)
+    last_used: float = field(default_factory=time.monotonic)
+    uses: int = 0
+    failed: bool = False
+
+
+@dataclass(slots=True)
+class PoolStats:
+    created: int = 0
+    borrows: int = 0
+    waits: int = 0
+    wait_seconds: float = 0.0
+    recycled: int = 0
+    health_failures: int = 0
+    create_failures: int = 0
+
+
+class SessionPool:
+    """Keeps browser sessions alive between crawls.
+
+    Every TikTokApi object is bound to the loop it was created on, so the pool
+    owns a dedicated event loop thread and all crawls are submitted to it with
+    :meth:`run`.  Sessions are health-checked when borrowed and recycled once
+    they fail, exceed ``max_age`` or sit idle longer than ``idle_timeout``.
+    """
+
+    def __init__(
+        self,
+        api_factory: Callable[[], Any],
+        *,
+        size: int,
+        min_warm: int = 1,
+        idle_timeout: float = 300.0,
+        max_age: float = 1800.0,
+        acquire_timeout: float = 60.0,
+        sleep_after: int = 3,
+    ) -> None:
+        self.size = max(1, size)
+        self.min_warm = max(0, min(min_warm, self.size))
+        self.idle_timeout = idle_timeout
+        self.max_age = max_age
+        self.acquire_timeout = acquire_timeout
+        self.sleep_after = sleep_after
+        self._api_factory = api_factory
+        self._stats = PoolStats()
+        self._idle: list[PooledSession] = []
+        self._leased = 0
+        self._creating = 0
+        self._checking = 0  # popped from idle, health check in progress
+        self._closing: set[asyncio.Task] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._cond: Optional[asyncio.Condition] = None
+        self._reaper: Optional[asyncio.Task] = None
+        self._start_lock = threading.Lock()
+
+    # -- loop management -------------------------------------------------
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self.start()
+
+    def start(self) -> asyncio.AbstractEventLoop:
+        with self._start_lock:
+            if self._loop is not None:
+                return self._loop
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def _serve() -> None:
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            self._thread = threading.Thread(target=_serve, name="tiktok-session-pool", daemon=True)
+            self._thread.start()
+            ready.wait()
+            self._loop = loop
+            asyncio.run_coroutine_threadsafe(self._setup(), loop).result()
+            return loop
+
+    async def start_in_running_loop(self) -> None:
+        """Adopt the caller's event loop instead of starting a thread (for ASGI servers).
+
+        Crawls must then be awaited on that loop directly; :meth:`run` is not usable.
+        """
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            self._loop = asyncio.get_running_loop()
+        await self._setup()
+
+    async def aclose(self) -> None:
+        await self._shutdown()
+        self._loop = None
+
+    async def _setup(self) -> None:
+        self._cond = asyncio.Condition()
+        self._reaper = asyncio.create_task(self._reap_forever())
+        for _ in range(self.min_warm):
+            asyncio.create_task(self._warm_one())
+
+    def run(self, coro: Awaitable[T], timeout: Optional[float] = None) -> T:
+        """Run ``coro`` on the pool loop and block the calling thread for its result."""
+        future = asyncio.run_coroutine_threadsafe(coro, self.start())
+        return future.result(timeout)
+
+    def close(self) -> None:
+        if self._loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(30)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Session pool shutdown failed: %s", exc)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._loop = None
+
+    async def _shutdown(self) -> None:
+        if self._reaper is not None:
+            self._reaper.cancel()
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*(self._close(s) for s in idle), *self._closing, return_exceptions=True)
+
+    # -- borrowing ---------------------------------------------------------
+
+    async def acquire(self, *, wait: bool = True) -> Optional[PooledSession]:
+        """Borrow a healthy session.
+
+        With ``wait=False`` only an already idle session is handed out and
+        ``None`` is returned otherwise, so callers can opportunistically grab
+        extra sessions without risking a deadlock against other crawls.
+        """
+        assert self._cond is not None, "pool is not running"
+        deadline = time.monotonic() + self.acquire_timeout
+        waited_since: Optional[float] = None
+        while True:
+            async with self._cond:
+                while True:
+                    session = self._pop_idle()
+                    if session is not None:
+                        self._checking += 1
+                        break
+                    if not wait:
+                        return None
+                    if self._total() < self.size:
+                        self._creating += 1
+                        break
+                    if waited_since is None:
+                        waited_since = time.monotonic()
+                        self._stats.waits += 1
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError("timed out waiting for a TikTok session")
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        continue
+            if session is None:
+                break
+            # Checked outside the lock so a slow check does not hold up every other borrower.
+            try:
+                healthy = await self._healthy(session)
+            finally:
+                self._checking -= 1
+            if healthy:
+                break
+            self._stats.health_failures += 1
+            self._recycle(session, "failed health check")
+            await self._notify()
+
+        if waited_since is not None:
+            self._stats.wait_seconds += time.monotonic() - waited_since
+
+        if session is None:
+            try:
+                session = await self._create()
+            finally:
+                self._creating -= 1
+                await self._notify()
+
+        session.uses += 1
+        self._leased += 1
+        self._stats.borrows += 1
+        return session
+
+    async def release(self, session: PooledSession) -> None:
+        self._leased -= 1
+        session.last_used = time.monotonic()
+        if session.failed or self._expired(session, session.last_used):
+            self._recycle(session, "failed" if session.failed else "aged out")
+        else:
+            self._idle.append(session)
+        await self._notify()
+
+    @asynccontextmanager
+    async def borrow(self) -> AsyncIterator[PooledSession]:
+        session = await self.acquire()
+        try:
+            yield session
+        except Exception:
+            session.failed = True
+            raise
+        finally:
+            await self.release(session)
+
+    def stats(self) -> dict[str, object]:
+        snapshot = asdict(self._stats)
+        snapshot.update(
+            size=self.size,
+            idle=len(self._idle),
+            leased=self._leased,
+            creating=self._creating,
+            checking=self._checking,
+            idle_timeout=self.idle_timeout,
+        )
+        return snapshot
+
+    # -- internals ----------------------------------------------------------
+
+    def _total(self) -> int:
+        return len(self._idle) + self._leased + self._creating + self._checking
+
+    def _expired(self, session: PooledSession, now: float) -> bool:
+        return now - session.created_at > self.max_age
+
+    def _pop_idle(self) -> Optional[PooledSession]:
+        now = time.monotonic()
+        while self._idle:
+            session = self._idle.pop()  # LIFO keeps the most recently used session hot
+            if self._expired(session, now):
+                self._recycle(session, "aged out")
+                continue
+            return session
+        return None
+
+    async def _healthy(self, session: PooledSession) -> bool:
+        try:
+            health = await session.api.health_check()
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("TikTok session health check raised: %s", exc)
+            return False
+        return bool(health.get("healthy_sessions", 0))
+
+    async def _create(self) -> PooledSession:
+        api = self._api_factory()
+        try:
+            await api.create_sessions(num_sessions=1, sleep_after=self.sleep_after)
+        except Exception:
+            self._stats.create_failures += 1
+            await self._close(PooledSession(api=api))
+            raise
+        self._stats.created += 1
+        logger.info("Opened pooled TikTok session (%d/%d)", self._total() + 1, self.size)
+        return PooledSession(api=api)
+
+    async def _warm_one(self) -> None:
+        if self._total() >= self.size:
+            return
+        self._creating += 1
+        try:
+            session = await self._create()
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Could not warm TikTok session: %s", exc)
+            return
+        finally:
+            self._creating -= 1
+        self._idle.append(session)
+        await self._notify()
+
+    def _recycle(self, session: PooledSession, reason: str) -> None:
+        self._stats.recycled += 1
+        logger.info("Recycling pooled TikTok session (%s, %d uses)", reason, session.uses)
+        # Kept until done so shutdown can wait for it and the loop does not drop it half-closed.
+        task = asyncio.get_running_loop().create_task(self._close(session))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def _close(self, session: PooledSession) -> None:
+        try:
+            await session.api.close_sessions()
+        except Exception as exc:  # noqa: BLE001
+            logger.debug("Error closing TikTok session: %s", exc)
+
+    async def _notify(self) -> None:
+        assert self._cond is not None
+        async with self._cond:
+            self._cond.notify_all()
+
+    async def _reap_forever(self) -> None:
+        interval = max(1.0, min(self.idle_timeout, 60.0) / 2)
+        while True:
+            await asyncio.sleep(interval)
+            self._reap(time.monotonic())
+            for _ in range(self.min_warm - self._total()):
+                asyncio.create_task(self._warm_one())
+
+    def _reap(self, now: float) -> None:
+        keep: list[PooledSession] = []
+        # Oldest sessions sit at the front of the idle list; drop those first.
+        for position, session in enumerate(self._idle):
+            spare = len(keep) + len(self._idle) - position - 1 + self._leased >= self.min_warm
+            if self._expired(session, now):
+                self._recycle(session, "aged out")
+            elif spare and now - session.last_used > self.idle_timeout:
+                self._recycle(session, "idle")
+            else:
+                keep.append(session)
+        self._idle = keep
@@ -0,0 +1,233 @@
+"""Request coalescing so concurrent cache misses trigger a single crawl."""
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Generic, Optional, TypeVar
+
+import redis
+import redis.asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+FENCE_TTL = 86400  # seconds; pass the cache entry's TTL so the fence outlives what it guards
+
+# KEYS[1] = lease key, ARGV[1] = token
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# KEYS[1] = lease key, KEYS[2] = fence counter, ARGV = lease ttl ms, fence ttl seconds.
+# Takes the lease and hands out the next fencing token, or returns nil if it is held.
+# Only lease holders bump the fence, so waiting workers never invalidate the holder.
+ACQUIRE_SCRIPT = """
+if not redis.call('SET', KEYS[1], '0', 'NX', 'PX', ARGV[1]) then
+    return false
+end
+local token = redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+redis.call('SET', KEYS[1], token, 'PX', ARGV[1])
+return token
+"""
+
+# KEYS[1] = cache key, KEYS[2] = fence counter, ARGV = token, payload, ttl seconds.
+# A write is rejected once a newer lease has been handed out for the key; an accepted
+# one keeps the fence alive for as long as the entry it guards.
+FENCED_SET_SCRIPT = """
+local latest = tonumber(redis.call('GET', KEYS[2]) or '0')
+if tonumber(ARGV[1]) < latest then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return 1
+"""
+
+# KEYS[1] = counter, ARGV[1] = ttl seconds. Counters live per cache key, so they
+# expire with it rather than piling up for every keyword ever searched.
+INCR_SCRIPT = """
+local value = redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return value
+"""
+
+
+@dataclass(slots=True)
+class _Call(Generic[T]):
+    done: threading.Event = field(default_factory=threading.Event)
+    result: Optional[T] = None
+    error: Optional[BaseException] = None
+    waiters: int = 0
+    size: int = 0
+
+
+class SingleFlight(Generic[T]):
+    """Collapse concurrent calls for the same key within one process."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: dict[str, _Call[T]] = {}
+
+    def do(self, key: str, fn: Callable[[], T], *, size: int = 0) -> tuple[T, bool]:
+        """Run ``fn`` once per key; returns the result and whether it was shared.
+
+        ``size`` is how much of the result the caller needs. A call only joins an
+        in-flight one at least that big; otherwise it waits for it to finish and
+        then runs (or joins) the next call for the key.
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call(size=size)
+                    break
+                if call.size >= size:
+                    call.waiters += 1
+                    break
+            call.done.wait()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True  # type: ignore[return-value]
+
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        if call.waiters:
+            logger.info("Shared one crawl for '%s' with %d waiting callers", key, call.waiters)
+        return call.result, False
+
+    def in_flight(self, key: str) -> bool:
+        with self._lock:
+            return key in self._calls
+
+
+class _Lease:
+    """Key layout and script calls shared by :class:`RedisLease` and :class:`AsyncRedisLease`.
+
+    Subclasses only run the calls against their client, so the two stay in step.
+    """
+
+    def __init__(self, key: str, *, ttl: float, fence_ttl: int) -> None:
+        self.key = key
+        self.ttl = ttl
+        self.fence_ttl = fence_ttl
+        self.lease_key = f"{key}:lease"
+        self.fence_key = f"{key}:fence"
+        self.token: Optional[int] = None
+
+    def _acquire_args(self) -> tuple:
+        return ACQUIRE_SCRIPT, 2, self.lease_key, self.fence_key, int(self.ttl * 1000), self.fence_ttl
+
+    def _acquired(self, token: Optional[int]) -> bool:
+        self.token = None if token is None else int(token)
+        return self.token is not None
+
+    def _release_args(self) -> tuple:
+        return RELEASE_SCRIPT, 1, self.lease_key, self.token
+
+    def _fenced_set_args(self, value: bytes | str, ex: int) -> tuple:
+        return FENCED_SET_SCRIPT, 2, self.key, self.fence_key, self.token, value, ex
+
+    def _release_failed(self, error: redis.exceptions.RedisError) -> None:
+        logger.error("Redis lease release failed for '%s': %s", self.key, error)
+
+
+class RedisLease(_Lease):
+    """A per-key crawl lease across workers, guarded by a monotonically increasing fencing token."""
+
+    def __init__(self, client: redis.Redis, key: str, *, ttl: float, fence_ttl: int = FENCE_TTL) -> None:
+        super().__init__(key, ttl=ttl, fence_ttl=fence_ttl)
+        self.client = client
+
+    def acquire(self) -> bool:
+        return self._acquired(self.client.eval(*self._acquire_args()))
+
+    def held_elsewhere(self) -> bool:
+        return bool(self.client.exists(self.lease_key))
+
+    def release(self) -> None:
+        if self.token is None:
+            return
+        try:
+            self.client.eval(*self._release_args())
+        except redis.exceptions.RedisError as e:
+            self._release_failed(e)
+        self.token = None
+
+    def fenced_set(self, value: bytes | str, *, ex: int) -> bool:
+        """Write ``value`` to the cache key unless a newer lease has superseded ours."""
+        if self.token is None:
+            self.client.set(self.key, value, ex=ex)
+            return True
+        return bool(self.client.eval(*self._fenced_set_args(value, ex)))
+
+    def queue_fenced_set(self, pipe: redis.client.Pipeline, value: bytes | str, *, ex: int) -> None:
+        """Queue :meth:`fenced_set` on ``pipe``; its result is whether the write was accepted."""
+        if self.token is None:
+            pipe.set(self.key, value, ex=ex)
+        else:
+            pipe.eval(*self._fenced_set_args(value, ex))
+
+    def wait_for_holder(self, *, timeout: float, interval: float) -> bool:
+        """Poll until the current holder releases the lease; False if we timed out."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not self.held_elsewhere():
+                return True
+            time.sleep(interval)
+        return False
+
+
+class AsyncRedisLease(_Lease):
+    """:class:`RedisLease` for ``redis.asyncio`` clients."""
+
+    def __init__(self, client: aioredis.Redis, key: str, *, ttl: float, fence_ttl: int = FENCE_TTL) -> None:
+        super().__init__(key, ttl=ttl, fence_ttl=fence_ttl)
+        self.client = client
+
+    async def acquire(self) -> bool:
+        return self._acquired(await self.client.eval(*self._acquire_args()))
+
+    async def held_elsewhere(self) -> bool:
+        return bool(await self.client.exists(self.lease_key))
+
+    async def release(self) -> None:
+        if self.token is None:
+            return
+        try:
+            await self.client.eval(*self._release_args())
+        except redis.exceptions.RedisError as e:
+            self._release_failed(e)
+        self.token = None
+
+    async def fenced_set(self, value: bytes | str, *, ex: int) -> bool:
+        if self.token is None:
+            await self.client.set(self.key, value, ex=ex)
+            return True
+        return bool(await self.client.eval(*self._fenced_set_args(value, ex)))
+
+    async def wait_for_holder(self, *, timeout: float, interval: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not await self.held_elsewhere():
+                return True
+            await asyncio.sleep(interval)
+        return False
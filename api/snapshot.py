@@ -0,0 +1,132 @@
+"""Incremental builder for the static ``tiktok_live.json`` snapshot.
+
+Each run merges the freshly crawled videos into the previous snapshot by
+``video_id``, stamping ``first_seen``/``last_seen`` (epoch seconds) and dropping
+videos not seen within the retention window. Files are replaced atomically so
+readers never observe a half-written snapshot. Optionally the videos are also
+split into shards under ``<name>/`` with an ``index.json`` manifest, letting the
+frontend render the first screen from the first listed shard alone.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import secrets
+import tempfile
+import time
+from typing import Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+RETENTION_DAYS = float(os.getenv("TIKTOK_SNAPSHOT_RETENTION_DAYS", "7"))
+
+
+def load_videos(path: str) -> list[dict[str, object]]:
+    """Videos of an existing snapshot; snapshots without timestamps get the file's mtime."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        mtime = int(os.path.getmtime(path))
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable snapshot %s: %s", path, e)
+        return []
+
+    if not isinstance(payload, dict):
+        logger.warning("Ignoring snapshot %s without a top-level object", path)
+        return []
+    videos = []
+    for video in payload.get("videos") or []:
+        if not isinstance(video, dict) or not video.get("video_id"):
+            continue
+        video.setdefault("first_seen", mtime)
+        video.setdefault("last_seen", video["first_seen"])
+        videos.append(video)
+    return videos
+
+
+def merge_videos(
+    previous: Iterable[dict[str, object]],
+    crawled: Iterable[dict[str, object]],
+    *,
+    now: Optional[int] = None,
+    retention: float = RETENTION_DAYS * 86400,
+) -> list[dict[str, object]]:
+    """Merge a crawl into earlier snapshot videos, most recently seen first."""
+    now = int(time.time()) if now is None else now
+    by_id: dict[str, dict[str, object]] = {}
+    for video in crawled:
+        video_id = str(video["video_id"])
+        if video_id not in by_id:
+            by_id[video_id] = {**video, "first_seen": now, "last_seen": now}
+    for video in previous:
+        video_id = str(video["video_id"])
+        current = by_id.get(video_id)
+        if current is not None:
+            current["first_seen"] = min(int(video["first_seen"]), now)
+        elif now - int(video["last_seen"]) <= retention:
+            by_id[video_id] = video
+    # Stable sort: this run's videos keep crawl order, older ones keep snapshot order.
+    return sorted(by_id.values(), key=lambda v: -int(v["last_seen"]))
+
+
+def write_atomic(path: str, payload: object, *, indent: Optional[int] = None) -> None:
+    """Write JSON to a temp file in the target directory and rename it into place."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".json", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            if indent is None:
+                json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+            else:
+                json.dump(payload, f, ensure_ascii=False, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def write_shards(path: str, payload: dict[str, object], shard_size: int) -> List[str]:
+    """Write ``payload['videos']`` in shards next to ``path``; returns the shard file names.
+
+    Shard names carry the snapshot timestamp and a random run id, so two runs in
+    the same second never overwrite each other's files. The manifest is replaced
+    last, so a reader holding the previous ``index.json`` still finds the files
+    it lists; shards older than that are removed.
+    """
+    directory = os.path.splitext(path)[0]
+    os.makedirs(directory, exist_ok=True)
+    manifest_path = os.path.join(directory, "index.json")
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            previous = set(json.load(f).get("shards") or [])
+    except (OSError, ValueError, AttributeError):
+        previous = set()
+    videos = payload["videos"]
+    run = f"{payload['generated_at']}-{secrets.token_hex(4)}"
+    names = []
+    for number, start in enumerate(range(0, max(len(videos), 1), shard_size)):
+        name = f"shard-{run}-{number:04d}.json"
+        write_atomic(os.path.join(directory, name), {"videos": videos[start:start + shard_size]})
+        names.append(name)
+
+    manifest = {key: value for key, value in payload.items() if key != "videos"}
+    manifest.update(shard_size=shard_size, shards=names)
+    write_atomic(manifest_path, manifest)
+
+    for stale in set(os.listdir(directory)) - set(names) - previous:
+        if stale.startswith("shard-"):
+            try:
+                os.unlink(os.path.join(directory, stale))
+            except OSError as e:
+                logger.warning("Could not remove old shard %s: %s", stale, e)
+    return names
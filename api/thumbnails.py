@@ -0,0 +1,392 @@
+"""Disk-cached, resized cover images for the video grid.
+
+TikTok cover URLs point at full-size images and carry signatures that expire.
+With ``TIKTOK_THUMBNAIL_DIR`` set, API responses point ``thumbnail_url`` at
+``/api/thumbnails/<width>/<token>`` instead, where the token is the URL-safe
+base64 of the original URL. Each cover is fetched once, stored under the
+SHA-256 of its bytes and resized to WebP at the grid widths; the route serves
+those files with long-lived cache headers. Covers are prefetched by a small
+worker pool right after a crawl, and the directory is kept under
+``TIKTOK_THUMBNAIL_CACHE_BYTES`` by deleting the least recently used files.
+Only hosts in ``TIKTOK_THUMBNAIL_HOSTS`` are fetched, so the route cannot be
+used as an open proxy. Pillow is optional; without it the original cover is
+served as is.
+"""
+from __future__ import annotations
+
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional
+from urllib.parse import urlsplit
+
+import metrics
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - exercised only without the optional dependency
+    Image = ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_DIR = os.getenv("TIKTOK_THUMBNAIL_DIR", "")  # empty disables the service
+THUMBNAIL_CACHE_BYTES = int(os.getenv("TIKTOK_THUMBNAIL_CACHE_BYTES", str(512 * 1024 * 1024)))
+# Grid cells are 135x240; the larger width is for 2x displays.
+THUMBNAIL_WIDTHS = tuple(sorted({int(w) for w in os.getenv("TIKTOK_THUMBNAIL_WIDTHS", "135,270").split(",") if w.strip()}))
+THUMBNAIL_WIDTH = int(os.getenv("TIKTOK_THUMBNAIL_WIDTH", str(THUMBNAIL_WIDTHS[-1])))  # width used in thumbnail_url
+THUMBNAIL_ASPECT = 16 / 9  # height per unit of width
+THUMBNAIL_QUALITY = int(os.getenv("TIKTOK_THUMBNAIL_QUALITY", "80"))
+THUMBNAIL_BASE_URL = os.getenv("TIKTOK_THUMBNAIL_BASE_URL", "").rstrip("/")  # prefix for rewritten URLs
+THUMBNAIL_HOSTS = tuple(
+    host.strip().lower()
+    for host in os.getenv(
+        "TIKTOK_THUMBNAIL_HOSTS", "tiktokcdn.com,tiktokcdn-us.com,tiktokcdn-eu.com,ibyteimg.com,byteoversea.com,muscdn.com"
+    ).split(",")
+    if host.strip()
+)
+THUMBNAIL_FETCH_TIMEOUT = float(os.getenv("TIKTOK_THUMBNAIL_FETCH_TIMEOUT", "10"))  # seconds
+THUMBNAIL_MAX_SOURCE_BYTES = int(os.getenv("TIKTOK_THUMBNAIL_MAX_SOURCE_BYTES", str(5 * 1024 * 1024)))
+THUMBNAIL_PREFETCH_WORKERS = max(1, int(os.getenv("TIKTOK_THUMBNAIL_PREFETCH_WORKERS", "4")))
+THUMBNAIL_PREFETCH_QUEUE = int(os.getenv("TIKTOK_THUMBNAIL_PREFETCH_QUEUE", "512"))  # pending covers; more are dropped
+
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_LOCK_STRIPES = 64
+_EVICT_TO = 0.9  # eviction frees space down to this share of the budget
+
+_MAGIC = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF8", "image/gif"),
+)
+
+
+class ThumbnailError(Exception):
+    """Raised when a cover cannot be fetched or decoded."""
+
+
+@dataclass(slots=True)
+class Thumbnail:
+    body: bytes
+    content_type: str
+    etag: str
+
+
+def enabled() -> bool:
+    return bool(THUMBNAIL_DIR)
+
+
+def encode_token(url: str) -> str:
+    return base64.urlsafe_b64encode(url.encode("utf-8")).rstrip(b"=").decode("ascii")
+
+
+def decode_token(token: str) -> str:
+    try:
+        return base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode("utf-8")
+    except (binascii.Error, ValueError) as e:
+        raise ValueError("invalid thumbnail token") from e
+
+
+def allowed(url: str) -> bool:
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    return parts.scheme in ("http", "https") and any(host == h or host.endswith("." + h) for h in THUMBNAIL_HOSTS)
+
+
+def public_url(url: Optional[str], width: Optional[int] = None) -> Optional[str]:
+    """Where clients should load ``url`` from: the cached variant, or ``url`` itself if it cannot be cached."""
+    if not url or not enabled() or not allowed(url):
+        return url
+    return f"{THUMBNAIL_BASE_URL}/api/thumbnails/{width or THUMBNAIL_WIDTH}/{encode_token(url)}"
+
+
+def _sniff(data: bytes) -> str:
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    for magic, content_type in _MAGIC:
+        if data.startswith(magic):
+            return content_type
+    return "application/octet-stream"
+
+
+def _download(url: str) -> bytes:
+    # Redirects are not followed: they could lead to a host outside the allowlist.
+    import requests  # only workers that fetch covers pay for importing it
+
+    try:
+        with requests.get(url, timeout=THUMBNAIL_FETCH_TIMEOUT, stream=True, allow_redirects=False) as response:
+            response.raise_for_status()
+            chunks, size = [], 0
+            for chunk in response.iter_content(64 * 1024):
+                size += len(chunk)
+                if size > THUMBNAIL_MAX_SOURCE_BYTES:
+                    raise ThumbnailError(f"cover larger than {THUMBNAIL_MAX_SOURCE_BYTES} bytes: {url}")
+                chunks.append(chunk)
+    except requests.RequestException as e:
+        raise ThumbnailError(f"could not fetch cover {url}: {e}") from e
+    return b"".join(chunks)
+
+
+def _resize(data: bytes, width: int) -> bytes:
+    """Crop to the grid aspect ratio around the centre and encode as WebP."""
+    height = round(width * THUMBNAIL_ASPECT)
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.draft("RGB", (width, height))  # lets JPEG decode at a reduced scale
+            image = ImageOps.exif_transpose(image).convert("RGB")
+            image = ImageOps.fit(image, (width, height), Image.Resampling.LANCZOS)
+            out = io.BytesIO()
+            image.save(out, "WEBP", quality=THUMBNAIL_QUALITY)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise ThumbnailError(f"could not decode cover: {e}") from e
+    return out.getvalue()
+
+
+class ThumbnailStore:
+    """Content-addressed cover cache on disk.
+
+    ``urls/`` maps the SHA-256 of a cover URL to the SHA-256 of its bytes;
+    ``objects/`` holds the original under that digest and one ``.<width>.webp``
+    file per variant. Reads touch a file's mtime, and eviction deletes the
+    oldest files first; a mapping whose object was evicted is refetched.
+    A variant already on disk is served from the mapping alone, so it keeps
+    working after the URL's CDN signature has expired; reading it also touches
+    the original, which later widths are resized from.
+    """
+
+    def __init__(self, root: str, *, max_bytes: int, fetch: Callable[[str], bytes] = _download) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        self.fetch = fetch
+        self._bytes: Optional[int] = None  # counted lazily on the first write
+        self._size_lock = threading.Lock()
+        self._locks = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+        os.makedirs(os.path.join(root, "urls"), exist_ok=True)
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+
+    def get(self, url: str, width: int) -> Thumbnail:
+        """The ``width`` variant of ``url``, fetching and resizing it on first use."""
+        if Image is not None:
+            digest = self._mapped_digest(url)
+            body = None if digest is None else self._read_variant(digest, width)
+            if body is not None:
+                metrics.cache_result("thumbnail", "hit", tier="disk")
+                return Thumbnail(body=body, content_type="image/webp", etag=f"{digest}-{width}")
+        digest = self._source(url)
+        if Image is None:
+            body = self._read(self._object_path(digest))
+            return Thumbnail(body=body, content_type=_sniff(body), etag=digest)
+        return Thumbnail(body=self._variant(digest, width), content_type="image/webp", etag=f"{digest}-{width}")
+
+    def prefetch(self, url: str, widths: Iterable[int] = THUMBNAIL_WIDTHS) -> None:
+        digest = self._source(url)
+        if Image is not None:
+            for width in widths:
+                self._variant(digest, width)
+
+    # -- files -------------------------------------------------------------------
+
+    def _url_path(self, url: str) -> str:
+        return os.path.join(self.root, "urls", hashlib.sha256(url.encode("utf-8")).hexdigest())
+
+    def _object_path(self, digest: str, suffix: str = "") -> str:
+        return os.path.join(self.root, "objects", digest[:2], digest + suffix)
+
+    def _lock_for(self, key: str) -> threading.Lock:
+        return self._locks[hash(key) % _LOCK_STRIPES]
+
+    def _read(self, path: str) -> bytes:
+        with open(path, "rb") as f:
+            data = f.read()
+        self._touch(path)
+        return data
+
+    def _write(self, path: str, data: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._account(len(data))
+
+    def _touch(self, path: str) -> None:
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _mapped_digest(self, url: str) -> Optional[str]:
+        try:
+            return self._read(self._url_path(url)).decode("ascii", "replace")
+        except OSError:
+            return None
+
+    def _read_variant(self, digest: str, width: int) -> Optional[bytes]:
+        try:
+            body = self._read(self._object_path(digest, f".{width}.webp"))
+        except FileNotFoundError:
+            return None
+        self._touch(self._object_path(digest))
+        return body
+
+    def _source(self, url: str) -> str:
+        """Digest of the cover at ``url``, fetching it unless it is already on disk."""
+        url_path = self._url_path(url)
+        with self._lock_for(url_path):
+            try:
+                digest = self._read(url_path).decode("ascii", "replace")
+                if os.path.exists(self._object_path(digest)):
+                    metrics.cache_result("thumbnail", "hit", tier="disk")
+                    return digest
+            except OSError:
+                pass
+            metrics.cache_result("thumbnail", "miss", tier="disk")
+            with metrics.timed("thumbnail_fetch"):
+                data = self.fetch(url)
+            if not data:
+                raise ThumbnailError(f"empty cover: {url}")
+            digest = hashlib.sha256(data).hexdigest()
+            object_path = self._object_path(digest)
+            if not os.path.exists(object_path):  # identical covers under several URLs are stored once
+                self._write(object_path, data)
+            self._write(url_path, digest.encode("ascii"))
+            return digest
+
+    def _variant(self, digest: str, width: int) -> bytes:
+        path = self._object_path(digest, f".{width}.webp")
+        with self._lock_for(path):
+            body = self._read_variant(digest, width)
+            if body is not None:
+                return body
+            with metrics.timed("thumbnail_resize"):
+                body = _resize(self._read(self._object_path(digest)), width)
+            self._write(path, body)
+            return body
+
+    # -- eviction ----------------------------------------------------------------
+
+    def _files(self) -> list[tuple[float, int, str]]:
+        files = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith(".tmp"):
+                    continue  # still being written; os.replace() will move it into place
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def _account(self, added: int) -> None:
+        with self._size_lock:
+            if self._bytes is None:
+                self._bytes = sum(size for _, size, _ in self._files())
+            else:
+                self._bytes += added
+            if self._bytes <= self.max_bytes:
+                return
+            files = sorted(self._files())
+            self._bytes = sum(size for _, size, _ in files)
+            for _, size, path in files:
+                if self._bytes <= self.max_bytes * _EVICT_TO:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                self._bytes -= size
+            logger.info("Evicted thumbnails; cache now holds %d bytes", self._bytes)
+
+    def size_bytes(self) -> int:
+        with self._size_lock:
+            if self._bytes is None:
+                self._bytes = sum(size for _, size, _ in self._files())
+            return self._bytes
+
+
+class Prefetcher:
+    """Warms the store on a bounded pool; covers beyond ``max_pending`` queued ones are dropped."""
+
+    def __init__(self, store: Callable[[], Optional[ThumbnailStore]], *, workers: int, max_pending: int) -> None:
+        self.store = store
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumbnail-prefetch")
+        self._pending: set[str] = set()
+        self._lock = threading.Lock()
+
+    def submit(self, urls: Iterable[Optional[str]]) -> int:
+        """Queue the allowed ``urls``; returns how many were queued."""
+        queued = 0
+        for url in urls:
+            if not url or not allowed(url):
+                continue
+            with self._lock:
+                if url in self._pending or len(self._pending) >= self.max_pending:
+                    continue
+                self._pending.add(url)
+            self._executor.submit(self._run, url)
+            queued += 1
+        return queued
+
+    def _run(self, url: str) -> None:
+        try:
+            store = self.store()
+            if store is not None:
+                store.prefetch(url)
+        except (ThumbnailError, OSError) as e:
+            logger.warning("Thumbnail prefetch failed: %s", e)
+        finally:
+            with self._lock:
+                self._pending.discard(url)
+
+    def join(self) -> None:
+        """Wait until everything queued so far has run."""
+        while True:
+            with self._lock:
+                if not self._pending:
+                    return
+            time.sleep(0.01)
+
+
+_store: Optional[ThumbnailStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> Optional[ThumbnailStore]:
+    global _store
+    if not enabled():
+        return None
+    with _store_lock:
+        if _store is None:
+            try:
+                _store = ThumbnailStore(THUMBNAIL_DIR, max_bytes=THUMBNAIL_CACHE_BYTES)
+            except OSError as e:
+                logger.error("Could not open thumbnail cache at %s: %s", THUMBNAIL_DIR, e)
+                return None
+        return _store
+
+
+_prefetcher = Prefetcher(get_store, workers=THUMBNAIL_PREFETCH_WORKERS, max_pending=THUMBNAIL_PREFETCH_QUEUE)
+
+
+def get(url: str, width: int) -> Thumbnail:
+    store = get_store()
+    if store is None:
+        raise ThumbnailError("thumbnail cache is unavailable")
+    return store.get(url, width)
+
+
+def prefetch(urls: Iterable[Optional[str]]) -> int:
+    """Fetch and resize covers in the background; a no-op when the service is disabled."""
+    if not enabled():
+        return 0
+    return _prefetcher.submit(urls)
@@ -0,0 +1,131 @@
+"""Durable SQLite index of every crawled video.
+
+Redis only holds the latest result per keyword; this index keeps one row per
+``video_id`` across crawls, with the keywords it was found under and when it
+was first and last seen. It answers ad-hoc queries (by author, new since a
+given time) and lets ``get_tiktok_videos`` answer from disk while Redis is
+empty. The database runs in WAL mode so readers in other processes are not
+blocked by a crawl writing to it.
+"""
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, List, Optional, Sequence
+
+from cache_codec import FIELDS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    video_id TEXT PRIMARY KEY,
+    video_url TEXT NOT NULL,
+    author_id TEXT NOT NULL,
+    thumbnail_url TEXT,
+    title TEXT,
+    download_url TEXT,
+    play_url TEXT,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_videos_author ON videos (author_id, last_seen DESC);
+CREATE INDEX IF NOT EXISTS idx_videos_first_seen ON videos (first_seen);
+
+CREATE TABLE IF NOT EXISTS keyword_videos (
+    keyword TEXT NOT NULL,
+    video_id TEXT NOT NULL REFERENCES videos (video_id),
+    position INTEGER NOT NULL,
+    last_seen REAL NOT NULL,
+    PRIMARY KEY (keyword, video_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_keyword_videos_rank ON keyword_videos (keyword, last_seen DESC, position);
+"""
+
+_COLUMNS = ", ".join(f"v.{name}" for name in FIELDS)
+
+_UPSERT_VIDEO = f"""
+INSERT INTO videos ({", ".join(FIELDS)}, first_seen, last_seen)
+VALUES ({", ".join("?" for _ in FIELDS)}, ?, ?)
+ON CONFLICT (video_id) DO UPDATE SET
+    {", ".join(f"{name} = excluded.{name}" for name in FIELDS[1:])},
+    last_seen = excluded.last_seen
+"""
+
+_UPSERT_MEMBERSHIP = """
+INSERT INTO keyword_videos (keyword, video_id, position, last_seen) VALUES (?, ?, ?, ?)
+ON CONFLICT (keyword, video_id) DO UPDATE SET position = excluded.position, last_seen = excluded.last_seen
+"""
+
+
+class VideoIndex:
+    """Thread-safe wrapper around one SQLite connection; rows are tuples in ``FIELDS`` order."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def upsert(self, keyword: str, rows: Sequence[tuple], *, seen_at: Optional[float] = None) -> None:
+        """Record one crawl of ``keyword``; ``rows`` keep their crawl order as the keyword ranking."""
+        if not rows:
+            return
+        seen_at = time.time() if seen_at is None else seen_at
+        keyword = keyword.lower()
+        with self._lock, self._conn:
+            self._conn.executemany(_UPSERT_VIDEO, [(*row, seen_at, seen_at) for row in rows])
+            self._conn.executemany(
+                _UPSERT_MEMBERSHIP,
+                [(keyword, row[0], position, seen_at) for position, row in enumerate(rows)],
+            )
+
+    def keyword_rows(self, keyword: str, limit: int) -> tuple[List[tuple], Optional[float]]:
+        """Videos of the latest crawls of ``keyword`` in crawl order, and when it was last crawled."""
+        return self._ranked(
+            f"""SELECT {_COLUMNS}, k.last_seen FROM keyword_videos k JOIN videos v USING (video_id)
+                WHERE k.keyword = ? ORDER BY k.last_seen DESC, k.position LIMIT ?""",
+            (keyword.lower(), limit),
+        )
+
+    def query(
+        self,
+        *,
+        keyword: Optional[str] = None,
+        author: Optional[str] = None,
+        since: Optional[float] = None,
+        limit: int = 100,
+    ) -> List[tuple]:
+        """Videos matching every given filter; newest first when ``since`` is given, else most recently seen."""
+        sql = f"SELECT {_COLUMNS}, v.last_seen FROM videos v"
+        where: list[str] = []
+        params: list[object] = []
+        if keyword is not None:
+            sql += " JOIN keyword_videos k USING (video_id)"
+            where.append("k.keyword = ?")
+            params.append(keyword.lower())
+        if author is not None:
+            where.append("v.author_id = ?")
+            params.append(author)
+        if since is not None:
+            where.append("v.first_seen >= ?")
+            params.append(since)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {'v.first_seen' if since is not None else 'v.last_seen'} DESC LIMIT ?"
+        return self._ranked(sql, (*params, limit))[0]
+
+    def _ranked(self, sql: str, params: Iterable[object]) -> tuple[List[tuple], Optional[float]]:
+        with self._lock:
+            results = self._conn.execute(sql, tuple(params)).fetchall()
+        if not results:
+            return [], None
+        return [row[:-1] for row in results], max(row[-1] for row in results)
@@ -0,0 +1,210 @@
+"""Query popularity tracking and predictive cache warming.
+
+Web workers count the queries they serve in memory and add the counts to the
+Redis sorted set ``tiktok:popular`` every few seconds, so recording costs no
+Redis round-trip on the request path. Scores decay with a half-life and the
+set keeps only the most popular queries.
+
+The warmer (``python api/crawler.py --warm``) runs apart from the web workers.
+Each pass re-crawls the keywords of the top queries whose cache entries are
+missing or about to turn stale, at most ``--warm-budget`` keywords per pass.
+``DEFAULT_KEYWORD`` is always included, so a pass right after a deploy or a
+Redis flush still warms the front page.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+import redis
+
+import crawler
+from crawler import BatchQuery
+
+logger = logging.getLogger(__name__)
+
+POPULAR_KEY = "tiktok:popular"
+POPULAR_DECAYED_AT_KEY = "tiktok:popular:decayed_at"
+POPULARITY_HALF_LIFE = float(os.getenv("TIKTOK_POPULARITY_HALF_LIFE", "86400"))  # seconds
+POPULARITY_MAX_QUERIES = int(os.getenv("TIKTOK_POPULARITY_MAX_QUERIES", "1000"))
+POPULARITY_FLUSH_INTERVAL = float(os.getenv("TIKTOK_POPULARITY_FLUSH_INTERVAL", "10"))  # seconds
+
+WARM_TOP = int(os.getenv("TIKTOK_WARM_TOP", "20"))  # popular queries considered per pass
+WARM_BUDGET = int(os.getenv("TIKTOK_WARM_BUDGET", "30"))  # keyword crawls per pass
+WARM_LEAD = float(os.getenv("TIKTOK_WARM_LEAD", "300"))  # seconds before the soft TTL an entry is re-crawled
+WARM_INTERVAL = float(os.getenv("TIKTOK_WARM_INTERVAL", "0"))  # seconds between passes; 0 runs once
+WARM_DEFAULT_LIMIT = 100  # /api/videos default
+WARM_MAX_LIMIT = int(os.getenv("TIKTOK_WARM_MAX_LIMIT", "200"))  # larger recorded limits are warmed up to this
+
+# KEYS[1] = popularity zset, KEYS[2] = time of the last decay; ARGV = now, half-life, max members.
+# Scales every score by the decay since the last call, then drops all but the top members.
+DECAY_SCRIPT = """
+local now = tonumber(ARGV[1])
+local last = tonumber(redis.call('GET', KEYS[2]) or ARGV[1])
+redis.call('SET', KEYS[2], ARGV[1])
+local factor = 0.5 ^ (math.max(0, now - last) / tonumber(ARGV[2]))
+if factor < 1 then
+    redis.call('ZUNIONSTORE', KEYS[1], 1, KEYS[1], 'WEIGHTS', tostring(factor))
+end
+redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -tonumber(ARGV[3]) - 1)
+return tostring(factor)
+"""
+
+
+def _member(keywords: List[str], limit: int) -> str:
+    # Keywords never contain commas: /api/videos splits q on them.
+    return f"{limit}:{','.join(keyword.lower() for keyword in keywords)}"
+
+
+def _parse_member(member: str) -> tuple[List[str], int]:
+    limit, _, keywords = member.partition(":")
+    return keywords.split(","), int(limit)
+
+
+class QueryRecorder:
+    """Counts queries in memory and adds them to the popularity set from a background thread."""
+
+    def __init__(
+        self,
+        client: Callable[[], Optional[redis.Redis]],
+        *,
+        key: str = POPULAR_KEY,
+        interval: float = POPULARITY_FLUSH_INTERVAL,
+        max_pending: int = 10_000,
+    ) -> None:
+        self.client = client
+        self.key = key
+        self.interval = interval
+        self.max_pending = max_pending
+        self._counts: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def record(self, keywords: List[str], limit: int) -> None:
+        member = _member(keywords, limit)
+        with self._lock:
+            if member in self._counts or len(self._counts) < self.max_pending:
+                self._counts[member] = self._counts.get(member, 0) + 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="query-recorder", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def flush(self) -> int:
+        """Send the pending counts; returns how many queries were sent. Counts are dropped on errors."""
+        with self._lock:
+            counts, self._counts = self._counts, {}
+        client = self.client()
+        if not counts or client is None:
+            return 0
+        try:
+            pipe = client.pipeline(transaction=False)
+            for member, count in counts.items():
+                pipe.zincrby(self.key, count, member)
+            pipe.execute()
+        except redis.exceptions.RedisError as e:
+            logger.error("Redis ZINCRBY operation failed: %s", e)
+            return 0
+        return len(counts)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+
+_recorder = QueryRecorder(lambda: crawler.redis_client)
+
+
+def record_query(keywords: List[str], limit: int) -> None:
+    """Count one served query towards its popularity; never touches Redis on the calling thread."""
+    normalised = crawler._normalise_keywords(keywords)
+    if normalised and limit > 0:
+        _recorder.record(normalised, limit)
+
+
+def popular_queries(client: redis.Redis, top: int) -> list[tuple[List[str], int]]:
+    """The ``top`` most popular (keywords, limit) pairs, after applying the decay since the last call."""
+    try:
+        client.eval(
+            DECAY_SCRIPT, 2, POPULAR_KEY, POPULAR_DECAYED_AT_KEY, time.time(), POPULARITY_HALF_LIFE, POPULARITY_MAX_QUERIES
+        )
+        members = client.zrevrange(POPULAR_KEY, 0, top - 1) if top > 0 else []
+    except redis.exceptions.RedisError as e:
+        logger.error("Redis popularity lookup failed: %s", e)
+        return []
+    queries = []
+    for member in members:
+        try:
+            queries.append(_parse_member(member.decode("utf-8") if isinstance(member, bytes) else member))
+        except ValueError:
+            logger.warning("Ignoring malformed popularity entry %r", member)
+    return queries
+
+
+@dataclass(slots=True)
+class WarmReport:
+    considered: int = 0
+    warmed: List[str] = field(default_factory=list)
+    failed: List[str] = field(default_factory=list)
+    over_budget: List[str] = field(default_factory=list)
+
+
+def _due(entry, num_videos: int, lead: float) -> bool:
+    if entry is None or not crawler._entry_covers(entry, num_videos):
+        return True
+    cache_age = crawler._entry_age(entry)
+    return cache_age is None or cache_age >= crawler.CACHE_TTL - lead
+
+
+def warm(*, top: int = WARM_TOP, budget: int = WARM_BUDGET, lead: float = WARM_LEAD) -> WarmReport:
+    """Re-crawl keywords of popular queries that are missing or will turn stale within ``lead`` seconds."""
+    report = WarmReport()
+    client = crawler.redis_client
+    if client is None:
+        logger.warning("Redis is unavailable; nothing to warm")
+        return report
+
+    seed = (crawler._normalise_keywords(crawler.DEFAULT_KEYWORD), WARM_DEFAULT_LIMIT)
+    wanted: dict[str, int] = {}  # keyword -> videos to keep cached, most popular first
+    for keywords, limit in [*popular_queries(client, top), seed]:
+        for keyword in keywords:
+            keyword = keyword.lower()
+            wanted[keyword] = max(wanted.get(keyword, 0), min(limit, WARM_MAX_LIMIT))
+    report.considered = len(wanted)
+
+    keys = [crawler._cache_key(keyword, None) for keyword in wanted]
+    entries, _, _ = crawler._lookup_entries(keys, use_local=False)
+    due = [keyword for keyword, entry in zip(wanted, entries) if _due(entry, wanted[keyword], lead)]
+    crawl, report.over_budget = due[:max(0, budget)], due[max(0, budget):]
+    if not crawl:
+        return report
+
+    logger.info("Warming %d of %d popular keywords", len(crawl), len(wanted))
+    results = crawler.get_tiktok_videos_batch(
+        [BatchQuery(keywords=[keyword], num_videos=wanted[keyword], force_refresh=True) for keyword in crawl]
+    )
+    for keyword, result in zip(crawl, results):
+        (report.failed if result.error else report.warmed).append(keyword)
+    return report
+
+
+def run(*, interval: float = WARM_INTERVAL, top: int = WARM_TOP, budget: int = WARM_BUDGET, lead: float = WARM_LEAD) -> int:
+    """Warm once, or every ``interval`` seconds starting immediately; returns a process exit code."""
+    while True:
+        report = warm(top=top, budget=budget, lead=lead)
+        logger.info(
+            "Warm pass: %d keywords considered, %d warmed, %d failed, %d left over the budget",
+            report.considered,
+            len(report.warmed),
+            len(report.failed),
+            len(report.over_budget),
+        )
+        if interval <= 0:
+            return 1 if report.failed and not report.warmed else 0
+        time.sleep(interval)
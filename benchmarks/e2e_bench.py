@@ -0,0 +1,206 @@
+"""End-to-end latency and throughput of the crawler and /api/videos, fully offline.
+
+    python benchmarks/e2e_bench.py [--requests 200] [--concurrency 8] [--latency-ms 50]
+                                   [--error-rate 0] [--redis-url redis://localhost:6379/15]
+
+TikTok search is served by ``fake_tiktok.FakeSearchServer`` and Redis by the
+in-memory ``FakeRedis`` from the test suite, or by a real server with
+``--redis-url``. Use a dedicated database for that: benchmark keys are left to
+expire on their own. Each target is measured under three workloads:
+
+* cold: every request uses a keyword nobody has asked for, so each one crawls;
+* warm: requests cycle over keywords that were crawled beforehand;
+* mixed: one to three keywords per query from a pool of which half was crawled
+  beforehand, sometimes with a brand-new keyword mixed in.
+
+``crawler`` calls ``get_tiktok_videos`` directly; ``app`` issues
+``GET /api/videos`` through the Flask test client.
+"""
+from __future__ import annotations
+
+import argparse
+import functools
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "api"))
+sys.path.insert(0, os.path.join(ROOT, "tests"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import crawler  # noqa: E402
+from app import app as flask_app  # noqa: E402
+from fake_tiktok import FakeSearchConfig, FakeSearchServer, FakeTikTokApi  # noqa: E402
+
+Query = list[str]
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    cuts = statistics.quantiles(samples, n=100, method="inclusive") if len(samples) > 1 else samples * 99
+    return {"p50": cuts[49], "p95": cuts[94], "p99": cuts[98]}
+
+
+def run_workload(call: Callable[[Query], int], queries: list[Query], concurrency: int) -> dict[str, float]:
+    latencies: list[float] = []
+    videos: list[int] = []
+
+    def timed(query: Query) -> None:
+        start = time.perf_counter()
+        videos.append(call(query))
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(timed, queries))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": len(queries),
+        **{f"{name}_ms": value for name, value in percentiles(latencies).items()},
+        "throughput_rps": len(queries) / elapsed,
+        "empty": sum(1 for count in videos if count == 0),
+    }
+
+
+def _crawler_call(limit: int) -> Callable[[Query], int]:
+    def call(query: Query) -> int:
+        return len(crawler.get_tiktok_videos(query, num_videos=limit).videos)
+    return call
+
+
+def _app_call(limit: int) -> Callable[[Query], int]:
+    client = flask_app.test_client()
+
+    def call(query: Query) -> int:
+        response = client.get("/api/videos", query_string={"q": ",".join(query), "limit": limit})
+        return len(response.get_json()["videos"]) if response.status_code == 200 else 0
+    return call
+
+
+def build_workloads(target: str, requests: int, rng: random.Random) -> dict[str, tuple[list[Query], list[Query]]]:
+    """Workload name -> (queries run beforehand to warm caches, measured queries)."""
+    pool = [f"{target}-warm-{i}" for i in range(20)]
+    warm = [[pool[i % len(pool)]] for i in range(requests)]
+    # Half of the mixed pool is primed; the rest, plus the occasional new keyword, crawls on first use.
+    mixed_pool = [f"{target}-mixed-{i}" for i in range(20)]
+    mixed = []
+    for i in range(requests):
+        query = rng.sample(mixed_pool, rng.randint(1, 3))
+        if rng.random() < 0.2:
+            query.insert(rng.randint(0, len(query)), f"{target}-mixed-new-{i}")
+        mixed.append(query)
+    return {
+        "cold": ([], [[f"{target}-cold-{i}"] for i in range(requests)]),
+        "warm": ([[keyword] for keyword in pool], warm),
+        "mixed": ([[keyword] for keyword in mixed_pool[:10]], mixed),
+    }
+
+
+def run_suite(
+    *,
+    requests: int = 200,
+    concurrency: int = 8,
+    limit: int = 24,
+    config: Optional[FakeSearchConfig] = None,
+    redis_url: Optional[str] = None,
+    pool_size: Optional[int] = None,
+    rate_limit: float = 0.0,
+    seed: int = 0,
+) -> dict[str, dict[str, dict[str, float]]]:
+    if redis_url:
+        import redis
+        redis_client = redis.Redis.from_url(redis_url)
+    else:
+        from fakes import FakeRedis
+        redis_client = FakeRedis()
+
+    rng = random.Random(seed)
+    run_id = f"{int(time.time())}-{seed}"  # keeps keywords unique across runs against a real Redis
+    results: dict[str, dict[str, dict[str, float]]] = {}
+    saved = (crawler.TikTokApi, crawler.redis_client, crawler.POOL_SIZE, crawler.RATE_LIMIT, crawler._rate_limiter,
+             crawler.NEAR_DUP_THRESHOLD)
+    with FakeSearchServer(config) as server:
+        crawler.TikTokApi = functools.partial(FakeTikTokApi, server.base_url)
+        crawler.redis_client = redis_client
+        crawler.RATE_LIMIT, crawler._rate_limiter = rate_limit, None
+        # The fake server repeats fixture titles under new ids; those are not reuploads.
+        crawler.NEAR_DUP_THRESHOLD = 0
+        if pool_size is not None:
+            crawler.POOL_SIZE = pool_size
+        try:
+            for target, make_call in (("crawler", _crawler_call), ("app", _app_call)):
+                call = make_call(limit)
+                results[target] = {}
+                for workload, (prime, queries) in build_workloads(f"{run_id}-{target}", requests, rng).items():
+                    for query in prime:
+                        call(query)
+                    before = server.requests
+                    stats = run_workload(call, queries, concurrency)
+                    stats["upstream_requests"] = server.requests - before
+                    results[target][workload] = stats
+        finally:
+            if crawler._session_pool is not None:
+                crawler._session_pool.close()
+                crawler._session_pool = None
+            (crawler.TikTokApi, crawler.redis_client, crawler.POOL_SIZE,
+             crawler.RATE_LIMIT, crawler._rate_limiter, crawler.NEAR_DUP_THRESHOLD) = saved
+    return results
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per workload")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--limit", type=int, default=24, help="Videos per query")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Fake search latency")
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--max-pages", type=int, default=10, help="Pages before has_more turns 0")
+    parser.add_argument("--stagnant-cursor", action="store_true")
+    parser.add_argument("--pool-size", type=int, help="Override TIKTOK_POOL_SIZE")
+    parser.add_argument(
+        "--rate-limit", type=float, default=0.0, help="Search requests per second (default: unpaced)"
+    )
+    parser.add_argument("--redis-url", help="Use a real Redis instead of the in-memory fake")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args(argv)
+
+    config = FakeSearchConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        max_pages=args.max_pages,
+        stagnant_cursor=args.stagnant_cursor,
+        seed=args.seed,
+    )
+    results = run_suite(
+        requests=args.requests,
+        concurrency=args.concurrency,
+        limit=args.limit,
+        config=config,
+        redis_url=args.redis_url,
+        pool_size=args.pool_size,
+        rate_limit=args.rate_limit,
+        seed=args.seed,
+    )
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"{'target':<9}{'workload':<9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'upstream':>10}{'empty':>7}")
+    for target, workloads in results.items():
+        for workload, row in workloads.items():
+            print(
+                f"{target:<9}{workload:<9}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}"
+                f"{row['throughput_rps']:>9.1f}{row['upstream_requests']:>10}{row['empty']:>7}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
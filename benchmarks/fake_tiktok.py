@@ -0,0 +1,148 @@
+"""Local stand-ins for TikTok search used by the end-to-end benchmark.
+
+:class:`FakeSearchServer` replays the recorded pages in ``fixtures/`` over HTTP
+at ``/api/search/general/full/``. Video ids are rewritten per keyword and offset,
+so different keywords and pages never deduplicate against each other.
+:class:`FakeTikTokApi` implements the part of ``TikTokApi`` the crawler uses and
+sends ``make_request`` to that server instead of a browser session.
+"""
+from __future__ import annotations
+
+import glob
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+_ID_PREFIX = b"756281957047456"  # shared prefix of every id in the fixtures
+
+
+@dataclass(slots=True)
+class FakeSearchConfig:
+    latency_ms: float = 50.0
+    jitter_ms: float = 20.0
+    error_rate: float = 0.0  # share of requests answered with HTTP 500
+    max_pages: int = 10  # has_more turns 0 on this page
+    stagnant_cursor: bool = False  # return the requested offset as the next cursor
+    seed: int = 0
+
+
+class FakeSearchServer:
+    """Threaded HTTP server replaying fixture pages; use as a context manager."""
+
+    def __init__(self, config: Optional[FakeSearchConfig] = None, fixtures_dir: str = FIXTURES) -> None:
+        self.config = config or FakeSearchConfig()
+        self.pages = []
+        for path in sorted(glob.glob(os.path.join(fixtures_dir, "search_response_*.json"))):
+            with open(path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+            self.pages.append((json.dumps(payload["data"]).encode("utf-8"), len(payload["data"])))
+        if not self.pages:
+            raise FileNotFoundError(f"no search_response_*.json fixtures in {fixtures_dir}")
+        self.requests = 0
+        self._random = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "FakeSearchServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-tiktok", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def respond(self, keyword: str, offset: int) -> tuple[int, bytes]:
+        config = self.config
+        with self._lock:
+            self.requests += 1
+            delay = max(0.0, config.latency_ms + self._random.uniform(-config.jitter_ms, config.jitter_ms)) / 1000
+            failed = self._random.random() < config.error_rate
+        time.sleep(delay)
+        if failed:
+            return 500, b'{"status_code": 10000, "status_msg": "injected error"}'
+
+        page_size = self.pages[0][1]
+        page = offset // page_size
+        data, count = self.pages[page % len(self.pages)]
+        digest = int(hashlib.blake2b(f"{keyword.lower()}:{page}".encode("utf-8"), digest_size=6).hexdigest(), 16)
+        data = data.replace(_ID_PREFIX, str(digest % 10**15).zfill(15).encode("ascii"))
+        has_more = 1 if page + 1 < config.max_pages else 0
+        cursor = offset if config.stagnant_cursor else offset + count
+        body = b'{"status_code":0,"has_more":%d,"cursor":%d,"data":%s}' % (has_more, cursor, data)
+        return 200, body
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self) -> None:  # noqa: N802
+                query = parse_qs(urlsplit(self.path).query)
+                status, body = server.respond(query.get("keyword", [""])[0], int(query.get("offset", ["0"])[0]))
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: object) -> None:
+                pass
+
+        return Handler
+
+
+class FakeTikTokApi:
+    """Drop-in for ``TikTokApi`` that talks to a :class:`FakeSearchServer`.
+
+    The crawler constructs ``TikTokApi()`` without arguments, so bind the server
+    first: ``functools.partial(FakeTikTokApi, server.base_url)``.
+    """
+
+    def __init__(self, base_url: str) -> None:
+        self.base_url = base_url
+        self._client: Optional[httpx.AsyncClient] = None
+        self.num_sessions = 0
+
+    async def __aenter__(self) -> "FakeTikTokApi":
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.close_sessions()
+
+    async def create_sessions(self, num_sessions: int = 1, sleep_after: int = 0, **kwargs: object) -> None:
+        self._client = httpx.AsyncClient(base_url=self.base_url, timeout=30.0)
+        self.num_sessions = num_sessions
+
+    async def make_request(self, url: str, params: dict, session_index: int = 0, **kwargs: object) -> dict:
+        assert self._client is not None, "create_sessions() was not called"
+        response = await self._client.get(urlsplit(url).path, params=params)
+        if response.status_code != 200:
+            raise RuntimeError(f"search returned HTTP {response.status_code}")
+        return response.json()
+
+    async def health_check(self) -> dict:
+        return {"healthy_sessions": self.num_sessions if self._client is not None else 0}
+
+    async def close_sessions(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,175 @@
+"""Compare the search-response parser against the original implementation.
+
+    python benchmarks/parser_bench.py [--iterations 200] [--fixtures DIR]
+
+Each fixture is a full ``/api/search/general/full/`` response body (anonymised,
+with every field TikTok sends kept in place). Both implementations first decode
+the raw body and then extract videos; "extract" numbers start from the decoded
+dict, which is what the crawler receives from TikTokApi. Allocation figures are
+the tracemalloc peak for a single parse of all fixtures.
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Callable, Iterable, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "api"))
+
+import search_parser  # noqa: E402
+from crawler import TikTokVideo, _extract_videos  # noqa: E402
+
+
+# -- original implementation, kept verbatim as the baseline -----------------
+
+def _legacy_normalise_thumbnail(candidate: object) -> Optional[str]:
+    def _pick_from_mapping(mapping: dict) -> Optional[str]:
+        values_to_try = [
+            mapping.get("url"),
+            mapping.get("thumbUrl"),
+            mapping.get("thumb_url"),
+            mapping.get("cover"),
+            mapping.get("origin"),
+            mapping.get("uri"),
+            mapping.get("urlList"),
+            mapping.get("url_list"),
+            mapping.get("urls"),
+        ]
+        for value in values_to_try:
+            normalised = _legacy_normalise_thumbnail(value)
+            if normalised:
+                return normalised
+        return None
+
+    if isinstance(candidate, str):
+        candidate = candidate.strip()
+        return candidate or None
+    if isinstance(candidate, dict):
+        return _pick_from_mapping(candidate)
+    if isinstance(candidate, (list, tuple, set)):
+        for item in candidate:
+            normalised = _legacy_normalise_thumbnail(item)
+            if normalised:
+                return normalised
+        return None
+    return None
+
+
+def _legacy_extract_videos(data_block: Iterable[dict[str, object]]) -> list[TikTokVideo]:
+    videos: list[TikTokVideo] = []
+    for entry in data_block:
+        if not isinstance(entry, dict):
+            continue
+        if entry.get("type") != 1:
+            continue
+        item = entry.get("item") or {}
+        video_id = str(item.get("id") or "").strip()
+        if not video_id:
+            continue
+        author = item.get("author") or {}
+        author_id = str(author.get("uniqueId") or author.get("id") or "unknown")
+        video_meta = item.get("video") or {}
+        cover = _legacy_normalise_thumbnail(
+            video_meta.get("originCover") or video_meta.get("cover") or video_meta.get("dynamicCover")
+        )
+        download_url = (
+            video_meta.get("downloadAddr")
+            or video_meta.get("downloadAddrH265")
+            or video_meta.get("downloadAddrWatermark")
+        )
+        play_url = (
+            video_meta.get("playAddr")
+            or video_meta.get("playAddrH265")
+            or video_meta.get("playApiHref")
+        )
+        videos.append(
+            TikTokVideo(
+                video_id=video_id,
+                video_url=f"https://www.tiktok.com/@{author_id}/video/{video_id}",
+                author_id=author_id,
+                thumbnail_url=cover,
+                title=item.get("desc") or None,
+                download_url=download_url,
+                play_url=play_url,
+            )
+        )
+    return videos
+
+
+# -- harness --------------------------------------------------------------------
+
+def _time(fn: Callable[[], int], iterations: int) -> tuple[float, int]:
+    videos = 0
+    start = time.perf_counter()
+    for _ in range(iterations):
+        videos += fn()
+    return time.perf_counter() - start, videos
+
+
+def _peak_bytes(fn: Callable[[], int]) -> int:
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(fixtures: list[bytes], iterations: int) -> dict[str, dict[str, float]]:
+    decoded = [json.loads(raw) for raw in fixtures]
+    for payload in decoded:
+        if _legacy_extract_videos(payload["data"]) != _extract_videos(payload["data"]):
+            raise SystemExit("parser output differs from the original implementation")
+
+    cases = {
+        "legacy decode+extract": lambda: sum(len(_legacy_extract_videos(json.loads(raw)["data"])) for raw in fixtures),
+        "fast decode+extract": lambda: sum(len(_extract_videos(search_parser.loads(raw)["data"])) for raw in fixtures),
+        "legacy extract": lambda: sum(len(_legacy_extract_videos(payload["data"])) for payload in decoded),
+        "fast extract": lambda: sum(len(_extract_videos(payload["data"])) for payload in decoded),
+    }
+    results = {}
+    for name, fn in cases.items():
+        fn()  # warm up
+        elapsed, videos = _time(fn, iterations)
+        results[name] = {
+            "videos_per_second": videos / elapsed,
+            "peak_kib_per_parse": _peak_bytes(fn) / 1024,
+        }
+    return results
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--fixtures", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures"))
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args(argv)
+
+    paths = sorted(glob.glob(os.path.join(args.fixtures, "search_response_*.json")))
+    if not paths:
+        parser.error(f"no search_response_*.json fixtures in {args.fixtures}")
+    fixtures = []
+    for path in paths:
+        with open(path, "rb") as f:
+            fixtures.append(f.read())
+
+    results = run(fixtures, args.iterations)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"{len(fixtures)} fixtures, {args.iterations} iterations, orjson={'yes' if search_parser.orjson else 'no'}")
+    print(f"{'case':<24}{'videos/s':>14}{'peak KiB':>12}")
+    for name, row in results.items():
+        print(f"{name:<24}{row['videos_per_second']:>14,.0f}{row['peak_kib_per_parse']:>12,.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,108 @@
+"""Worker boot time: importing the app and serving the first request, fully offline.
+
+    python benchmarks/startup_bench.py [--samples 5] [--module app] [--redis-host 10.255.255.1]
+
+Every sample is a fresh interpreter, so nothing is shared with earlier samples
+or with the module cache of this process. The child reports:
+
+* import_ms: ``import <module>`` (``app``, ``asgi`` or ``crawler``);
+* first_request_ms: from before that import until the first ``GET /api/videos``
+  has been answered, crawling ``fake_tiktok.FakeSearchServer``;
+* tiktokapi_import_ms: importing ``TikTokApi`` afterwards, i.e. the cost a
+  lazy import moves from boot to the first real crawl.
+
+Point ``--redis-host`` at an unroutable address to see what a slow or missing
+Redis does to boot time. The default is whatever ``REDIS_HOST`` says.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+FIELDS = ("import_ms", "first_request_ms", "tiktokapi_import_ms")
+
+
+def child(module: str) -> dict[str, float]:
+    sys.path[:0] = [os.path.join(ROOT, "api"), BENCHMARKS]
+    import functools
+
+    from fake_tiktok import FakeSearchConfig, FakeSearchServer, FakeTikTokApi
+
+    with FakeSearchServer(FakeSearchConfig(latency_ms=0, jitter_ms=0)) as server:
+        start = time.perf_counter()
+        __import__(module)
+        imported = time.perf_counter()
+
+        import crawler
+        from app import app as flask_app
+
+        crawler.TikTokApi = functools.partial(FakeTikTokApi, server.base_url)
+        crawler.POOL_SIZE, crawler.RATE_LIMIT, crawler.VIDEO_INDEX_PATH = 0, 0, ""
+        response = flask_app.test_client().get("/api/videos", query_string={"q": "startup", "limit": 12})
+        if response.status_code != 200 or not response.get_json()["videos"]:
+            raise RuntimeError(f"first request failed: {response.status_code} {response.get_data(as_text=True)}")
+        served = time.perf_counter()
+
+    before = time.perf_counter()
+    import TikTokApi  # noqa: F401
+    deferred = time.perf_counter() - before
+    return {
+        "import_ms": (imported - start) * 1000,
+        "first_request_ms": (served - start) * 1000,
+        "tiktokapi_import_ms": deferred * 1000,
+    }
+
+
+def run(*, samples: int = 5, module: str = "app", redis_host: Optional[str] = None) -> dict[str, dict[str, float]]:
+    env = dict(os.environ, TIKTOK_VIDEO_INDEX="", TIKTOK_THUMBNAIL_DIR="")
+    if redis_host is not None:
+        env["REDIS_HOST"] = redis_host
+    rows = []
+    for _ in range(samples):
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", "--module", module],
+            env=env,
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        rows.append(json.loads(out.strip().splitlines()[-1]))
+    return {
+        name: {"median": statistics.median(row[name] for row in rows), "max": max(row[name] for row in rows)}
+        for name in FIELDS
+    }
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", type=int, default=5, help="Fresh interpreters to start")
+    parser.add_argument("--module", default="app", choices=("app", "asgi", "crawler"))
+    parser.add_argument("--redis-host", help="Override REDIS_HOST for the children")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(child(args.module)))
+        return 0
+    results = run(samples=args.samples, module=args.module, redis_host=args.redis_host)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"{'metric':<22}{'median ms':>11}{'max ms':>10}")
+    for name, row in results.items():
+        print(f"{name:<22}{row['median']:>11.1f}{row['max']:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
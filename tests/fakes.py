@@ -0,0 +1,345 @@
+"""In-memory stand-ins shared by the test modules."""
+import threading
+import time
+from unittest.mock import patch
+
+import redis
+
+from crawl_queue import CLAIM_SCRIPT, ENQUEUE_SCRIPT, EXTEND_SCRIPT
+from rate_limit import DECREASE_SCRIPT, TOKEN_BUCKET_SCRIPT
+from singleflight import ACQUIRE_SCRIPT, FENCED_SET_SCRIPT, INCR_SCRIPT, RELEASE_SCRIPT
+from warmer import DECAY_SCRIPT
+
+
+def disable_pacing(test):
+    """Turn off the search rate limiter and retry backoff for the duration of ``test``."""
+    for name in ("RATE_LIMIT", "RETRY_BASE_DELAY"):
+        patcher = patch(f"crawler.{name}", 0)
+        patcher.start()
+        test.addCleanup(patcher.stop)
+
+
+class FakeRedis:
+    """Just enough of redis.Redis for the crawler, including our Lua scripts."""
+
+    def __init__(self):
+        self._data = {}
+        self._hashes = {}
+        self._zsets = {}
+        self._expires = {}
+        self._subscribers = {}
+        self._lock = threading.RLock()
+        self.fail = False
+
+    def _check(self):
+        if self.fail:
+            raise redis.exceptions.ConnectionError("fake redis is down")
+
+    def _alive(self, key):
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return key in self._data
+
+    @staticmethod
+    def _encode(value):
+        if isinstance(value, bytes):
+            return value
+        return str(value).encode("utf-8")
+
+    def ping(self):
+        self._check()
+        return True
+
+    def get(self, key):
+        with self._lock:
+            self._check()
+            return self._data[key] if self._alive(key) else None
+
+    def mget(self, keys, *args):
+        with self._lock:
+            self._check()
+            self.mget_calls = getattr(self, "mget_calls", 0) + 1
+            return [self._data[key] if self._alive(key) else None for key in [*keys, *args]]
+
+    def set(self, key, value, ex=None, px=None, nx=False):
+        with self._lock:
+            self._check()
+            if nx and self._alive(key):
+                return None
+            self._data[key] = self._encode(value)
+            self._expires.pop(key, None)
+            if ex is not None:
+                self._expires[key] = time.monotonic() + float(ex)
+            elif px is not None:
+                self._expires[key] = time.monotonic() + px / 1000
+            return True
+
+    def delete(self, *keys):
+        with self._lock:
+            self._check()
+            removed = 0
+            for key in keys:
+                if self._alive(key):
+                    removed += 1
+                self._data.pop(key, None)
+                self._expires.pop(key, None)
+            return removed
+
+    def exists(self, *keys):
+        with self._lock:
+            self._check()
+            return sum(1 for key in keys if self._alive(key))
+
+    def incr(self, key, amount=1):
+        with self._lock:
+            self._check()
+            value = int(self._data[key]) + amount if self._alive(key) else amount
+            self._data[key] = self._encode(value)
+            return value
+
+    def ttl(self, key):
+        with self._lock:
+            if not self._alive(key):
+                return -2
+            expires = self._expires.get(key)
+            return -1 if expires is None else int(expires - time.monotonic())
+
+    def zincrby(self, key, amount, member):
+        with self._lock:
+            self._check()
+            zset = self._zsets.setdefault(key, {})
+            zset[member] = zset.get(member, 0.0) + float(amount)
+            return zset[member]
+
+    def zscore(self, key, member):
+        with self._lock:
+            self._check()
+            return self._zsets.get(key, {}).get(member)
+
+    def zrevrange(self, key, start, end, withscores=False):
+        with self._lock:
+            self._check()
+            ranked = sorted(self._zsets.get(key, {}).items(), key=lambda item: (-item[1], item[0]))
+            ranked = ranked[start:None if end == -1 else end + 1]
+            return [(self._encode(m), s) if withscores else self._encode(m) for m, s in ranked]
+
+    def zadd(self, key, mapping, xx=False, lt=False):
+        with self._lock:
+            self._check()
+            zset = self._zsets.setdefault(key, {})
+            added = 0
+            for member, score in mapping.items():
+                member = self._encode(member)
+                if member not in zset:
+                    if xx:
+                        continue
+                    added += 1
+                elif lt and float(score) >= zset[member]:
+                    continue
+                zset[member] = float(score)
+            return added
+
+    def zcard(self, key):
+        with self._lock:
+            self._check()
+            return len(self._zsets.get(key, {}))
+
+    def zpopmin(self, key, count=1):
+        with self._lock:
+            self._check()
+            zset = self._zsets.get(key, {})
+            popped = sorted(zset.items(), key=lambda item: (item[1], item[0]))[:count]
+            for member, _ in popped:
+                del zset[member]
+            return popped
+
+    def bzpopmin(self, keys, timeout=0):
+        """Never blocks: an empty set answers like a timed-out BZPOPMIN."""
+        key = keys if isinstance(keys, str) else keys[0]
+        popped = self.zpopmin(key)
+        return (self._encode(key), *popped[0]) if popped else None
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        with self._lock:
+            self._check()
+            values = dict(mapping or {})
+            if field is not None:
+                values[field] = value
+            stored = self._hashes.setdefault(key, {})
+            added = sum(1 for name in values if self._encode(name) not in stored)
+            stored.update((self._encode(name), self._encode(v)) for name, v in values.items())
+            return added
+
+    def hgetall(self, key):
+        with self._lock:
+            self._check()
+            return dict(self._hashes.get(key, {}))
+
+    def expire(self, key, seconds):
+        with self._lock:
+            self._check()
+            if self._alive(key):
+                self._expires[key] = time.monotonic() + float(seconds)
+                return True
+            return key in self._hashes  # hashes are kept; no test waits for them to expire
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        self._check()
+        return FakePubSub(self)
+
+    def publish(self, channel, message):
+        """Delivers to subscribers synchronously, as if their listener threads were instant."""
+        self._check()
+        handlers = list(self._subscribers.get(channel, []))
+        for handler in handlers:
+            handler({"type": "message", "channel": channel.encode(), "data": self._encode(message)})
+        return len(handlers)
+
+    def eval(self, script, numkeys, *args):
+        keys, argv = args[:numkeys], args[numkeys:]
+        with self._lock:
+            self._check()
+            if script == RELEASE_SCRIPT:
+                if self.get(keys[0]) == self._encode(argv[0]):
+                    return self.delete(keys[0])
+                return 0
+            if script == FENCED_SET_SCRIPT:
+                latest = int(self.get(keys[1]) or 0)
+                if int(argv[0]) < latest:
+                    return 0
+                self.set(keys[0], argv[1], ex=argv[2])
+                self.expire(keys[1], argv[2])
+                return 1
+            if script == ACQUIRE_SCRIPT:
+                if not self.set(keys[0], "0", nx=True, px=int(argv[0])):
+                    return None
+                token = self.incr(keys[1])
+                self.expire(keys[1], argv[1])
+                self.set(keys[0], token, px=int(argv[0]))
+                return token
+            if script == INCR_SCRIPT:
+                value = self.incr(keys[0])
+                self.expire(keys[0], argv[0])
+                return value
+            if script == TOKEN_BUCKET_SCRIPT:
+                max_rate, burst, max_wait, increase = (float(arg) for arg in argv)
+                now = time.time()
+                state = self._hashes.get(keys[0], {})
+                rate = min(max_rate, state.get("rate", max_rate) + increase)
+                tokens = min(burst, state.get("tokens", burst) + max(0.0, now - state.get("ts", now)) * rate) - 1
+                wait = -tokens / rate if tokens < 0 else 0.0
+                if wait <= max_wait:
+                    self._hashes[keys[0]] = {"tokens": tokens, "ts": now, "rate": rate}
+                return str(wait).encode()
+            if script == DECREASE_SCRIPT:
+                max_rate, factor, min_rate = (float(arg) for arg in argv)
+                state = self._hashes.setdefault(keys[0], {})
+                state["rate"] = max(min_rate, state.get("rate", max_rate) * factor)
+                return str(state["rate"]).encode()
+            if script == ENQUEUE_SCRIPT:
+                existing = self.get(keys[1])
+                if existing is not None:
+                    job = self._hashes.get(argv[5] + existing.decode(), {})
+                    status = job.get(b"status")
+                    if status == b"queued" or (status == b"running" and (argv[4] == "0" or job.get(b"force_refresh") == b"1")):
+                        if argv[4] == "1":
+                            job[b"force_refresh"] = b"1"
+                        self.zadd(keys[0], {existing: argv[1]}, xx=True, lt=True)
+                        return existing
+                self.set(keys[1], argv[0], ex=argv[2])
+                fields = argv[6:]
+                self.hset(keys[2], mapping=dict(zip(fields[::2], fields[1::2])))
+                self.zadd(keys[0], {argv[0]: argv[1]})
+                return self._encode(argv[0])
+            if script == CLAIM_SCRIPT:
+                if keys[0] not in self._hashes:
+                    return None
+                self.hset(keys[0], mapping={"status": "running", "started_at": argv[0]})
+                return [item for pair in self._hashes[keys[0]].items() for item in pair]
+            if script == EXTEND_SCRIPT:
+                if self.get(keys[0]) == self._encode(argv[0]):
+                    return int(self.expire(keys[0], argv[1]))
+                return 0
+            if script == DECAY_SCRIPT:
+                now, half_life, max_members = float(argv[0]), float(argv[1]), int(argv[2])
+                last = float(self.get(keys[1]) or now)
+                self.set(keys[1], now)
+                factor = 0.5 ** (max(0.0, now - last) / half_life)
+                zset = self._zsets.setdefault(keys[0], {})
+                ranked = sorted(zset.items(), key=lambda item: -item[1])[:max_members]
+                self._zsets[keys[0]] = {member: score * factor for member, score in ranked}
+                return str(factor).encode()
+        raise NotImplementedError("FakeRedis does not understand this script")
+
+
+class FakePipeline:
+    """Queues commands and replays them against the parent on execute()."""
+
+    def __init__(self, client):
+        self._client = client
+        self._commands = []
+
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+
+        def queue(*args, **kwargs):
+            self._commands.append((method, args, kwargs))
+            return self
+
+        return queue
+
+    def execute(self):
+        commands, self._commands = self._commands, []
+        self._client.pipelines_executed = getattr(self._client, "pipelines_executed", 0) + 1
+        with self._client._lock:
+            return [method(*args, **kwargs) for method, args, kwargs in commands]
+
+
+class FakePubSub:
+    """Registers handlers on the parent; run_in_thread() returns itself as the "thread"."""
+
+    def __init__(self, client):
+        self._client = client
+        self._handlers = {}
+        self._confirmations = []
+
+    def subscribe(self, **handlers):
+        self._client._check()
+        self._handlers.update(handlers)
+        for channel, handler in handlers.items():
+            self._client._subscribers.setdefault(channel, []).append(handler)
+            self._confirmations.append({"type": "subscribe", "channel": channel.encode(), "data": 1})
+
+    def get_message(self, ignore_subscribe_messages=False, timeout=0.0):
+        self._client._check()
+        return self._confirmations.pop(0) if self._confirmations else None
+
+    def run_in_thread(self, sleep_time=0, daemon=False, exception_handler=None):
+        return self
+
+    def stop(self):
+        for channel, handler in self._handlers.items():
+            self._client._subscribers[channel].remove(handler)
+        self._handlers = {}
+
+    close = stop
+
+
+class FakeAsyncRedis:
+    """redis.asyncio-style facade over :class:`FakeRedis`."""
+
+    def __init__(self, sync=None):
+        self.sync = sync or FakeRedis()
+
+    def __getattr__(self, name):
+        method = getattr(self.sync, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+
+        return call
@@ -0,0 +1,166 @@
+import gzip
+import json
+import unittest
+from unittest.mock import patch
+
+from app import MAX_LIMIT, app
+from fakes import FakeRedis
+from crawler import CachedRows, CrawlerResult, TikTokVideo, _video_row, get_tiktok_videos
+
+
+def _video(video_id):
+    return TikTokVideo(
+        video_id=video_id,
+        video_url=f"https://www.tiktok.com/@fakeuser/video/{video_id}",
+        author_id="fakeuser",
+        play_url=f"http://example.com/{video_id}.mp4",
+    )
+
+
+class TestApp(unittest.TestCase):
+
+    def setUp(self):
+        self.client = app.test_client()
+
+    @patch('app.get_tiktok_videos')
+    def test_api_videos_reports_cache_state(self, mock_get):
+        mock_get.return_value = CrawlerResult(videos=[_video("1")], from_cache=True, stale=True, cache_age=42.0)
+        payload = self.client.get("/api/videos?q=a,b&limit=5").get_json()
+        mock_get.assert_called_once_with(["a", "b"], num_videos=5, force_refresh=False)
+        self.assertEqual(payload["total"], 1)
+        self.assertTrue(payload["stale"])
+        self.assertEqual(payload["cache_age"], 42.0)
+        self.assertEqual(payload["videos"][0]["mediaUrl"], "http://example.com/1.mp4")
+
+    @patch('app.get_tiktok_videos')
+    @patch('app.get_cached_rows')
+    def test_api_videos_serves_cached_rows_without_crawler(self, mock_rows, mock_get):
+        mock_rows.return_value = CachedRows(rows=[_video_row(_video("1"))], cache_age=3.0)
+        payload = self.client.get("/api/videos?q=a&limit=5").get_json()
+        mock_rows.assert_called_once_with(["a"], 5)
+        mock_get.assert_not_called()
+        self.assertTrue(payload["from_cache"])
+        self.assertEqual(payload["videos"][0]["video_id"], "1")
+        self.assertEqual(payload["videos"][0]["mediaUrl"], "http://example.com/1.mp4")
+        self.assertEqual(payload["videos"][0]["authorId"], "fakeuser")
+
+    def test_api_videos_response_cache_etag_and_gzip(self):
+        fake_redis = FakeRedis()
+        crawls = iter([[_video("1")], [_video("2")]])
+        with patch('crawler.redis_client', fake_redis), \
+                patch('crawler._run_async', side_effect=lambda *a, **k: (next(crawls), None)):
+            self.client.get("/api/videos?q=a&limit=1")  # crawls, bumping the entry generation
+            first = self.client.get("/api/videos?q=a&limit=1", headers={"Accept-Encoding": "gzip"})
+            etag = first.headers["ETag"]
+            with patch('app.get_cached_rows') as mock_rows:
+                not_modified = self.client.get(
+                    "/api/videos?q=a&limit=1", headers={"If-None-Match": etag, "Accept-Encoding": "gzip"}
+                )
+                identity = self.client.get("/api/videos?q=a&limit=1", headers={"If-None-Match": etag})
+            mock_rows.assert_not_called()
+            get_tiktok_videos(["a"], 1, force_refresh=True)
+            refreshed = self.client.get(
+                "/api/videos?q=a&limit=1", headers={"If-None-Match": etag, "Accept-Encoding": "gzip"}
+            )
+
+        self.assertEqual(first.headers["Content-Encoding"], "gzip")
+        self.assertEqual(json.loads(gzip.decompress(first.data))["videos"][0]["video_id"], "1")
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.data, b"")
+        self.assertEqual(identity.status_code, 200)  # a gzip validator says nothing about the identity body
+        self.assertNotEqual(identity.headers["ETag"], etag)
+        self.assertEqual(identity.get_json()["videos"][0]["video_id"], "1")
+        self.assertEqual(refreshed.status_code, 200)
+        self.assertNotEqual(refreshed.headers["ETag"], etag)
+        self.assertEqual(json.loads(gzip.decompress(refreshed.data))["videos"][0]["video_id"], "2")
+
+    @patch('app.get_tiktok_page')
+    def test_api_videos_paginates_with_cursor(self, mock_page):
+        mock_page.return_value = CrawlerResult(videos=[_video("1")], from_cache=False, next_page="abc")
+        payload = self.client.get("/api/videos?q=a&limit=1&cursor=").get_json()
+        mock_page.assert_called_once_with(["a"], 1, cursor=None, force_refresh=False)
+        self.assertEqual(payload["next_cursor"], "abc")
+
+        self.client.get("/api/videos?q=a&limit=1&cursor=abc")
+        self.assertEqual(mock_page.call_args.kwargs["cursor"], "abc")
+
+    @patch('app.get_tiktok_page')
+    def test_api_videos_rejects_limits_that_cannot_advance_a_page(self, mock_page):
+        for limit in ("abc", "0", "-3"):
+            response = self.client.get(f"/api/videos?q=a&limit={limit}&cursor=")
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("limit", response.get_json()["error"])
+        mock_page.assert_not_called()
+
+        mock_page.return_value = CrawlerResult(videos=[], from_cache=False)
+        self.client.get("/api/videos?q=a&limit=1000000&cursor=")
+        self.assertEqual(mock_page.call_args.args[1], MAX_LIMIT)
+
+    @patch('app.stream_tiktok_videos')
+    def test_api_videos_stream_ndjson(self, mock_stream):
+        mock_stream.return_value = iter([
+            [_video("1")],
+            [_video("2")],
+            CrawlerResult(videos=[_video("1"), _video("2")], from_cache=False, next_cursor=20),
+        ])
+        response = self.client.get("/api/videos/stream?q=a&limit=2")
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual([r["type"] for r in records], ["videos", "videos", "summary"])
+        self.assertEqual(records[0]["videos"][0]["authorId"], "fakeuser")
+        self.assertEqual(records[-1]["total"], 2)
+        self.assertEqual(records[-1]["next_cursor"], 20)
+
+    @patch('app.stream_tiktok_videos')
+    def test_api_videos_stream_validates_limit(self, mock_stream):
+        for limit in ("abc", "0", "-3"):
+            response = self.client.get(f"/api/videos/stream?q=a&limit={limit}")
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("limit", response.get_json()["error"])
+        mock_stream.assert_not_called()
+
+        mock_stream.return_value = iter([CrawlerResult(videos=[], from_cache=True)])
+        self.client.get("/api/videos/stream?q=a&limit=1000000").get_data()
+        self.assertEqual(mock_stream.call_args.kwargs["num_videos"], MAX_LIMIT)
+
+    @patch('app.stream_tiktok_videos')
+    def test_api_videos_stream_sse(self, mock_stream):
+        mock_stream.return_value = iter([CrawlerResult(videos=[], from_cache=True, error="none")])
+        response = self.client.get("/api/videos/stream?q=a&format=sse")
+        self.assertEqual(response.mimetype, "text/event-stream")
+        self.assertTrue(response.get_data(as_text=True).startswith("event: summary\ndata: {"))
+
+    @patch('app.get_tiktok_videos_batch')
+    def test_api_videos_batch_keeps_errors_per_query(self, mock_batch):
+        mock_batch.return_value = [
+            CrawlerResult(videos=[_video("1")], from_cache=True),
+            CrawlerResult(videos=[], from_cache=False, error="no video results for keywords: b"),
+        ]
+        response = self.client.post("/api/videos/batch", json={"queries": [
+            {"q": "a", "limit": 5},
+            {"q": "b", "limit": "x"},
+            {"q": ["b"], "cursor": 20, "force_refresh": "true"},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        queries = mock_batch.call_args.args[0]
+        self.assertEqual([(q.keywords, q.num_videos, q.cursor, q.force_refresh) for q in queries], [
+            (["a"], 5, None, False),
+            (["b"], 100, 20, True),
+        ])
+        results = response.get_json()["results"]
+        self.assertEqual(results[0]["videos"][0]["video_id"], "1")
+        self.assertIsNone(results[0]["error"])
+        self.assertEqual(results[1], {"error": "limit must be an integer"})
+        self.assertEqual(results[2]["error"], "no video results for keywords: b")
+
+        self.assertEqual(self.client.post("/api/videos/batch", json=[{"q": "a"}]).status_code, 400)
+        with patch('app.MAX_BATCH_QUERIES', 1):
+            self.assertEqual(self.client.post("/api/videos/batch", json={"queries": [{}, {}]}).status_code, 400)
+
+    def test_api_videos_rejects_bad_cursor(self):
+        response = self.client.get("/api/videos?q=a&cursor=%%%")
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
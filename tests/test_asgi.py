@@ -0,0 +1,190 @@
+import asyncio
+import json
+import threading
+import unittest
+from dataclasses import asdict
+from unittest.mock import patch
+
+import cache_codec
+import crawler
+from asgi import AsyncVideoService, create_app
+from crawler import TikTokVideo
+from fakes import FakeAsyncRedis, FakeRedis
+
+
+def _video(video_id):
+    return TikTokVideo(
+        video_id=video_id,
+        video_url=f"https://www.tiktok.com/@fakeuser/video/{video_id}",
+        author_id="fakeuser",
+    )
+
+
+async def _call(asgi_app, path, query=b"", headers=(), method="GET"):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": method, "path": path, "query_string": query, "headers": list(headers)}
+    await asgi_app(scope, receive, send)
+    return messages
+
+
+class TestAsyncVideoService(unittest.TestCase):
+
+    def test_concurrent_misses_share_one_awaited_crawl(self):
+        calls = []
+
+        async def fake_fetch(keywords, num_videos, *, initial_cursor=None, pool=None, errors=None):
+            calls.append(keywords)
+            await asyncio.sleep(0.05)
+            return [_video("1"), _video("2")], 10
+
+        async def scenario():
+            service = AsyncVideoService(FakeAsyncRedis(), None)
+            return await asyncio.gather(*(service.get_videos(["a"], 2) for _ in range(5))), service
+
+        with patch('crawler._fetch_tiktok_videos_async', side_effect=fake_fetch):
+            results, service = asyncio.run(scenario())
+
+        self.assertEqual(calls, [["a"]])
+        self.assertTrue(all([v.video_id for v in r.videos] == ["1", "2"] for r in results))
+        cached = cache_codec.decode(service.redis.sync.get("tiktok:a"))
+        self.assertEqual(cached.next_cursor, 10)
+
+    def test_bigger_requests_do_not_share_a_smaller_crawl(self):
+        calls = []
+
+        async def fake_fetch(keywords, num_videos, *, initial_cursor=None, pool=None, errors=None):
+            calls.append(num_videos)
+            await asyncio.sleep(0.05)
+            return [_video(str(n)) for n in range(num_videos)], 10
+
+        async def scenario():
+            service = AsyncVideoService(FakeAsyncRedis(), None)
+            return await asyncio.gather(service.get_videos(["a"], 2), service.get_videos(["a"], 5))
+
+        with patch('crawler._fetch_tiktok_videos_async', side_effect=fake_fetch):
+            small, big = asyncio.run(scenario())
+
+        self.assertEqual(calls, [2, 5])
+        self.assertEqual((len(small.videos), len(big.videos)), (2, 5))
+
+    def test_serves_entries_written_by_sync_path(self):
+        fake_redis = FakeAsyncRedis()
+        fake_redis.sync.set("tiktok:a", json.dumps({"videos": [asdict(_video("7"))], "next_cursor": None}))
+
+        with patch('crawler._fetch_tiktok_videos_async') as mock_fetch:
+            result = asyncio.run(AsyncVideoService(fake_redis, None).get_videos(["a"], 1))
+
+        mock_fetch.assert_not_called()
+        self.assertTrue(result.from_cache)
+        self.assertEqual(result.videos[0].video_id, "7")
+
+    def test_local_cache_subscribes_off_the_event_loop(self):
+        sync_redis = FakeRedis()
+        threads = []
+        ensure = crawler._cache_listener.ensure
+
+        def recording_ensure(client):
+            threads.append(threading.get_ident())
+            return ensure(client)
+
+        async def scenario():
+            service = AsyncVideoService(FakeAsyncRedis(), None)
+            first = await service._local_cache()
+            second = await service._local_cache()
+            return first, second, threading.get_ident()
+
+        with patch('crawler.redis_client', sync_redis), patch('crawler.LOCAL_CACHE_BYTES', 10_000), \
+                patch.object(crawler._cache_listener, "ensure", side_effect=recording_ensure):
+            first, second, loop_thread = asyncio.run(scenario())
+        self.addCleanup(crawler._cache_listener.close)
+
+        self.assertIs(first, crawler._CACHE)
+        self.assertIs(second, crawler._CACHE)
+        self.assertEqual(len(threads), 1)  # once subscribed, the check never calls Redis
+        self.assertNotEqual(threads[0], loop_thread)
+
+class TestAsgiApp(unittest.TestCase):
+
+    def test_api_videos_is_served_natively(self):
+        fallback_calls = []
+
+        async def fallback(scope, receive, send):
+            fallback_calls.append(scope["path"])
+
+        async def fake_fetch(keywords, num_videos, *, initial_cursor=None, pool=None, errors=None):
+            return [_video("1")], None
+
+        asgi_app = create_app(redis_client=FakeAsyncRedis(), fallback=fallback)
+        with patch('crawler._fetch_tiktok_videos_async', side_effect=fake_fetch), patch('crawler.POOL_SIZE', 0):
+            messages = asyncio.run(_call(asgi_app, "/api/videos", b"q=a&limit=1"))
+            asyncio.run(_call(asgi_app, "/api/videos", b"q=a&cursor="))
+            asyncio.run(_call(asgi_app, "/"))
+
+        self.assertEqual(messages[0]["status"], 200)
+        payload = json.loads(messages[1]["body"])
+        self.assertEqual(payload["keyword"], ["a"])
+        self.assertEqual(payload["videos"][0]["video_id"], "1")
+        self.assertEqual(fallback_calls, ["/api/videos", "/"])
+
+    def test_api_videos_answers_if_none_match_with_304(self):
+        fake_redis = FakeAsyncRedis()
+        fake_redis.sync.set("tiktok:a", json.dumps({"videos": [asdict(_video("1"))], "next_cursor": None}))
+        asgi_app = create_app(redis_client=fake_redis, fallback=None)
+
+        async def scenario():
+            first = await _call(asgi_app, "/api/videos", b"q=a&limit=1")
+            etag = dict(first[0]["headers"])[b"etag"]
+            return first, await _call(asgi_app, "/api/videos", b"q=a&limit=1", [(b"if-none-match", etag)])
+
+        with patch('crawler._fetch_tiktok_videos_async') as mock_fetch, patch('crawler.POOL_SIZE', 0):
+            first, second = asyncio.run(scenario())
+
+        mock_fetch.assert_not_called()
+        self.assertEqual(first[0]["status"], 200)
+        self.assertEqual(json.loads(first[1]["body"])["videos"][0]["video_id"], "1")
+        self.assertEqual(second[0]["status"], 304)
+
+    def test_head_requests_get_headers_without_a_body(self):
+        fake_redis = FakeAsyncRedis()
+        fake_redis.sync.set("tiktok:a", json.dumps({"videos": [asdict(_video("1"))], "next_cursor": None}))
+        asgi_app = create_app(redis_client=fake_redis, fallback=None)
+
+        async def scenario():
+            return [await _call(asgi_app, "/api/videos", b"q=a&limit=1", method="HEAD") for _ in range(2)]
+
+        with patch('crawler._fetch_tiktok_videos_async') as mock_fetch, patch('crawler.POOL_SIZE', 0):
+            built, cached = asyncio.run(scenario())
+
+        mock_fetch.assert_not_called()
+        for messages in (built, cached):
+            self.assertEqual(messages[0]["status"], 200)
+            self.assertGreater(int(dict(messages[0]["headers"])[b"content-length"]), 0)
+            self.assertEqual(messages[1]["body"], b"")
+
+    def test_timing_header_is_optional(self):
+        fake_redis = FakeAsyncRedis()
+        fake_redis.sync.set("tiktok:a", json.dumps({"videos": [asdict(_video("1"))], "next_cursor": None}))
+        asgi_app = create_app(redis_client=fake_redis, fallback=None)
+        with patch('crawler.POOL_SIZE', 0):
+            plain = asyncio.run(_call(asgi_app, "/api/videos", b"q=a&limit=1"))
+            with patch('metrics.TIMING_HEADER', True):
+                timed = asyncio.run(_call(asgi_app, "/api/videos", b"q=a&limit=1"))
+
+        self.assertNotIn(b"server-timing", dict(plain[0]["headers"]))
+        self.assertIn(b"redis_get;dur=", dict(timed[0]["headers"])[b"server-timing"])
+
+    def test_bad_limit_is_rejected(self):
+        asgi_app = create_app(redis_client=FakeAsyncRedis(), fallback=None)
+        messages = asyncio.run(_call(asgi_app, "/api/videos", b"limit=abc"))
+        self.assertEqual(messages[0]["status"], 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import sys
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import crawler
+import e2e_bench
+import startup_bench
+from fake_tiktok import FakeSearchConfig, FakeSearchServer
+
+
+class TestFakeSearchServer(unittest.TestCase):
+
+    def test_pages_differ_per_keyword_and_offset(self):
+        config = FakeSearchConfig(latency_ms=0, jitter_ms=0, max_pages=2)
+        with FakeSearchServer(config) as server:
+            status, first = server.respond("cats", 0)
+            _, other_keyword = server.respond("dogs", 0)
+            _, last = server.respond("cats", 12)
+        self.assertEqual(status, 200)
+        self.assertNotEqual(first, other_keyword)
+        self.assertIn(b'"has_more":1', first)
+        self.assertIn(b'"has_more":0', last)
+        self.assertEqual(server.requests, 3)
+
+    def test_error_rate(self):
+        with FakeSearchServer(FakeSearchConfig(latency_ms=0, jitter_ms=0, error_rate=1.0)) as server:
+            self.assertEqual(server.respond("cats", 0)[0], 500)
+
+
+class TestEndToEndBenchmark(unittest.TestCase):
+
+    def test_run_suite_smoke(self):
+        original_api, original_redis = crawler.TikTokApi, crawler.redis_client
+        config = FakeSearchConfig(latency_ms=0, jitter_ms=0)
+        with patch.object(crawler, "VIDEO_INDEX_PATH", ""):
+            results = e2e_bench.run_suite(requests=4, concurrency=2, limit=5, config=config, pool_size=0)
+
+        self.assertEqual(set(results), {"crawler", "app"})
+        for workloads in results.values():
+            self.assertEqual(set(workloads), {"cold", "warm", "mixed"})
+            self.assertEqual(workloads["warm"]["upstream_requests"], 0)
+            self.assertGreater(workloads["cold"]["upstream_requests"], 0)
+            for row in workloads.values():
+                self.assertEqual(row["empty"], 0)
+                self.assertLessEqual(row["p50_ms"], row["p99_ms"])
+        self.assertIs(crawler.TikTokApi, original_api)
+        self.assertIs(crawler.redis_client, original_redis)
+
+
+class TestStartupBenchmark(unittest.TestCase):
+
+    def test_run_smoke(self):
+        results = startup_bench.run(samples=1, module="crawler", redis_host="127.0.0.1")
+        self.assertEqual(set(results), set(startup_bench.FIELDS))
+        self.assertLessEqual(results["import_ms"]["median"], results["first_request_ms"]["median"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import json
+import unittest
+from dataclasses import fields
+
+import cache_codec
+from crawler import TikTokVideo
+
+
+def _row(video_id, author="fakeuser", **overrides):
+    row = {
+        "video_id": video_id,
+        "video_url": f"https://www.tiktok.com/@{author}/video/{video_id}",
+        "author_id": author,
+        "thumbnail_url": f"https://p16.tiktokcdn.com/obj/{video_id}.jpeg?x-expires=1",
+        "title": f"Video {video_id}",
+        "download_url": None,
+        "play_url": f"https://v16.tiktokcdn.com/video/{video_id}/?a=1988",
+    }
+    row.update(overrides)
+    return tuple(row[name] for name in cache_codec.FIELDS)
+
+
+class TestCacheCodec(unittest.TestCase):
+
+    def test_fields_follow_tiktok_video(self):
+        self.assertEqual(cache_codec.FIELDS, tuple(f.name for f in fields(TikTokVideo)))
+
+    def test_round_trip(self):
+        rows = [_row("1"), _row("2", author="other"), _row("3", video_url="https://vm.tiktok.com/x", title=None)]
+        data = cache_codec.encode(rows, next_cursor=30, limit=50, cached_at=123.5, has_more=True)
+        self.assertTrue(data.startswith(cache_codec.MAGIC))
+
+        entry = cache_codec.decode(data)
+        self.assertEqual(entry.rows, rows)
+        self.assertEqual((entry.next_cursor, entry.limit, entry.cached_at, entry.has_more), (30, 50, 123.5, True))
+
+    def test_binary_is_smaller_than_json(self):
+        rows = [_row(str(i)) for i in range(200)]
+        legacy = json.dumps({"videos": [dict(zip(cache_codec.FIELDS, row)) for row in rows]})
+        self.assertLess(len(cache_codec.encode(rows)), len(legacy) / 2)
+
+    def test_reads_legacy_json_entries(self):
+        legacy = json.dumps({"videos": [{"video_id": "1", "video_url": "u", "author_id": "a"}], "next_cursor": 10})
+        entry = cache_codec.decode(legacy.encode("utf-8"))
+        self.assertEqual(entry.rows, [("1", "u", "a", None, None, None, None)])
+        self.assertEqual(entry.next_cursor, 10)
+        self.assertIsNone(entry.limit)
+        self.assertIsNone(entry.cached_at)
+
+    def test_rejects_unknown_version_and_garbage(self):
+        with self.assertRaises(ValueError):
+            cache_codec.decode(cache_codec.MAGIC + bytes([99]) + b"\x90")
+        with self.assertRaises(ValueError):
+            cache_codec.decode(cache_codec.MAGIC + bytes([cache_codec.VERSION]) + b"\x93\x01")
+        with self.assertRaises(ValueError):
+            cache_codec.decode(b"not json")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import subprocess
+import sys
+import threading
+import unittest
+from unittest.mock import patch
+
+import crawler
+from circuit_breaker import CircuitBreaker
+from fakes import FakeRedis
+
+API_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api")
+
+
+class _Probe:
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+        self.done = threading.Semaphore(0)
+
+    def __call__(self):
+        self.calls += 1
+        self.done.release()
+        if self.outcomes and self.outcomes.pop(0):
+            raise ConnectionError("down")
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def _breaker(self, probe, **kwargs):
+        changes = []
+        breaker = CircuitBreaker(
+            probe, name="test", errors=(ConnectionError,), retry_interval=0.01, on_change=changes.append, **kwargs
+        )
+        self.addCleanup(breaker.stop)
+        breaker.start()
+        return breaker, changes
+
+    def test_keeps_probing_until_the_backend_answers(self):
+        probe = _Probe(True, True, False)
+        breaker, changes = self._breaker(probe)
+        self.assertFalse(breaker.wait(5))  # the first probe failed
+        for _ in range(3):
+            self.assertTrue(probe.done.acquire(timeout=5))
+        self.assertTrue(breaker._closed.wait(5))
+        self.assertEqual(probe.calls, 3)
+        self.assertEqual(changes, [True])
+
+    def test_trips_after_consecutive_failures_and_recovers(self):
+        probe = _Probe()
+        breaker, changes = self._breaker(probe, failure_threshold=2)
+        self.assertTrue(breaker.wait(5))
+
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertTrue(breaker.closed)
+
+        breaker.record_failure()
+        self.assertEqual(breaker.trips, 1)
+        self.assertEqual(changes[:2], [True, False])
+        self.assertTrue(probe.done.acquire(timeout=5))
+        self.assertTrue(probe.done.acquire(timeout=5))  # re-probed after the trip
+        self.assertTrue(breaker._closed.wait(5))
+        self.assertEqual(breaker.stats(), {"available": True, "trips": 1})
+
+    def test_recording_counts_only_the_given_errors(self):
+        breaker, _ = self._breaker(_Probe(), failure_threshold=2)
+        self.assertTrue(breaker.wait(5))
+
+        with self.assertRaises(ValueError), breaker.recording((ConnectionError,)):
+            raise ValueError("bad command")
+        for _ in range(2):
+            with self.assertRaises(ConnectionError), breaker.recording((ConnectionError,)):
+                raise ConnectionError("down")
+            with breaker.recording((ConnectionError,), success=False):
+                pass
+        self.assertFalse(breaker.closed)
+
+
+class TestCrawlerStartup(unittest.TestCase):
+
+    def test_import_defers_tiktokapi_and_redis(self):
+        code = "import sys, crawler; print('TikTokApi' in sys.modules, crawler.redis_client is None)"
+        env = dict(os.environ, PYTHONPATH=API_DIR, REDIS_HOST="127.0.0.1", REDIS_PORT="1")
+        out = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+        self.assertEqual(out.stdout.split(), ["False", "True"])
+
+    def test_breaker_leaves_installed_clients_alone(self):
+        fake_redis = FakeRedis()
+        with patch('crawler.redis_client', fake_redis):
+            crawler._on_redis_change(False)
+            self.assertIs(crawler.redis_client, fake_redis)
+            crawler._on_redis_change(True)
+            self.assertIs(crawler.redis_client, fake_redis)
+        with patch('crawler.redis_client', None):
+            crawler._on_redis_change(True)
+            self.assertIs(crawler.redis_client, crawler._redis)
+            crawler._on_redis_change(False)
+            self.assertIsNone(crawler.redis_client)
+
+
+if __name__ == "__main__":
+    unittest.main()
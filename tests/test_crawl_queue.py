@@ -0,0 +1,200 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+import crawl_queue
+import crawler
+from app import app
+from crawl_queue import PRIORITY_INTERACTIVE, PRIORITY_REFRESH, QUEUE_KEY, CrawlQueue, work
+from crawler import _CACHE, CrawlerResult, TikTokVideo, crawl_jobs, get_cached_rows
+from fakes import FakeRedis, disable_pacing
+from test_crawler import FakeTikTokApi
+
+
+def _video(video_id):
+    return TikTokVideo(video_id=video_id, video_url=f"https://www.tiktok.com/@fakeuser/video/{video_id}", author_id="fakeuser")
+
+
+class TestCrawlQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.redis = FakeRedis()
+        self.queue = CrawlQueue(lambda: self.redis)
+
+    def test_same_query_joins_the_pending_job(self):
+        first = self.queue.submit(["KPOP"], 10)
+        second = self.queue.submit(["kpop"], 10)
+        other = self.queue.submit(["kpop"], 20)
+        self.assertEqual(second.id, first.id)
+        self.assertNotEqual(other.id, first.id)
+        self.assertEqual(self.redis.zcard(QUEUE_KEY), 2)
+        self.assertEqual(self.queue.get(first.id).status, "queued")
+
+    def test_forced_refresh_is_not_dropped_by_a_pending_job(self):
+        queued = self.queue.submit(["a"], 10)
+        self.assertEqual(self.queue.submit(["a"], 10, force_refresh=True).id, queued.id)
+        self.assertTrue(self.queue.get(queued.id).force_refresh)
+
+        running = self.queue.submit(["b"], 10)
+        self.queue.pop(2)
+        forced = self.queue.submit(["b"], 10, force_refresh=True)
+        self.assertNotEqual(forced.id, running.id)
+        self.assertEqual(self.queue.submit(["b"], 10, force_refresh=True).id, forced.id)
+        self.assertEqual(self.redis.zcard(QUEUE_KEY), 1)
+
+    def test_pops_by_priority_then_submission_order(self):
+        refresh = self.queue.submit(["a"], 10, force_refresh=True, priority=PRIORITY_REFRESH)
+        first = self.queue.submit(["b"], 10)
+        second = self.queue.submit(["c"], 10)
+        self.assertEqual([job.id for job in self.queue.pop(3)], [first.id, second.id, refresh.id])
+
+        # "a" is still running, so a new query joins it instead of queueing again.
+        self.assertEqual(self.queue.submit(["a"], 10).id, refresh.id)
+
+        older = self.queue.submit(["d"], 10, force_refresh=True, priority=PRIORITY_REFRESH)
+        refresh = self.queue.submit(["e"], 10, force_refresh=True, priority=PRIORITY_REFRESH)
+        self.queue.submit(["e"], 10, priority=PRIORITY_INTERACTIVE)  # someone is now waiting for it
+        popped = self.queue.pop(2)
+        self.assertEqual([job.id for job in popped], [refresh.id, older.id])
+        self.assertTrue(popped[0].force_refresh)
+        self.assertEqual(self.queue.get(refresh.id).status, "running")
+
+    def test_pop_restarts_the_dedup_window_and_skips_expired_jobs(self):
+        job = self.queue.submit(["a"], 10)
+        expired = self.queue.submit(["b"], 10)
+        query_key = crawl_queue._query_key(["a"], 10, None)
+        self.redis.expire(query_key, 5)  # most of the window spent waiting in the queue
+        del self.redis._hashes[crawl_queue.JOB_KEY_PREFIX + expired.id]
+
+        self.assertEqual([popped.id for popped in self.queue.pop(2)], [job.id])
+        self.assertGreater(self.redis.ttl(query_key), 5)
+        self.assertNotIn(crawl_queue.JOB_KEY_PREFIX + expired.id, self.redis._hashes)
+
+    def test_finish_records_the_outcome_and_releases_the_query(self):
+        job = self.queue.submit(["a"], 10)
+        failing = self.queue.submit(["b"], 10)
+        work(self.queue, lambda jobs: [
+            CrawlerResult(videos=[_video("1")], from_cache=False),
+            CrawlerResult(videos=[], from_cache=False, error="search blocked"),
+        ], batch=2)
+
+        done = self.queue.get(job.id)
+        self.assertEqual((done.status, done.total, done.error), ("done", 1, None))
+        self.assertEqual((self.queue.get(failing.id).status, self.queue.get(failing.id).error), ("failed", "search blocked"))
+        self.assertNotEqual(self.queue.submit(["a"], 10).id, job.id)
+
+    def test_worker_errors_fail_the_whole_batch(self):
+        job = self.queue.submit(["a"], 10)
+
+        def crawl(jobs):
+            raise RuntimeError("no sessions")
+
+        self.assertEqual(work(self.queue, crawl), 1)
+        self.assertEqual(self.queue.get(job.id).error, "no sessions")
+        self.assertEqual(self.queue.get(job.id).status, "failed")
+
+    def test_unavailable_redis_is_reported_as_none(self):
+        queue = CrawlQueue(lambda: None)
+        self.assertIsNone(queue.submit(["a"], 10))
+        self.assertEqual(queue.pop(timeout=0), [])
+        self.redis.fail = True
+        self.assertIsNone(self.queue.submit(["a"], 10))
+
+
+class TestCrawlWorker(unittest.TestCase):
+
+    def setUp(self):
+        _CACHE.clear()
+        disable_pacing(self)
+        self.redis = FakeRedis()
+        self.api = FakeTikTokApi({"a": [["1", "2"]], "b": [["3"]]})
+        for patcher in (
+            patch('crawler.redis_client', self.redis),
+            patch('crawler.TikTokApi', self.api),
+            patch('crawler.POOL_SIZE', 0),
+            patch('crawl_queue.ENABLED', True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = app.test_client()
+
+    def test_worker_crawls_jobs_into_the_cache(self):
+        job = crawl_jobs.submit(["a", "b"], 5)
+        self.assertEqual(work(crawl_jobs, crawler._crawl_jobs), 1)
+        self.assertEqual(crawl_jobs.get(job.id).total, 3)
+        self.assertEqual([row[0] for row in get_cached_rows(["a", "b"], 5).rows], ["1", "2", "3"])
+
+    def test_worker_crawls_keywords_the_video_index_knows(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        with patch('crawler.VIDEO_INDEX_PATH', os.path.join(tmp.name, "videos.db")), patch('crawler._video_index', None):
+            self.addCleanup(lambda: crawler._video_index and crawler._video_index.close())
+            crawler._index_videos("a", [_video("9")])
+            job = crawl_jobs.submit(["a"], 5)
+            self.assertEqual(work(crawl_jobs, crawler._crawl_jobs), 1)
+
+            self.assertNotEqual(self.api.requests, [])
+            self.assertEqual(crawl_jobs.get(job.id).total, 2)
+            self.assertEqual([row[0] for row in get_cached_rows(["a"], 5).rows], ["1", "2"])
+            self.assertEqual(self.redis.zcard(QUEUE_KEY), 0)
+
+    def test_refresh_joining_a_queued_job_is_not_a_new_refresh(self):
+        crawl_jobs.submit(["a"], 5, force_refresh=True, priority=PRIORITY_REFRESH)
+        with patch.object(crawler._refresh_executor, "submit") as local_refresh:
+            self.assertFalse(crawler._schedule_refresh(["a"], 5, crawler._cache_key("a", None), None))
+        local_refresh.assert_not_called()
+        self.assertEqual(self.redis.zcard(QUEUE_KEY), 1)
+
+    def test_cold_request_is_accepted_then_served_from_the_cache(self):
+        response = self.client.get("/api/videos?q=a&limit=5&wait=0")
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.api.requests, [])
+        job_url = response.headers["Location"]
+        self.assertEqual(self.client.get(job_url).get_json()["status"], "queued")
+
+        self.assertEqual(crawl_queue.run_worker(crawl_jobs, crawler._crawl_jobs, max_jobs=1), 0)
+        self.assertEqual(self.client.get(job_url).get_json()["status"], "done")
+        payload = self.client.get("/api/videos?q=a&limit=5&wait=0").get_json()
+        self.assertEqual([video["video_id"] for video in payload["videos"]], ["1", "2"])
+        self.assertTrue(payload["from_cache"])
+        self.assertEqual(self.client.get("/api/jobs/unknown").status_code, 404)
+
+    def test_request_waits_briefly_for_the_worker(self):
+        worker = threading.Thread(target=crawl_queue.run_worker, args=(crawl_jobs, crawler._crawl_jobs), kwargs={"max_jobs": 1})
+        worker.start()
+        response = self.client.get("/api/videos?q=b&limit=5&wait=10")
+        worker.join(10)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([video["video_id"] for video in response.get_json()["videos"]], ["3"])
+
+    def test_partial_jobs_are_served_without_crawling_in_the_web_worker(self):
+        self.api.failing.add("b")
+        job = crawl_jobs.submit(["a", "b"], 5)
+        work(crawl_jobs, crawler._crawl_jobs)
+        self.assertEqual(crawl_jobs.get(job.id).status, "done")
+
+        with patch.object(crawl_jobs, "submit", return_value=crawl_jobs.get(job.id)), \
+                patch('app.get_tiktok_videos') as inline:
+            payload = self.client.get("/api/videos?q=a,b&limit=5").get_json()
+        inline.assert_not_called()
+        self.assertTrue(payload["partial"])
+        self.assertEqual([video["video_id"] for video in payload["videos"]], ["1", "2"])
+
+        with patch.object(crawl_jobs, "submit", return_value=crawl_jobs.get(job.id)), \
+                patch('app.get_cached_rows', return_value=None), patch('app.get_tiktok_videos') as inline:
+            response = self.client.get("/api/videos?q=a,b&limit=5")
+        inline.assert_not_called()
+        self.assertEqual(response.status_code, 502)
+
+    def test_stale_entries_are_refreshed_through_the_queue(self):
+        with patch('crawler._refresh_executor') as executor:
+            self.assertTrue(crawler._schedule_refresh(["a"], 5, crawler._cache_key("a", None), None))
+        executor.submit.assert_not_called()
+        job = crawl_jobs.pop()[0]
+        self.assertEqual((job.keywords, job.priority, job.force_refresh), (["a"], PRIORITY_REFRESH, True))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,14 +1,92 @@
 import unittest
 from unittest.mock import AsyncMock, patch
 import asyncio
+import json
+import threading
 import time # Import time module
-from crawler import _normalise_keywords, _extract_videos, get_tiktok_videos, TikTokVideo, CrawlerResult, DEFAULT_KEYWORD, _CACHE
+from dataclasses import asdict
+
+import cache_codec
+import crawler
+from fakes import FakeRedis, disable_pacing
+from singleflight import RedisLease
+from session_pool import SessionPool
+from crawler import _normalise_keywords, _extract_videos, _fetch_tiktok_videos_async, get_tiktok_videos, get_tiktok_page, stream_tiktok_videos, SearchPage, decode_page_cursor, encode_page_cursor, TikTokVideo, CrawlerResult, DEFAULT_KEYWORD, _CACHE, BatchQuery, get_tiktok_videos_batch
+
+
+def _search_entry(video_id, author="fakeuser"):
+    return {
+        "type": 1,
+        "item": {
+            "id": video_id,
+            "desc": f"Video {video_id}",
+            "author": {"uniqueId": author},
+            "video": {"cover": f"http://example.com/{video_id}.jpg"},
+        },
+    }
+
+
+def _video(video_id):
+    return TikTokVideo(
+        video_id=video_id,
+        video_url=f"https://www.tiktok.com/@fakeuser/video/{video_id}",
+        author_id="fakeuser",
+    )
+
+
+class FakeTikTokApi:
+    """Stand-in for TikTokApi that serves canned search pages per keyword."""
+
+    def __init__(self, pages, delays=None, failing=()):
+        # pages: {keyword: [[video_id, ...], ...]} served with an offset cursor
+        self.pages = pages
+        self.delays = delays or {}
+        self.failing = set(failing)
+        self.requests = []
+        self.num_sessions = None
+
+    def __call__(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return None
+
+    async def create_sessions(self, num_sessions=1, **kwargs):
+        self.num_sessions = num_sessions
+
+    async def health_check(self):
+        return {"healthy_sessions": self.num_sessions or 0}
+
+    async def close_sessions(self):
+        return None
+
+    async def make_request(self, url, params=None, **kwargs):
+        keyword = params["keyword"]
+        offset = params["offset"]
+        self.requests.append((keyword, offset))
+        await asyncio.sleep(self.delays.get(keyword, 0))
+        if keyword in self.failing:
+            raise RuntimeError("search blocked")
+        pages = self.pages.get(keyword, [])
+        index = offset // 10
+        if index >= len(pages):
+            return {"data": [], "has_more": 0, "cursor": offset}
+        return {
+            "data": [_search_entry(video_id) for video_id in pages[index]],
+            "has_more": 1 if index + 1 < len(pages) else 0,
+            "cursor": offset + 10,
+        }
+
 
 class TestCrawler(unittest.TestCase):
 
     def setUp(self):
         # Clear the cache before each test to ensure test isolation
         _CACHE.clear()
+        disable_pacing(self)
 
     def test_normalise_keywords(self):
         self.assertEqual(_normalise_keywords(None), [])
@@ -95,6 +173,93 @@ class TestCrawler(unittest.TestCase):
         self.assertEqual(videos[2].author_id, "testuser5")
         self.assertEqual(videos[2].thumbnail_url, "http://example.com/cover5-primary.jpg")
 
+    def test_fetch_async_merges_keywords_with_shared_dedup(self):
+        fake_api = FakeTikTokApi({
+            "a": [["1", "2"], ["3"]],
+            "b": [["2", "4"]],
+        })
+        with patch('crawler.TikTokApi', fake_api):
+            videos, cursor = asyncio.run(_fetch_tiktok_videos_async(["a", "b"], 10))
+        self.assertEqual([v.video_id for v in videos], ["1", "2", "3", "4"])
+        self.assertEqual(cursor, 10)
+        self.assertEqual(fake_api.num_sessions, 2)
+
+    def test_fetch_async_prefetches_pages_by_offset(self):
+        fake_api = FakeTikTokApi({"a": [[str(i)] for i in range(5)]})
+        with patch('crawler.TikTokApi', fake_api), patch('crawler.CRAWL_CONCURRENCY', 3):
+            videos, _ = asyncio.run(_fetch_tiktok_videos_async(["a"], 50))
+        self.assertEqual([v.video_id for v in videos], ["0", "1", "2", "3", "4"])
+        self.assertIn(("a", 30), fake_api.requests)
+
+    def test_fetch_async_prefetches_only_the_pages_still_needed(self):
+        fake_api = FakeTikTokApi({"a": [[str(2 * i), str(2 * i + 1)] for i in range(10)]})
+        with patch('crawler.TikTokApi', fake_api), patch('crawler.CRAWL_CONCURRENCY', 8):
+            videos, _ = asyncio.run(_fetch_tiktok_videos_async(["a"], 6))
+        self.assertEqual(len(videos), 6)
+        self.assertEqual(fake_api.requests, [("a", 0), ("a", 10), ("a", 20)])
+
+    def test_fetch_async_cancels_once_enough_videos(self):
+        fake_api = FakeTikTokApi(
+            {"fast": [["1", "2", "3"]], "slow": [["9"]]},
+            delays={"slow": 5},
+        )
+        with patch('crawler.TikTokApi', fake_api):
+            started = time.monotonic()
+            videos, _ = asyncio.run(_fetch_tiktok_videos_async(["fast", "slow"], 2))
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual([v.video_id for v in videos], ["1", "2"])
+
+    def test_fetch_async_borrows_from_session_pool(self):
+        fake_api = FakeTikTokApi({"a": [["1"]], "b": [["2"]]})
+        pool = SessionPool(lambda: fake_api, size=2, min_warm=0)
+        try:
+            videos, _ = pool.run(_fetch_tiktok_videos_async(["a", "b"], 10, pool=pool))
+            stats = pool.stats()
+        finally:
+            pool.close()
+        self.assertEqual([v.video_id for v in videos], ["1", "2"])
+        self.assertEqual(stats["borrows"], 1)
+        self.assertEqual(stats["idle"], 1)
+        self.assertEqual(stats["leased"], 0)
+
+    def test_fetch_async_failure_retries_then_keeps_partial_results(self):
+        fake_api = FakeTikTokApi({"a": [["1"]]}, failing={"b"})
+        errors = []
+        with patch('crawler.TikTokApi', fake_api), patch('crawler.RETRY_ATTEMPTS', 3):
+            videos, _ = asyncio.run(_fetch_tiktok_videos_async(["a", "b"], 10, errors=errors))
+        self.assertEqual([v.video_id for v in videos], ["1"])
+        self.assertEqual(errors, ["search blocked"])
+        self.assertEqual(fake_api.requests.count(("b", 0)), 3)
+
+    def test_fetch_async_failure_without_results_returns_nothing(self):
+        fake_api = FakeTikTokApi({}, failing={"a"})
+        with patch('crawler.TikTokApi', fake_api):
+            self.assertEqual(asyncio.run(_fetch_tiktok_videos_async(["a"], 10)), ([], None))
+
+    def test_partial_crawl_is_cached_only_for_what_it_found(self):
+        fake_redis = FakeRedis()
+        fake_api = FakeTikTokApi({"a": [["1", "2"], ["3"]]}, failing=())
+        real_make_request = fake_api.make_request
+
+        async def fail_second_page(url, params=None, **kwargs):
+            if params["offset"]:
+                raise RuntimeError("throttled")
+            return await real_make_request(url, params=params, **kwargs)
+
+        fake_api.make_request = fail_second_page
+        with patch('crawler.TikTokApi', fake_api), patch('crawler.redis_client', fake_redis), \
+                patch('crawler.POOL_SIZE', 0):
+            result = get_tiktok_videos(["a"], 5)
+            with patch('crawler._run_async', return_value=([], None)) as mock_run_async:
+                smaller = get_tiktok_videos(["a"], 2)
+                get_tiktok_videos(["a"], 5)
+
+        self.assertTrue(result.partial)
+        self.assertEqual([v.video_id for v in result.videos], ["1", "2"])
+        self.assertEqual(result.next_cursor, 10)
+        self.assertTrue(smaller.from_cache)
+        mock_run_async.assert_called_once()  # the 5-video query is not served the partial entry
+
     @patch('crawler._run_async')
     def test_get_tiktok_videos_success(self, mock_run_async):
         mock_run_async.return_value = ([
@@ -142,27 +307,408 @@ class TestCrawler(unittest.TestCase):
     @patch('crawler._run_async')
     def test_get_tiktok_videos_cache_hit(self, mock_run_async):
         # Manually populate the cache for the test with the correct key
-        _CACHE["cached"] = {
+        fake_redis = FakeRedis()
+        fake_redis.set("tiktok:cached", json.dumps({
             "videos": [
-                TikTokVideo(
+                asdict(TikTokVideo(
                     video_id="7000000000000000004",
                     video_url="https://www.tiktok.com/@mockuser4/video/7000000000000000004",
                     author_id="mockuser4",
                     title="Cached Video 4",
                     play_url="http://mock.com/play4.mp4",
-                ),
+                )),
             ],
-            "timestamp": time.time() + 1000, # Ensure it's not expired
             "next_cursor": None
-        }
+        }), ex=1000)
 
-        result = get_tiktok_videos(keywords=["cached"], num_videos=1, force_refresh=False)
+        with patch('crawler.redis_client', fake_redis):
+            result = get_tiktok_videos(keywords=["cached"], num_videos=1, force_refresh=False)
         self.assertIsInstance(result, CrawlerResult)
         self.assertEqual(len(result.videos), 1)
         self.assertTrue(result.from_cache)
         self.assertIsNone(result.error)
         mock_run_async.assert_not_called() # _run_async should not be called on cache hit
 
+    def test_concurrent_misses_share_one_crawl(self):
+        calls = []
+
+        def slow_run_async(keywords, num_videos, *, initial_cursor, errors=None):
+            calls.append(keywords)
+            time.sleep(0.2)
+            return [_video("1"), _video("2")], 20
+
+        results = []
+        with patch('crawler._run_async', side_effect=slow_run_async), patch('crawler.redis_client', FakeRedis()):
+            threads = [
+                threading.Thread(target=lambda: results.append(get_tiktok_videos(keywords=["herd"], num_videos=2)))
+                for _ in range(5)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all([v.video_id for v in r.videos] == ["1", "2"] for r in results))
+
+    def test_bigger_requests_crawl_after_a_smaller_in_flight_crawl(self):
+        calls = []
+        started = threading.Event()
+
+        def slow_run_async(keywords, num_videos, *, initial_cursor, errors=None):
+            calls.append(num_videos)
+            started.set()
+            time.sleep(0.2)
+            return [_video(str(n)) for n in range(num_videos)], 20
+
+        results = {}
+        with patch('crawler._run_async', side_effect=slow_run_async), patch('crawler.redis_client', FakeRedis()):
+            small = threading.Thread(target=lambda: results.update(small=get_tiktok_videos(["herd"], 2)))
+            small.start()
+            started.wait(5)
+            big = threading.Thread(target=lambda: results.update(big=get_tiktok_videos(["herd"], 5)))
+            big.start()
+            small.join()
+            big.join()
+
+        self.assertEqual(calls, [2, 5])
+        self.assertEqual(len(results["small"].videos), 2)
+        self.assertEqual(len(results["big"].videos), 5)
+
+    def test_waits_for_crawl_running_in_another_worker(self):
+        fake_redis = FakeRedis()
+        peer = RedisLease(fake_redis, "tiktok:herd", ttl=30)
+        self.assertTrue(peer.acquire())
+
+        def peer_finishes():
+            time.sleep(0.2)
+            peer.fenced_set(json.dumps({"videos": [asdict(_video("9"))], "next_cursor": 10}), ex=60)
+            peer.release()
+
+        with patch('crawler._run_async') as mock_run_async, patch('crawler.redis_client', fake_redis), \
+                patch('crawler.COALESCE_POLL_INTERVAL', 0.01):
+            thread = threading.Thread(target=peer_finishes)
+            thread.start()
+            result = get_tiktok_videos(keywords=["herd"], num_videos=5)
+            thread.join()
+
+        mock_run_async.assert_not_called()
+        self.assertTrue(result.from_cache)
+        self.assertEqual([v.video_id for v in result.videos], ["9"])
+        self.assertEqual(result.next_cursor, 10)
+
+    def test_crawls_itself_when_peer_lease_times_out(self):
+        fake_redis = FakeRedis()
+        self.assertTrue(RedisLease(fake_redis, "tiktok:herd", ttl=0.1).acquire())
+
+        with patch('crawler._run_async', return_value=([_video("3")], None)) as mock_run_async, \
+                patch('crawler.redis_client', fake_redis), patch('crawler.COALESCE_POLL_INTERVAL', 0.01):
+            result = get_tiktok_videos(keywords=["herd"], num_videos=5)
+
+        mock_run_async.assert_called_once()
+        self.assertFalse(result.from_cache)
+        self.assertIsNotNone(fake_redis.get("tiktok:herd"))
+        self.assertFalse(fake_redis.exists("tiktok:herd:lease"))
+
+    def test_stale_leader_cannot_overwrite_newer_crawl(self):
+        fake_redis = FakeRedis()
+        stale = RedisLease(fake_redis, "tiktok:herd", ttl=0.05)
+        self.assertTrue(stale.acquire())
+        time.sleep(0.1)
+        fresh = RedisLease(fake_redis, "tiktok:herd", ttl=30)
+        self.assertTrue(fresh.acquire())
+
+        self.assertTrue(fresh.fenced_set("new", ex=60))
+        self.assertFalse(stale.fenced_set("old", ex=60))
+        stale.release()
+        self.assertTrue(fake_redis.exists("tiktok:herd:lease"))
+        self.assertEqual(fake_redis.get("tiktok:herd"), b"new")
+
+    def test_fence_and_generation_counters_expire_with_the_entry(self):
+        fake_redis = FakeRedis()
+        with patch('crawler._run_async', return_value=([_video("1")], None)), \
+                patch('crawler.redis_client', fake_redis), patch('crawler.CACHE_HARD_TTL', 600):
+            get_tiktok_videos(keywords=["herd"], num_videos=1)
+
+        for key in ("tiktok:herd", "tiktok:herd:fence", "tiktok:herd:gen"):
+            self.assertGreater(fake_redis.ttl(key), 590, key)
+
+    def test_stale_entry_served_while_refreshing_in_background(self):
+        fake_redis = FakeRedis()
+        fake_redis.set("tiktok:swr", json.dumps({
+            "videos": [asdict(_video("old"))],
+            "next_cursor": None,
+            "cached_at": time.time() - 120,
+        }), ex=1000)
+        refreshed = threading.Event()
+
+        def refresh_run_async(keywords, num_videos, *, initial_cursor, errors=None):
+            refreshed.wait(2)
+            return [_video("new")], None
+
+        with patch('crawler._run_async', side_effect=refresh_run_async) as mock_run_async, \
+                patch('crawler.redis_client', fake_redis), patch('crawler.CACHE_TTL', 60):
+            first = get_tiktok_videos(keywords=["swr"], num_videos=5)
+            second = get_tiktok_videos(keywords=["swr"], num_videos=5)
+            refreshed.set()
+            crawler._refresh_executor.submit(lambda: None).result()
+            while crawler._refreshing:
+                time.sleep(0.01)
+            third = get_tiktok_videos(keywords=["swr"], num_videos=5)
+
+        self.assertTrue(first.from_cache)
+        self.assertTrue(first.stale)
+        self.assertGreaterEqual(first.cache_age, 120)
+        self.assertEqual([v.video_id for v in second.videos], ["old"])
+        mock_run_async.assert_called_once()
+        self.assertEqual([v.video_id for v in third.videos], ["new"])
+        self.assertFalse(third.stale)
+        self.assertLess(third.cache_age, 60)
+
+    def test_fresh_entry_does_not_refresh(self):
+        fake_redis = FakeRedis()
+        fake_redis.set("tiktok:fresh", json.dumps({
+            "videos": [asdict(_video("1"))],
+            "next_cursor": None,
+            "cached_at": time.time() - 5,
+        }), ex=1000)
+
+        with patch('crawler._run_async') as mock_run_async, patch('crawler.redis_client', fake_redis):
+            result = get_tiktok_videos(keywords=["fresh"], num_videos=5)
+
+        mock_run_async.assert_not_called()
+        self.assertFalse(result.stale)
+
+    def test_cache_written_with_hard_ttl(self):
+        fake_redis = FakeRedis()
+        with patch('crawler._run_async', return_value=([_video("1")], None)), \
+                patch('crawler.redis_client', fake_redis), patch('crawler.CACHE_HARD_TTL', 5000):
+            get_tiktok_videos(keywords=["ttl"], num_videos=5)
+        self.assertGreater(fake_redis.ttl("tiktok:ttl"), 4000)
+
+    def test_multi_keyword_query_reuses_per_keyword_entries(self):
+        fake_redis = FakeRedis()
+        crawled = []
+
+        def per_keyword_run_async(keywords, num_videos, *, initial_cursor, errors=None):
+            crawled.append(list(keywords))
+            ids = {"a": ["1", "2"], "b": ["2", "3"], "c": ["4"]}[keywords[0]]
+            return [_video(i) for i in ids], None
+
+        with patch('crawler._run_async', side_effect=per_keyword_run_async), patch('crawler.redis_client', fake_redis), \
+                patch('crawler.LOCAL_CACHE_BYTES', 0):
+            get_tiktok_videos(keywords=["a"], num_videos=10)
+            combined = get_tiktok_videos(keywords=["a", "b"], num_videos=10)
+            fake_redis.mget_calls = 0
+            cached = get_tiktok_videos(keywords=["b", "a"], num_videos=10)
+            extended = get_tiktok_videos(keywords=["a", "b", "c"], num_videos=10)
+
+        self.assertEqual(crawled, [["a"], ["b"], ["c"]])
+        self.assertFalse(combined.from_cache)
+        self.assertEqual([v.video_id for v in combined.videos], ["1", "2", "3"])
+        self.assertTrue(cached.from_cache)
+        self.assertEqual([v.video_id for v in cached.videos], ["2", "3", "1"])
+        self.assertEqual([v.video_id for v in extended.videos], ["1", "2", "3", "4"])
+        self.assertEqual(fake_redis.mget_calls, 2)
+
+    def test_batch_uses_one_lookup_and_one_session_startup(self):
+        fake_redis = FakeRedis()
+        fake_api = FakeTikTokApi({"a": [["1", "2"]], "b": [["3"]], "c": [["4"]]}, failing={"blocked"})
+        startups = []
+        create_sessions = fake_api.create_sessions
+
+        async def counting_create_sessions(**kwargs):
+            startups.append(kwargs)
+            await create_sessions(**kwargs)
+
+        fake_api.create_sessions = counting_create_sessions
+        with patch('crawler.redis_client', fake_redis), patch('crawler.TikTokApi', fake_api), \
+                patch('crawler.POOL_SIZE', 0), patch('crawler.LOCAL_CACHE_BYTES', 0):
+            get_tiktok_videos(["a"], 10)
+            fake_redis.mget_calls, startups[:] = 0, []
+            results = get_tiktok_videos_batch([
+                BatchQuery(["a", "b"], 10),
+                BatchQuery(["b", "c"], 10),
+                BatchQuery(["blocked"], 10),
+                BatchQuery([" "], 10),
+            ])
+
+        self.assertEqual(fake_redis.mget_calls, 1)
+        self.assertEqual(len(startups), 1)
+        self.assertEqual(sorted(k for k, _ in fake_api.requests if k != "blocked"), ["a", "b", "c"])
+        self.assertEqual([v.video_id for v in results[0].videos], ["1", "2", "3"])
+        self.assertFalse(results[0].from_cache)
+        self.assertEqual([v.video_id for v in results[1].videos], ["3", "4"])
+        self.assertIsNone(results[1].error)
+        self.assertEqual(results[2].videos, [])
+        self.assertIn("blocked", results[2].error)
+        self.assertEqual(results[3].error, "Keywords list must not be empty")
+        self.assertIsNotNone(fake_redis.get("tiktok:c"))
+
+    def test_later_keywords_skipped_when_cached_prefix_fills_limit(self):
+        fake_redis = FakeRedis()
+        with patch('crawler._run_async', return_value=([_video("1"), _video("2")], None)), \
+                patch('crawler.redis_client', fake_redis):
+            get_tiktok_videos(keywords=["a"], num_videos=2)
+        with patch('crawler._run_async') as mock_run_async, patch('crawler.redis_client', fake_redis):
+            result = get_tiktok_videos(keywords=["a", "never"], num_videos=2)
+        mock_run_async.assert_not_called()
+        self.assertEqual([v.video_id for v in result.videos], ["1", "2"])
+
+    def test_short_entry_is_recrawled_for_bigger_limit(self):
+        fake_redis = FakeRedis()
+        with patch('crawler._run_async', return_value=([_video("1")], None)), patch('crawler.redis_client', fake_redis):
+            get_tiktok_videos(keywords=["a"], num_videos=1)
+        with patch('crawler._run_async', return_value=([_video("1"), _video("2")], None)) as mock_run_async, \
+                patch('crawler.redis_client', fake_redis):
+            result = get_tiktok_videos(keywords=["a"], num_videos=5)
+            again = get_tiktok_videos(keywords=["a"], num_videos=5)
+        mock_run_async.assert_called_once()
+        self.assertEqual(len(result.videos), 2)
+        self.assertTrue(again.from_cache)
+
+    def test_cached_rows_fast_path(self):
+        fake_redis = FakeRedis()
+        with patch('crawler._run_async', return_value=([_video("1"), _video("2")], None)), \
+                patch('crawler.redis_client', fake_redis):
+            get_tiktok_videos(keywords=["a"], num_videos=3)
+            fake_redis.set("tiktok:b", json.dumps({"videos": [asdict(_video("2")), asdict(_video("3"))]}))
+            cached = crawler.get_cached_rows(["a", "b"], 3)
+            missing = crawler.get_cached_rows(["a", "c"], 3)
+            short = crawler.get_cached_rows(["a"], 5)
+
+        self.assertEqual([row[0] for row in cached.rows], ["1", "2", "3"])
+        self.assertEqual(cached.rows[0], crawler._video_row(_video("1")))
+        self.assertFalse(cached.stale)
+        self.assertIsNone(missing)
+        self.assertIsNone(short)
+
+    def test_corrupt_cache_entry_is_recrawled(self):
+        fake_redis = FakeRedis()
+        fake_redis.set("tiktok:a", cache_codec.MAGIC + bytes([cache_codec.VERSION]) + b"\xc1")
+        with patch('crawler._run_async', return_value=([_video("1")], None)) as mock_run_async, \
+                patch('crawler.redis_client', fake_redis):
+            self.assertIsNone(crawler.get_cached_rows(["a"], 1))
+            result = get_tiktok_videos(keywords=["a"], num_videos=1)
+        mock_run_async.assert_called_once()
+        self.assertEqual([v.video_id for v in result.videos], ["1"])
+
+    def test_pages_walk_keywords_and_cache_each_upstream_page(self):
+        upstream = {
+            ("a", 0): SearchPage(videos=[_video("1"), _video("2"), _video("3")], next_cursor=3, has_more=True),
+            ("a", 3): SearchPage(videos=[_video("4")], next_cursor=4, has_more=False),
+            ("b", 0): SearchPage(videos=[_video("4"), _video("5")], next_cursor=2, has_more=False),
+        }
+        fetched = []
+
+        def fake_run_page(keyword, cursor, count):
+            fetched.append((keyword, cursor))
+            return upstream[(keyword, cursor)]
+
+        fake_redis = FakeRedis()
+        with patch('crawler._run_page', side_effect=fake_run_page), patch('crawler.redis_client', fake_redis):
+            first = get_tiktok_page(["a", "b"], 2)
+            second = get_tiktok_page(["a", "b"], 2, cursor=first.next_page)
+            third = get_tiktok_page(["a", "b"], 2, cursor=second.next_page)
+            again = get_tiktok_page(["a", "b"], 2, cursor=first.next_page)
+
+        self.assertEqual([v.video_id for v in first.videos], ["1", "2"])
+        self.assertEqual([v.video_id for v in second.videos], ["3", "4"])
+        self.assertEqual([v.video_id for v in third.videos], ["4", "5"])
+        self.assertIsNone(third.next_page)
+        self.assertEqual(fetched, [("a", 0), ("a", 3), ("b", 0)])
+        self.assertTrue(again.from_cache)
+        self.assertTrue(fake_redis.exists("tiktok:page:a:3"))
+
+    def test_page_failure_returns_collected_videos(self):
+        def fake_run_page(keyword, cursor, count):
+            if cursor:
+                raise RuntimeError("blocked")
+            return SearchPage(videos=[_video("1")], next_cursor=1, has_more=True)
+
+        with patch('crawler._run_page', side_effect=fake_run_page):
+            result = get_tiktok_page(["a"], 5)
+        self.assertEqual([v.video_id for v in result.videos], ["1"])
+        self.assertIsNone(result.error)
+        self.assertEqual(decode_page_cursor(result.next_page), (0, 1, 0))
+
+    def test_invalid_page_cursor(self):
+        with self.assertRaises(ValueError):
+            decode_page_cursor("not-a-cursor")
+        self.assertEqual(decode_page_cursor(encode_page_cursor(1, 30, 2)), (1, 30, 2))
+
+    def test_stream_emits_cached_batch_then_crawled_pages(self):
+        fake_redis = FakeRedis()
+        fake_redis.set("tiktok:a", json.dumps({"videos": [asdict(_video("1"))], "next_cursor": None}))
+        fake_api = FakeTikTokApi({"b": [["1", "2"], ["3"]]})
+
+        with patch('crawler.TikTokApi', fake_api), patch('crawler.POOL_SIZE', 0), \
+                patch('crawler.redis_client', fake_redis):
+            events = list(stream_tiktok_videos(["a", "b"], 10))
+
+        batches, summary = events[:-1], events[-1]
+        self.assertEqual([[v.video_id for v in batch] for batch in batches], [["1"], ["2"], ["3"]])
+        self.assertIsInstance(summary, CrawlerResult)
+        self.assertEqual([v.video_id for v in summary.videos], ["1", "2", "3"])
+        self.assertFalse(summary.from_cache)
+        self.assertEqual(summary.next_cursor, 20)
+        cached_b = cache_codec.decode(fake_redis.get("tiktok:b"))
+        self.assertEqual([row[0] for row in cached_b.rows], ["1", "2", "3"])
+        self.assertEqual(cached_b.limit, 3)
+        self.assertEqual(fake_redis.pipelines_executed, 1)
+
+    def test_stream_caches_the_rows_a_plain_crawl_would(self):
+        fake_redis = FakeRedis()
+        fake_api = FakeTikTokApi({"a": [["1", "1", "2"], ["3", "4", "5"]]})
+        with patch('crawler.TikTokApi', fake_api), patch('crawler.POOL_SIZE', 0), \
+                patch('crawler.redis_client', fake_redis):
+            list(stream_tiktok_videos(["a"], 2))
+
+        cached = cache_codec.decode(fake_redis.get("tiktok:a"))
+        self.assertEqual([row[0] for row in cached.rows], ["1", "2"])
+        self.assertEqual(cached.limit, 2)
+
+    def test_stream_stops_the_crawl_when_the_client_goes_away(self):
+        fake_api = FakeTikTokApi({"a": [[str(n)] for n in range(10)]}, delays={"a": 0.05})
+        with patch('crawler.TikTokApi', fake_api), patch('crawler.POOL_SIZE', 0), \
+                patch('crawler.redis_client', FakeRedis()):
+            stream = stream_tiktok_videos(["a"], 10)
+            self.assertEqual([v.video_id for v in next(stream)], ["0"])
+            stream.close()
+            time.sleep(0.3)
+            requested = len(fake_api.requests)
+            time.sleep(0.2)
+        self.assertEqual(len(fake_api.requests), requested)
+        self.assertLess(requested, 10)
+
+    def test_stream_writes_under_the_crawl_lease(self):
+        fake_redis = FakeRedis()
+        peer = RedisLease(fake_redis, "tiktok:b", ttl=30)
+        self.assertTrue(peer.acquire())
+        fake_api = FakeTikTokApi({"a": [["1"]], "b": [["2"]]})
+
+        with patch('crawler.TikTokApi', fake_api), patch('crawler.POOL_SIZE', 0), \
+                patch('crawler.redis_client', fake_redis):
+            summary = list(stream_tiktok_videos(["a", "b"], 10))[-1]
+
+        self.assertEqual(sorted(v.video_id for v in summary.videos), ["1", "2"])
+        self.assertIsNotNone(fake_redis.get("tiktok:a"))
+        self.assertEqual(fake_redis.get("tiktok:a:fence"), b"1")
+        self.assertFalse(fake_redis.exists("tiktok:a:lease"))
+        self.assertIsNone(fake_redis.get("tiktok:b"))  # left for the worker holding its lease
+        self.assertTrue(fake_redis.exists("tiktok:b:lease"))
+
+    def test_stream_serves_fully_cached_query_without_crawling(self):
+        fake_redis = FakeRedis()
+        fake_redis.set("tiktok:a", json.dumps({"videos": [asdict(_video("1"))], "next_cursor": 5}))
+        with patch('crawler._submit_coroutine') as mock_submit, patch('crawler.redis_client', fake_redis):
+            events = list(stream_tiktok_videos(["a"], 1))
+        mock_submit.assert_not_called()
+        self.assertEqual(len(events), 2)
+        self.assertTrue(events[-1].from_cache)
+        self.assertEqual(events[-1].next_cursor, 5)
+
     @patch('crawler.DEFAULT_KEYWORD', []) # Patch DEFAULT_KEYWORD to be empty
     def test_get_tiktok_videos_value_error_empty_keywords(self):
         with self.assertRaises(ValueError) as cm:
@@ -0,0 +1,145 @@
+import os
+import time
+import unittest
+from unittest.mock import patch
+
+import redis
+
+import cache_codec
+import crawler
+from crawler import _CACHE, get_tiktok_videos
+from fakes import FakeRedis, disable_pacing
+from local_cache import InvalidationListener, LocalCache
+from test_crawler import _video
+
+
+class TestLocalCache(unittest.TestCase):
+
+    def test_evicts_least_recently_used_within_byte_budget(self):
+        cache = LocalCache(max_bytes=1000, ttl=60)
+        cache.set("a", 1, 200)
+        cache.set("b", 2, 200)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3, 200)  # 3 * (200 + overhead) > 1000, so "b" goes
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.stats()["evictions"], 1)
+        self.assertLessEqual(cache.size_bytes, 1000)
+
+        cache.set("huge", 4, 5000)
+        self.assertIsNone(cache.get("huge"))
+
+    def test_ttl_can_only_shorten(self):
+        cache = LocalCache(max_bytes=10_000, ttl=0.05)
+        cache.set("long", 1, 10, ttl=3600)
+        cache.set("gone", 2, 10, ttl=0)
+        self.assertEqual(cache.get("long"), 1)
+        self.assertIsNone(cache.get("gone"))
+        time.sleep(0.06)
+        self.assertIsNone(cache.get("long"))
+        self.assertEqual(cache.stats()["expired"], 1)
+
+    def test_invalidation_reaches_other_processes_only(self):
+        fake_redis = FakeRedis()
+        ours, theirs = LocalCache(max_bytes=10_000, ttl=60), LocalCache(max_bytes=10_000, ttl=60)
+        our_listener = InvalidationListener(ours, "chan")
+        their_listener = InvalidationListener(theirs, "chan")
+        self.assertTrue(our_listener.ensure(fake_redis))
+        self.assertTrue(their_listener.ensure(fake_redis))
+        ours.set("k", "new", 10)
+        theirs.set("k", "old", 10)
+
+        our_listener.publish(fake_redis, ["k"])
+        self.assertEqual(ours.get("k"), "new")
+        self.assertIsNone(theirs.get("k"))
+        self.assertEqual(theirs.stats()["invalidations"], 1)
+        our_listener.close()
+        their_listener.close()
+
+    def test_unreachable_redis_disables_until_retry(self):
+        fake_redis = FakeRedis()
+        fake_redis.fail = True
+        listener = InvalidationListener(LocalCache(max_bytes=10_000, ttl=60), "chan", retry_interval=60)
+        self.assertFalse(listener.ensure(fake_redis))
+        fake_redis.fail = False
+        self.assertFalse(listener.ensure(fake_redis))  # still waiting out the retry interval
+
+    def test_listener_errors_disable_the_cache_until_resubscribed(self):
+        fake_redis = FakeRedis()
+        cache = LocalCache(max_bytes=10_000, ttl=60)
+        listener = InvalidationListener(cache, "chan", retry_interval=60)
+        self.assertTrue(listener.ensure(fake_redis))
+        cache.set("k", "v", 10)
+
+        fake_redis.fail = True
+        listener._on_error(redis.exceptions.ConnectionError("gone"), None, listener._thread)
+        self.assertIsNone(cache.get("k"))
+        self.assertFalse(listener.ensure(fake_redis))
+        self.assertEqual(fake_redis._subscribers["chan"], [])
+
+        fake_redis.fail = False
+        listener._retry_at = 0.0
+        self.assertTrue(listener.ensure(fake_redis))
+        listener.close()
+
+    def test_forked_workers_get_their_own_origin(self):
+        fake_redis = FakeRedis()
+        parent_cache = LocalCache(max_bytes=10_000, ttl=60)
+        listener = InvalidationListener(parent_cache, "chan")
+        self.assertTrue(listener.ensure(fake_redis))
+        parent_origin = listener.origin
+        sibling = InvalidationListener(LocalCache(max_bytes=10_000, ttl=60), "chan")
+        sibling.origin = parent_origin  # what a worker forked after construction used to announce with
+
+        with patch('local_cache.os.getpid', return_value=os.getpid() + 1):
+            self.assertTrue(listener.ensure(fake_redis))
+            self.assertNotEqual(listener.origin, parent_origin)
+            parent_cache.set("k", "v", 10)
+            sibling.publish(fake_redis, ["k"])
+        self.assertIsNone(parent_cache.get("k"))
+        listener.close()
+
+
+class TestCrawlerLocalTier(unittest.TestCase):
+
+    def setUp(self):
+        _CACHE.clear()
+        disable_pacing(self)
+        self.fake_redis = FakeRedis()
+        for patcher in (patch('crawler.redis_client', self.fake_redis), patch('crawler.POOL_SIZE', 0)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.other_process = InvalidationListener(LocalCache(max_bytes=10_000, ttl=60), crawler.INVALIDATION_CHANNEL)
+        self.other_process.ensure(self.fake_redis)
+        self.addCleanup(self.other_process.close)
+
+    def test_repeat_query_is_served_without_redis(self):
+        with patch('crawler._run_async', return_value=([_video("1")], None)):
+            get_tiktok_videos(["a"], 1)
+        self.fake_redis.mget_calls = 0
+        result = get_tiktok_videos(["a"], 1)
+        self.assertTrue(result.from_cache)
+        self.assertEqual(self.fake_redis.mget_calls, 0)
+
+        self.other_process.publish(self.fake_redis, ["tiktok:a"])
+        get_tiktok_videos(["a"], 1)
+        self.assertEqual(self.fake_redis.mget_calls, 1)
+
+    def test_refresh_invalidates_other_processes(self):
+        self.other_process.cache.set("tiktok:a", "old", 10)
+        with patch('crawler._run_async', return_value=([_video("2")], None)):
+            result = get_tiktok_videos(["a"], 1, force_refresh=True)
+        self.assertEqual([v.video_id for v in result.videos], ["2"])
+        self.assertIsNone(self.other_process.cache.get("tiktok:a"))
+        self.assertEqual([row[0] for row in _CACHE.get("tiktok:a").rows], ["2"])
+
+    def test_entries_never_outlive_redis(self):
+        payload = cache_codec.encode([crawler._video_row(_video("1"))], next_cursor=None, limit=1, cached_at=time.time() - 100)
+        self.fake_redis.set("tiktok:a", payload)
+        with patch('crawler.CACHE_HARD_TTL', 100):
+            crawler._read_cache_many(["tiktok:a"])
+        self.assertEqual(len(_CACHE), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+import metrics
+from app import app
+from crawler import _fetch_tiktok_videos_async, get_tiktok_videos
+from fakes import FakeRedis, disable_pacing
+from test_crawler import FakeTikTokApi
+
+
+class TestMetricsRendering(unittest.TestCase):
+
+    def test_counter_and_histogram_text_format(self):
+        counter = metrics.Counter("demo_total", "Demo counter.", ("family",))
+        counter.inc(family='a"b')
+        counter.inc(2, family='a"b')
+        histogram = metrics.Histogram("demo_seconds", "Demo histogram.", ("stage",), buckets=(0.1, 1.0))
+        histogram.observe(0.05, stage="x")
+        histogram.observe(0.5, stage="x")
+        histogram.observe(5, stage="x")
+
+        self.assertEqual(counter.render(), [
+            "# HELP demo_total Demo counter.",
+            "# TYPE demo_total counter",
+            'demo_total{family="a\\"b"} 3',
+        ])
+        self.assertEqual(histogram.render()[2:], [
+            'demo_seconds_bucket{stage="x",le="0.1"} 1',
+            'demo_seconds_bucket{stage="x",le="1"} 2',
+            'demo_seconds_bucket{stage="x",le="+Inf"} 3',
+            'demo_seconds_sum{stage="x"} 5.55',
+            'demo_seconds_count{stage="x"} 3',
+        ])
+
+    def test_timed_adds_to_current_request(self):
+        timings, token = metrics.start_request()
+        try:
+            with metrics.timed("redis_get"):
+                pass
+            with metrics.timed("redis_get"):
+                pass
+        finally:
+            metrics.end_request(token)
+        self.assertIn("redis_get", timings.stages)
+        self.assertRegex(timings.header(), r"^redis_get;dur=\d+\.\d, total;dur=\d+\.\d$")
+        self.assertIsNone(metrics.current_timings())
+
+
+class TestCrawlInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        disable_pacing(self)
+
+    def test_crawl_counts_pages_and_duplicates(self):
+        pages = metrics.PAGES_FETCHED.value()
+        duplicates = metrics.VIDEOS_DEDUPLICATED.value()
+        extracts = metrics.STAGE_SECONDS.count(stage="extract")
+        fake_api = FakeTikTokApi({"a": [["1", "2"]], "b": [["2", "3"]]})
+        with patch('crawler.TikTokApi', fake_api):
+            asyncio.run(_fetch_tiktok_videos_async(["a", "b"], 10))
+        self.assertEqual(metrics.PAGES_FETCHED.value() - pages, 2)
+        self.assertEqual(metrics.VIDEOS_DEDUPLICATED.value() - duplicates, 1)
+        self.assertEqual(metrics.STAGE_SECONDS.count(stage="extract") - extracts, 2)
+
+    def test_search_failure_is_counted(self):
+        failures = metrics.CRAWL_FAILURES.value(reason="search_error")
+        with patch('crawler.TikTokApi', FakeTikTokApi({}, failing={"a"})):
+            videos, _ = asyncio.run(_fetch_tiktok_videos_async(["a"], 10))
+        self.assertEqual(videos, [])
+        self.assertEqual(metrics.CRAWL_FAILURES.value(reason="search_error") - failures, 1)
+
+    def test_cache_hits_and_misses_per_tier(self):
+        def counts():
+            return {
+                (tier, result): metrics.CACHE_REQUESTS.value(tier=tier, family="videos", result=result)
+                for tier in ("local", "redis") for result in ("hit", "miss")
+            }
+
+        before = counts()
+        fake_api = FakeTikTokApi({"a": [["1"]]})
+        fake_redis = FakeRedis()
+        with patch('crawler.redis_client', fake_redis), patch('crawler.TikTokApi', fake_api), \
+                patch('crawler.POOL_SIZE', 0):
+            get_tiktok_videos(["a"], 1)
+            get_tiktok_videos(["a"], 1)
+            get_tiktok_videos(["a"], 1)
+        after = counts()
+        self.assertEqual({key: after[key] - before[key] for key in after}, {
+            ("local", "hit"): 2, ("local", "miss"): 1, ("redis", "hit"): 0, ("redis", "miss"): 1,
+        })
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.client = app.test_client()
+        disable_pacing(self)
+
+    def test_metrics_route_and_timing_header(self):
+        fake_api = FakeTikTokApi({"a": [["1"]]})
+        with patch('crawler.redis_client', FakeRedis()), patch('crawler.TikTokApi', fake_api), \
+                patch('crawler.POOL_SIZE', 0), patch('metrics.TIMING_HEADER', True):
+            response = self.client.get("/api/videos?q=a&limit=1")
+        self.assertEqual(response.status_code, 200)
+        timing = response.headers["Server-Timing"]
+        for stage in ("redis_get", "create_sessions", "make_request", "extract", "redis_set", "total"):
+            self.assertIn(f"{stage};dur=", timing)
+
+        without_header = self.client.get("/metrics")
+        self.assertNotIn("Server-Timing", without_header.headers)
+        self.assertTrue(without_header.content_type.startswith("text/plain"))
+        body = without_header.get_data(as_text=True)
+        self.assertIn("# TYPE tiktok_stage_seconds histogram", body)
+        self.assertIn('tiktok_stage_seconds_count{stage="make_request"}', body)
+        self.assertIn('tiktok_cache_requests_total{tier="redis",family="videos",result="miss"}', body)
+        self.assertIn("# TYPE tiktok_local_cache_bytes gauge", body)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import crawler
+from crawler import CrawlerResult, TikTokVideo, _fetch_tiktok_videos_async, _merge_entries
+from fakes import disable_pacing
+from near_duplicates import NearDuplicateIndex
+from test_crawler import FakeTikTokApi
+
+TITLE = "Huntrix golden dance practice full choreography #kpop #demonhunters"
+
+
+def _titled(video_id, title, author="fakeuser"):
+    return TikTokVideo(
+        video_id=video_id,
+        video_url=f"https://www.tiktok.com/@{author}/video/{video_id}",
+        author_id=author,
+        thumbnail_url=f"https://p16-sign.tiktokcdn.com/obj/cover-{video_id}~tplv-crop.jpeg?x-expires=1",
+        title=title,
+    )
+
+
+class _TitledApi(FakeTikTokApi):
+    """Serves one page of (video_id, title, author) entries per keyword."""
+
+    async def make_request(self, url, params=None, **kwargs):
+        self.requests.append((params["keyword"], params["offset"]))
+        return {
+            "data": [
+                {"type": 1, "item": {"id": video_id, "desc": title, "author": {"uniqueId": author}}}
+                for video_id, title, author in self.pages.get(params["keyword"], [])
+            ],
+            "has_more": 0,
+            "cursor": params["offset"] + 10,
+        }
+
+
+class TestNearDuplicateIndex(unittest.TestCase):
+
+    def test_reuploads_join_the_first_upload(self):
+        index = NearDuplicateIndex(threshold=0.6)
+        self.assertEqual(index.assign(_titled("1", TITLE, "original")), "1")
+        self.assertEqual(index.assign(_titled("2", TITLE + " #fyp", "reuploader")), "1")
+        self.assertEqual(index.assign(_titled("3", "cat plays piano at midnight again", "original")), "3")
+        self.assertEqual(index.cluster_of("2"), "1")
+        self.assertIsNone(index.cluster_of("unknown"))
+
+    def test_short_titles_are_never_clustered(self):
+        index = NearDuplicateIndex(threshold=0.6)
+        self.assertEqual(index.assign(_titled("1", "#kpop #fyp")), "1")
+        self.assertEqual(index.assign(_titled("2", "#kpop #fyp")), "2")
+        self.assertEqual(len(index), 0)
+
+    def test_persisted_and_loaded_incrementally(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "near_dups.db")
+            first = NearDuplicateIndex(path, threshold=0.6, sync_interval=3600)
+            other = NearDuplicateIndex(path, threshold=0.6, sync_interval=3600)
+            first.assign(_titled("1", TITLE, "original"))
+            first.flush()
+
+            self.assertEqual(other.sync(), 1)
+            self.assertEqual(other.assign(_titled("2", TITLE + " #fyp", "reuploader")), "1")
+            other.close()
+            self.assertEqual(first.sync(), 1)
+            self.assertEqual(first.cluster_of("2"), "1")
+            first.close()
+
+            reopened = NearDuplicateIndex(path, threshold=0.6)
+            self.assertEqual(len(reopened), 2)
+            self.assertEqual(reopened.cluster_of("2"), "1")
+            reopened.close()
+
+    def test_old_signatures_age_out_of_memory_and_disk(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "near_dups.db")
+            index = NearDuplicateIndex(path, threshold=0.6, max_age=3600)
+            index.assign(_titled("1", TITLE, "original"))
+            index.assign(_titled("2", TITLE + " #fyp", "reuploader"))
+            index.assign(_titled("3", "cat plays piano at midnight again", "original"))
+            index.flush()
+            with index._conn:
+                index._conn.execute("UPDATE signatures SET added_at = 0 WHERE video_id IN ('1', '3')")
+            index._added_at[0] = index._added_at[2] = 0
+            index._pruned_at = 0
+
+            index.sync()
+            self.assertEqual(len(index), 1)
+            self.assertIsNone(index.cluster_of("1"))
+            self.assertEqual(index.cluster_of("2"), "2")  # the surviving reupload now represents the clip
+            self.assertEqual(index.assign(_titled("4", TITLE + " #fyp #dance", "another")), "2")
+            index.close()
+
+            reopened = NearDuplicateIndex(path, threshold=0.6, max_age=3600)
+            self.assertEqual(len(reopened), 2)
+            self.assertEqual(reopened.cluster_of("4"), "2")
+            reopened.close()
+
+
+class TestCrawlerNearDuplicates(unittest.TestCase):
+
+    def setUp(self):
+        disable_pacing(self)
+        for patcher in (patch('crawler.POOL_SIZE', 0), patch('crawler._near_dups', NearDuplicateIndex(threshold=0.6))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_crawl_merge_collapses_reuploads(self):
+        fake_api = _TitledApi({
+            "a": [("1", TITLE, "original"), ("2", "something else entirely different here", "x")],
+            "b": [("3", TITLE + " #fyp", "reuploader"), ("4", "another unrelated clip for the grid", "y")],
+        })
+        with patch('crawler.TikTokApi', fake_api):
+            videos, _ = asyncio.run(_fetch_tiktok_videos_async(["a", "b"], 10))
+        self.assertEqual([v.video_id for v in videos], ["1", "2", "4"])
+
+    def test_cached_entries_merge_by_cluster(self):
+        original, reupload = _titled("1", TITLE, "original"), _titled("9", TITLE + " #fyp", "reuploader")
+        for video in (original, reupload):
+            crawler._near_dups.assign(video)
+        entries = [CrawlerResult(videos=[original], from_cache=True), CrawlerResult(videos=[reupload], from_cache=True)]
+        self.assertEqual([v.video_id for v in _merge_entries(entries, 10)], ["1"])
+
+        with patch('crawler.NEAR_DUP_THRESHOLD', 0):
+            self.assertEqual([v.video_id for v in _merge_entries(entries, 10)], ["1", "9"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+import asyncio
+import threading
+import unittest
+from unittest.mock import patch
+
+from crawler import _fetch_tiktok_videos_async
+from fakes import FakeRedis, disable_pacing
+from rate_limit import RateLimited, RateLimiter, backoff_delay
+from test_crawler import FakeTikTokApi
+
+
+def _limiter(**kwargs):
+    options = {"rate": 10.0, "burst": 1, "min_rate": 1.0, "max_wait": 5.0}
+    options.update(kwargs)
+    return RateLimiter(**options)
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_bucket_paces_after_burst(self):
+        limiter = _limiter()
+
+        async def scenario():
+            return [await limiter.acquire() for _ in range(3)]
+
+        waits = asyncio.run(scenario())
+        self.assertEqual(waits[0], 0)
+        self.assertAlmostEqual(waits[1], 0.1, delta=0.02)
+
+    def test_wait_beyond_max_wait_raises_without_reserving(self):
+        limiter = _limiter(rate=1.0, max_wait=0.5)
+        asyncio.run(limiter.acquire())
+        with self.assertRaises(RateLimited):
+            asyncio.run(limiter.acquire())
+        self.assertGreater(limiter._tokens, -1)
+
+    def test_aimd_adjusts_between_bounds(self):
+        limiter = _limiter(increase=1.0, decrease=0.5, slow_after=1.0)
+        asyncio.run(limiter.record(ok=False, elapsed=0.1))
+        self.assertEqual(limiter.rate, 5.0)
+        asyncio.run(limiter.record(ok=True, elapsed=2.0))  # slow
+        self.assertEqual(limiter.rate, 2.5)
+        for _ in range(5):
+            asyncio.run(limiter.record(ok=False, elapsed=0.1))
+        self.assertEqual(limiter.rate, 1.0)
+        for _ in range(20):
+            asyncio.run(limiter.record(ok=True, elapsed=0.1))
+        self.assertEqual(limiter.rate, 10.0)
+
+    def test_workers_share_bucket_and_rate_through_redis(self):
+        fake_redis = FakeRedis()
+        first = _limiter(rate=1.0, max_wait=0.5, client=lambda: fake_redis)
+        second = _limiter(rate=1.0, max_wait=0.5, client=lambda: fake_redis)
+        asyncio.run(first.acquire())
+        with self.assertRaises(RateLimited):
+            asyncio.run(second.acquire())
+
+        asyncio.run(first.record(ok=False, elapsed=0.1))
+        self.assertEqual(fake_redis._hashes["tiktok:ratelimit"]["rate"], 1.0)  # already at the floor
+        third = _limiter(client=lambda: fake_redis)
+        asyncio.run(third.record(ok=False, elapsed=0.1))
+        self.assertEqual(third.rate, 1.0)  # the shared rate wins over this worker's own
+
+    def test_shared_decrease_runs_off_the_event_loop(self):
+        fake_redis = FakeRedis()
+        limiter = _limiter(client=lambda: fake_redis)
+        threads = []
+        original_eval = fake_redis.eval
+
+        def eval(*args):
+            threads.append(threading.get_ident())
+            return original_eval(*args)
+
+        async def scenario():
+            await limiter.record(ok=False, elapsed=0.1)
+            return threading.get_ident()
+
+        with patch.object(fake_redis, "eval", eval):
+            loop_thread = asyncio.run(scenario())
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], loop_thread)
+        self.assertEqual(limiter.rate, 5.0)
+
+    def test_falls_back_to_local_bucket_when_redis_fails(self):
+        fake_redis = FakeRedis()
+        fake_redis.fail = True
+        limiter = _limiter(client=lambda: fake_redis)
+        self.assertEqual(asyncio.run(limiter.acquire()), 0)
+        self.assertLess(limiter._tokens, 1)
+
+    def test_backoff_delay_is_capped_full_jitter(self):
+        delays = [backoff_delay(attempt, base=0.5, cap=2.0) for attempt in (1, 2, 3, 4, 5) for _ in range(50)]
+        self.assertTrue(all(0 <= delay <= 2.0 for delay in delays))
+        self.assertTrue(all(backoff_delay(1, base=0.5, cap=2.0) <= 0.5 for _ in range(50)))
+
+
+class TestCrawlPacing(unittest.TestCase):
+
+    def setUp(self):
+        disable_pacing(self)
+
+    def test_transient_failure_is_retried(self):
+        fake_api = FakeTikTokApi({"a": [["1"]]})
+        real_make_request = fake_api.make_request
+        attempts = []
+
+        async def flaky(url, params=None, **kwargs):
+            attempts.append(params["offset"])
+            if len(attempts) == 1:
+                raise RuntimeError("connection reset")
+            return await real_make_request(url, params=params, **kwargs)
+
+        fake_api.make_request = flaky
+        errors = []
+        with patch('crawler.TikTokApi', fake_api):
+            videos, _ = asyncio.run(_fetch_tiktok_videos_async(["a"], 10, errors=errors))
+        self.assertEqual([v.video_id for v in videos], ["1"])
+        self.assertEqual(attempts, [0, 0])
+        self.assertEqual(errors, [])
+
+    def test_status_code_in_body_counts_as_failure(self):
+        fake_api = FakeTikTokApi({})
+
+        async def throttled(url, params=None, **kwargs):
+            return {"status_code": 10201, "status_msg": "too many requests"}
+
+        fake_api.make_request = throttled
+        errors = []
+        with patch('crawler.TikTokApi', fake_api), patch('crawler.RETRY_ATTEMPTS', 2):
+            self.assertEqual(asyncio.run(_fetch_tiktok_videos_async(["a"], 10, errors=errors)), ([], None))
+        self.assertIn("status_code 10201", errors[0])
+
+    def test_rate_limit_returns_partial_results_with_cursor(self):
+        fake_api = FakeTikTokApi({"a": [["1"], ["2"], ["3"]]})
+        limiter = _limiter(rate=1.0, max_wait=0.1)
+        errors = []
+        with patch('crawler.TikTokApi', fake_api), patch('crawler._get_rate_limiter', return_value=limiter):
+            videos, cursor = asyncio.run(_fetch_tiktok_videos_async(["a"], 10, errors=errors))
+        self.assertEqual([v.video_id for v in videos], ["1"])
+        self.assertEqual(cursor, 10)
+        self.assertTrue(errors[0].startswith("rate limited"))
+
+
+if __name__ == "__main__":
+    unittest.main()
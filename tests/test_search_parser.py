@@ -0,0 +1,53 @@
+import asyncio
+import json
+import os
+import unittest
+
+import search_parser
+from crawler import PooledSession, _CrawlAborted, _request_page
+from fakes import disable_pacing
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "fixtures")
+
+
+class _TextApi:
+    def __init__(self, body):
+        self.body = body
+
+    async def make_request(self, **kwargs):
+        return self.body
+
+
+class TestSearchParser(unittest.TestCase):
+
+    def setUp(self):
+        disable_pacing(self)
+
+    def test_resolve_thumbnail_searches_depth_first_in_key_order(self):
+        self.assertEqual(search_parser.resolve_thumbnail("  http://a  "), "http://a")
+        self.assertIsNone(search_parser.resolve_thumbnail(["", " ", {}]))
+        nested = {"urlList": [" ", {"url": "http://deep"}], "url": ["", None]}
+        self.assertEqual(search_parser.resolve_thumbnail(nested), "http://deep")
+        self.assertEqual(search_parser.resolve_thumbnail({**nested, "uri": "uri-value"}), "uri-value")
+        self.assertEqual(search_parser.resolve_thumbnail({"cover": {"origin": "x"}, "uri": "y"}), "x")
+
+    def test_extracts_recorded_fixture(self):
+        with open(os.path.join(FIXTURES, "search_response_0.json"), "rb") as f:
+            response = search_parser.loads(f.read())
+        rows = search_parser.extract_videos(response["data"])
+        self.assertEqual(len(rows), sum(1 for entry in response["data"] if entry["type"] == 1))
+        self.assertTrue(all(len(row) == 7 and row[3] for row in rows))
+
+    def test_request_page_decodes_text_bodies(self):
+        body = json.dumps({"data": [], "has_more": 0})
+        session = PooledSession(api=_TextApi(body))
+        response = asyncio.run(_request_page(session, "a", 0, 10, limiter=asyncio.Semaphore(1)))
+        self.assertEqual(response["has_more"], 0)
+
+        session = PooledSession(api=_TextApi("<html>blocked</html>"))
+        with self.assertRaises(_CrawlAborted):
+            asyncio.run(_request_page(session, "a", 0, 10, limiter=asyncio.Semaphore(1)))
+
+
+if __name__ == "__main__":
+    unittest.main()
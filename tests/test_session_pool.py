@@ -0,0 +1,157 @@
+import asyncio
+import time
+import unittest
+
+from session_pool import SessionPool
+
+
+class FakeSessionApi:
+    def __init__(self):
+        self.healthy = True
+        self.closed = False
+
+    async def create_sessions(self, num_sessions=1, **kwargs):
+        return None
+
+    async def health_check(self):
+        return {"healthy_sessions": 1 if self.healthy else 0}
+
+    async def close_sessions(self):
+        self.closed = True
+
+
+class TestSessionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.created = []
+
+        def factory():
+            api = FakeSessionApi()
+            self.created.append(api)
+            return api
+
+        self.pool = SessionPool(factory, size=2, min_warm=0, idle_timeout=60, max_age=600, acquire_timeout=1)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_reuses_warm_session(self):
+        async def borrow_twice():
+            async with self.pool.borrow() as first:
+                pass
+            async with self.pool.borrow() as second:
+                pass
+            return first, second
+
+        first, second = self.pool.run(borrow_twice())
+        self.assertIs(first.api, second.api)
+        self.assertEqual(len(self.created), 1)
+        self.assertEqual(self.pool.stats()["borrows"], 2)
+
+    def test_failed_session_is_recycled(self):
+        async def fail_then_borrow():
+            try:
+                async with self.pool.borrow():
+                    raise RuntimeError("boom")
+            except RuntimeError:
+                pass
+            async with self.pool.borrow() as session:
+                return session
+
+        session = self.pool.run(fail_then_borrow())
+        self.assertIsNot(session.api, self.created[0])
+        self.assertEqual(self.pool.stats()["recycled"], 1)
+
+    def test_unhealthy_idle_session_is_replaced(self):
+        async def scenario():
+            async with self.pool.borrow() as session:
+                session.api.healthy = False
+            async with self.pool.borrow() as session:
+                return session
+
+        session = self.pool.run(scenario())
+        self.assertIs(session.api, self.created[1])
+        self.assertEqual(self.pool.stats()["health_failures"], 1)
+
+    def test_health_checks_run_outside_the_lock(self):
+        release = asyncio.Event()
+
+        async def scenario():
+            slow = await self.pool.acquire()
+            await self.pool.release(slow)
+
+            async def stuck_check():
+                await release.wait()
+                return {"healthy_sessions": 1}
+
+            slow.api.health_check = stuck_check
+            checking = asyncio.create_task(self.pool.acquire())
+            await asyncio.sleep(0.01)
+            other = await asyncio.wait_for(self.pool.acquire(), 1)  # not blocked behind the check
+            release.set()
+            return slow, await checking, other
+
+        slow, checked, other = self.pool.run(scenario())
+        self.assertIs(checked, slow)
+        self.assertIsNot(other.api, slow.api)
+        self.assertEqual(self.pool.stats()["checking"], 0)
+
+    def test_close_waits_for_recycled_sessions(self):
+        async def scenario():
+            session = await self.pool.acquire()
+
+            async def slow_close():
+                await asyncio.sleep(0.1)
+                session.api.closed = True
+
+            session.api.close_sessions = slow_close
+            session.failed = True
+            await self.pool.release(session)
+            return session
+
+        session = self.pool.run(scenario())
+        self.pool.close()
+        self.assertTrue(session.api.closed)
+
+    def test_waits_when_pool_is_exhausted(self):
+        async def scenario():
+            first = await self.pool.acquire()
+            second = await self.pool.acquire()
+
+            async def give_back():
+                await asyncio.sleep(0.05)
+                await self.pool.release(first)
+
+            asyncio.create_task(give_back())
+            third = await self.pool.acquire()
+            await self.pool.release(second)
+            await self.pool.release(third)
+            return first, third
+
+        first, third = self.pool.run(scenario())
+        self.assertIs(first, third)
+        self.assertEqual(self.pool.stats()["waits"], 1)
+
+    def test_acquire_without_wait_only_takes_idle_sessions(self):
+        async def scenario():
+            return await self.pool.acquire(wait=False)
+
+        self.assertIsNone(self.pool.run(scenario()))
+        self.assertEqual(self.created, [])
+
+    def test_idle_sessions_above_min_warm_are_reaped(self):
+        async def scenario():
+            first = await self.pool.acquire()
+            second = await self.pool.acquire()
+            await self.pool.release(first)
+            await self.pool.release(second)
+            self.pool._reap(time.monotonic() + 120)
+            await asyncio.sleep(0)
+
+        self.pool.run(scenario())
+        self.assertEqual(self.pool.stats()["idle"], 0)
+        self.assertTrue(all(api.closed for api in self.created))
+
+
+if __name__ == '__main__':
+    unittest.main()
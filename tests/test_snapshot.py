@@ -0,0 +1,102 @@
+import json
+import os
+import tempfile
+import unittest
+from dataclasses import asdict
+from unittest.mock import patch
+
+import crawler
+import snapshot
+from crawler import CrawlerResult, TikTokVideo
+
+
+def _video(video_id):
+    return TikTokVideo(
+        video_id=video_id,
+        video_url=f"https://www.tiktok.com/@fakeuser/video/{video_id}",
+        author_id="fakeuser",
+    )
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "tiktok_live.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_merge_keeps_first_seen_and_ages_out_old_videos(self):
+        previous = [
+            {**asdict(_video("1")), "first_seen": 100, "last_seen": 500},
+            {**asdict(_video("2")), "first_seen": 200, "last_seen": 900},
+            {**asdict(_video("3")), "first_seen": 50, "last_seen": 60},
+        ]
+        merged = snapshot.merge_videos(previous, [asdict(_video("4")), asdict(_video("1"))], now=1000, retention=600)
+
+        self.assertEqual([v["video_id"] for v in merged], ["4", "1", "2"])
+        self.assertEqual((merged[1]["first_seen"], merged[1]["last_seen"]), (100, 1000))
+        self.assertEqual((merged[2]["first_seen"], merged[2]["last_seen"]), (200, 900))
+
+    def test_legacy_snapshot_uses_file_mtime(self):
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"videos": [asdict(_video("1"))]}, f)
+        os.utime(self.path, (1234, 1234))
+        self.assertEqual(snapshot.load_videos(self.path)[0]["first_seen"], 1234)
+        self.assertEqual(snapshot.load_videos(os.path.join(self.tmp.name, "missing.json")), [])
+
+    def test_write_atomic_leaves_no_temp_files(self):
+        snapshot.write_atomic(self.path, {"videos": []})
+        with self.assertRaises(TypeError):
+            snapshot.write_atomic(self.path, {"videos": object()})
+        self.assertEqual(os.listdir(self.tmp.name), ["tiktok_live.json"])
+        with open(self.path, encoding="utf-8") as f:
+            self.assertEqual(json.load(f), {"videos": []})
+
+    def test_shards_keep_previous_generation_only(self):
+        videos = [asdict(_video(str(i))) for i in range(5)]
+        for generated_at in (1, 2, 3):
+            names = snapshot.write_shards(self.path, {"generated_at": generated_at, "videos": videos}, 2)
+
+        shard_dir = os.path.join(self.tmp.name, "tiktok_live")
+        with open(os.path.join(shard_dir, "index.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+        with open(os.path.join(shard_dir, names[0]), encoding="utf-8") as f:
+            first = json.load(f)
+        self.assertEqual(manifest["shards"], names)
+        for number, name in enumerate(names):
+            self.assertRegex(name, rf"^shard-3-[0-9a-f]{{8}}-{number:04d}\.json$")
+        self.assertEqual([v["video_id"] for v in first["videos"]], ["0", "1"])
+        self.assertEqual(len([n for n in os.listdir(shard_dir) if n.startswith("shard-2-")]), 3)
+        self.assertFalse(any(n.startswith("shard-1-") for n in os.listdir(shard_dir)))
+
+    def test_runs_in_the_same_second_do_not_share_shards(self):
+        payload = {"generated_at": 1, "videos": [asdict(_video("1"))]}
+        first = snapshot.write_shards(self.path, payload, 2)
+        second = snapshot.write_shards(self.path, {**payload, "videos": [asdict(_video("2"))]}, 2)
+
+        self.assertNotEqual(first, second)
+        with open(os.path.join(self.tmp.name, "tiktok_live", first[0]), encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["videos"][0]["video_id"], "1")  # still what the old manifest promised
+
+    def test_main_snapshot_mode_merges_runs(self):
+        runs = iter([[_video("1"), _video("2")], [_video("3"), _video("1")]])
+
+        def fake_get(*args, **kwargs):
+            return CrawlerResult(videos=next(runs), from_cache=False)
+
+        argv = ["a", "--snapshot", "--output", self.path, "--shard-size", "2"]
+        with patch('crawler.get_tiktok_videos', side_effect=fake_get):
+            self.assertEqual(crawler.main(argv), 0)
+            self.assertEqual(crawler.main(argv), 0)
+
+        with open(self.path, encoding="utf-8") as f:
+            payload = json.load(f)
+        self.assertEqual([v["video_id"] for v in payload["videos"]], ["3", "1", "2"])
+        self.assertEqual(payload["total"], 3)
+        self.assertTrue(os.path.exists(os.path.join(self.tmp.name, "tiktok_live", "index.json")))
+
+
+if __name__ == "__main__":
+    unittest.main()
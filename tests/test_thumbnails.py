@@ -0,0 +1,147 @@
+import io
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+import thumbnails
+from app import _videos_payload, app
+from crawler import CrawlerResult, TikTokVideo
+from thumbnails import Prefetcher, ThumbnailStore
+
+COVER = "https://p16-sign.tiktokcdn.com/obj/cover-1.jpeg?x-expires=1"
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+
+
+def _png(width, height):
+    out = io.BytesIO()
+    thumbnails.Image.new("RGB", (width, height), "red").save(out, "PNG")
+    return out.getvalue()
+
+
+class _Fetcher:
+    def __init__(self, body=PNG):
+        self.body = body
+        self.calls = []
+
+    def __call__(self, url):
+        self.calls.append(url)
+        return self.body if isinstance(self.body, bytes) else self.body(url)
+
+
+class TestThumbnailStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_fetches_once_and_stores_by_content(self):
+        fetch = _Fetcher()
+        store = ThumbnailStore(self.tmp.name, max_bytes=1_000_000, fetch=fetch)
+        first = store.get(COVER, 135)
+        second = store.get(COVER, 135)
+        store.get(COVER.replace("x-expires=1", "x-expires=2"), 135)  # same bytes, new signature
+
+        self.assertEqual(first.body, second.body)
+        self.assertEqual(first.etag, second.etag)
+        self.assertEqual(len(fetch.calls), 2)
+        objects = [name for _, _, names in os.walk(os.path.join(self.tmp.name, "objects")) for name in names]
+        self.assertEqual(len([name for name in objects if "." not in name]), 1)
+
+    def test_evicts_least_recently_used_files(self):
+        fetch = _Fetcher(lambda url: PNG + url.encode())
+        store = ThumbnailStore(self.tmp.name, max_bytes=600, fetch=fetch)
+        for n in range(8):
+            store.get(f"https://a.tiktokcdn.com/{n}.png", 135)
+        self.assertLessEqual(store.size_bytes(), 600)
+
+        fetch.calls.clear()
+        store.get("https://a.tiktokcdn.com/0.png", 135)
+        self.assertEqual(fetch.calls, ["https://a.tiktokcdn.com/0.png"])
+
+    def test_variants_outlive_the_original_and_the_signature(self):
+        fetch = _Fetcher()
+        store = ThumbnailStore(self.tmp.name, max_bytes=1_000_000, fetch=fetch)
+        with patch('thumbnails.Image', object()), patch('thumbnails._resize', lambda data, width: b"webp%d" % width):
+            first = store.get(COVER, 135)
+            original = store._object_path(first.etag.rsplit("-", 1)[0])
+            os.utime(original, (1, 1))
+            self.assertEqual(store.get(COVER, 135).body, b"webp135")
+            self.assertGreater(os.stat(original).st_mtime, 1)  # reading the variant keeps the original warm
+
+            os.remove(original)
+            fetch.body = lambda url: (_ for _ in ()).throw(thumbnails.ThumbnailError("signature expired"))
+            self.assertEqual(store.get(COVER, 135).body, b"webp135")
+        self.assertEqual(len(fetch.calls), 1)
+
+    def test_eviction_skips_files_being_written(self):
+        store = ThumbnailStore(self.tmp.name, max_bytes=1_000_000, fetch=_Fetcher())
+        with open(os.path.join(self.tmp.name, "objects", "x.123.456.tmp"), "wb") as f:
+            f.write(b"partial")
+        self.assertEqual(store._files(), [])
+
+    @unittest.skipIf(thumbnails.Image is None, "Pillow is not installed")
+    def test_variants_are_cropped_webp_at_grid_size(self):
+        store = ThumbnailStore(self.tmp.name, max_bytes=1_000_000, fetch=_Fetcher(_png(720, 1000)))
+        thumbnail = store.get(COVER, 135)
+        self.assertEqual(thumbnail.content_type, "image/webp")
+        with thumbnails.Image.open(io.BytesIO(thumbnail.body)) as image:
+            self.assertEqual(image.size, (135, 240))
+
+    def test_prefetcher_is_bounded_and_skips_foreign_hosts(self):
+        release = threading.Event()
+        started = []
+        store = ThumbnailStore(self.tmp.name, max_bytes=1_000_000, fetch=_Fetcher())
+        prefetcher = Prefetcher(lambda: store, workers=1, max_pending=2)
+        with patch.object(store, "prefetch", side_effect=lambda url: started.append(url) or release.wait(5)):
+            queued = prefetcher.submit([COVER, COVER, "https://evil.example/1.jpg", None] + [
+                f"https://a.tiktokcdn.com/{n}.jpg" for n in range(5)
+            ])
+            release.set()
+            prefetcher.join()
+        self.assertEqual(queued, 2)
+        self.assertEqual(started, [COVER, "https://a.tiktokcdn.com/0.jpg"])
+
+
+class TestThumbnailRoute(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.fetch = _Fetcher()
+        store = ThumbnailStore(self.tmp.name, max_bytes=1_000_000, fetch=self.fetch)
+        for patcher in (patch('thumbnails.THUMBNAIL_DIR', self.tmp.name), patch('thumbnails._store', store)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = app.test_client()
+
+    def test_payload_points_at_cached_variant(self):
+        video = TikTokVideo("1", "https://www.tiktok.com/@a/video/1", "a", thumbnail_url=COVER)
+        other = TikTokVideo("2", "https://www.tiktok.com/@a/video/2", "a", thumbnail_url="https://example.com/2.jpg")
+        payload = _videos_payload(["a"], CrawlerResult(videos=[video, other], from_cache=False))
+        self.assertEqual(payload["videos"][0]["thumbnail_url"], f"/api/thumbnails/270/{thumbnails.encode_token(COVER)}")
+        self.assertEqual(payload["videos"][1]["thumbnail_url"], "https://example.com/2.jpg")
+
+    def test_serves_with_long_lived_cache_headers(self):
+        path = thumbnails.public_url(COVER, 135)
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("immutable", response.headers["Cache-Control"])
+        etag = response.headers["ETag"]
+
+        revalidated = self.client.get(path, headers={"If-None-Match": etag})
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(len(self.fetch.calls), 1)
+
+    def test_rejects_unknown_widths_hosts_and_tokens(self):
+        token = thumbnails.encode_token(COVER)
+        self.assertEqual(self.client.get(f"/api/thumbnails/999/{token}").status_code, 404)
+        foreign = thumbnails.encode_token("http://169.254.169.254/latest")
+        self.assertEqual(self.client.get(f"/api/thumbnails/135/{foreign}").status_code, 404)
+        self.assertEqual(self.client.get("/api/thumbnails/135/%FF").status_code, 400)
+        self.assertEqual(self.fetch.calls, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
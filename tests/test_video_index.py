@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import crawler
+from crawler import TikTokVideo, _video_row, get_tiktok_videos
+from fakes import FakeRedis
+from video_index import VideoIndex
+
+
+def _video(video_id, author="fakeuser"):
+    return TikTokVideo(
+        video_id=video_id,
+        video_url=f"https://www.tiktok.com/@{author}/video/{video_id}",
+        author_id=author,
+    )
+
+
+class TestVideoIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.index = VideoIndex(os.path.join(self.tmp.name, "videos.db"))
+
+    def tearDown(self):
+        self.index.close()
+        self.tmp.cleanup()
+
+    def test_upsert_tracks_first_and_last_seen(self):
+        self.index.upsert("A", [_video_row(_video("1")), _video_row(_video("2", author="bob"))], seen_at=100)
+        self.index.upsert("a", [_video_row(_video("3")), _video_row(_video("1"))], seen_at=200)
+
+        rows, crawled_at = self.index.keyword_rows("a", 10)
+        self.assertEqual([row[0] for row in rows], ["3", "1", "2"])
+        self.assertEqual(crawled_at, 200)
+        self.assertEqual([row[0] for row in self.index.query(author="bob")], ["2"])
+        self.assertEqual([row[0] for row in self.index.query(since=150)], ["3"])
+        self.assertEqual([row[0] for row in self.index.query(keyword="a", author="bob", since=50)], ["2"])
+        journal_mode = self.index._conn.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(journal_mode, "wal")
+
+
+class TestCrawlerVideoIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmp.name, "videos.db")
+        self.patches = [patch('crawler.VIDEO_INDEX_PATH', path), patch('crawler._video_index', None)]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        if crawler._video_index is not None:
+            crawler._video_index.close()
+        for p in reversed(self.patches):
+            p.stop()
+        self.tmp.cleanup()
+
+    def test_crawl_is_indexed_and_served_when_redis_is_cold(self):
+        with patch('crawler._run_async', return_value=([_video("1"), _video("2")], None)), \
+                patch('crawler.redis_client', FakeRedis()):
+            get_tiktok_videos(["a"], 2)
+
+        with patch('crawler._run_async') as mock_run_async, patch('crawler._schedule_refresh') as mock_refresh, \
+                patch('crawler.redis_client', FakeRedis()):
+            result = get_tiktok_videos(["a"], 2)
+
+        mock_run_async.assert_not_called()
+        mock_refresh.assert_called_once()
+        self.assertEqual([v.video_id for v in result.videos], ["1", "2"])
+        self.assertTrue(result.from_cache)
+        self.assertTrue(result.stale)
+        self.assertEqual([v.video_id for v in crawler.query_video_index(author="fakeuser")], ["1", "2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import time
+import unittest
+from unittest.mock import patch
+
+import cache_codec
+import crawler
+import warmer
+from crawler import _CACHE, get_tiktok_videos
+from fakes import FakeRedis, disable_pacing
+from test_crawler import FakeTikTokApi, _video
+from warmer import POPULAR_DECAYED_AT_KEY, POPULAR_KEY, QueryRecorder
+
+
+class TestPopularity(unittest.TestCase):
+
+    def setUp(self):
+        self.fake_redis = FakeRedis()
+        self.recorder = QueryRecorder(lambda: self.fake_redis)
+        self.recorder._thread = object()  # flush by hand instead of from the background thread
+
+    def test_counts_are_batched_into_the_sorted_set(self):
+        for _ in range(3):
+            self.recorder.record(["KPOP", "Dance"], 100)
+        self.recorder.record(["solo"], 20)
+        self.assertEqual(self.fake_redis.zrevrange(POPULAR_KEY, 0, -1), [])
+
+        self.assertEqual(self.recorder.flush(), 2)
+        self.assertEqual(self.fake_redis.zscore(POPULAR_KEY, "100:kpop,dance"), 3.0)
+        self.assertEqual(warmer.popular_queries(self.fake_redis, 10), [(["kpop", "dance"], 100), (["solo"], 20)])
+
+    def test_scores_decay_and_the_set_is_trimmed(self):
+        for member, score in (("10:a", 8), ("10:b", 4), ("10:c", 2)):
+            self.fake_redis.zincrby(POPULAR_KEY, score, member)
+        self.fake_redis.set(POPULAR_DECAYED_AT_KEY, time.time() - 3600)
+        with patch('warmer.POPULARITY_HALF_LIFE', 3600), patch('warmer.POPULARITY_MAX_QUERIES', 2):
+            self.assertEqual(warmer.popular_queries(self.fake_redis, 10), [(["a"], 10), (["b"], 10)])
+        self.assertAlmostEqual(self.fake_redis.zscore(POPULAR_KEY, "10:a"), 4.0, places=2)
+
+    def test_redis_errors_drop_counts(self):
+        self.recorder.record(["a"], 10)
+        self.fake_redis.fail = True
+        self.assertEqual(self.recorder.flush(), 0)
+        self.fake_redis.fail = False
+        self.assertEqual(self.recorder.flush(), 0)
+
+
+class TestWarm(unittest.TestCase):
+
+    def setUp(self):
+        _CACHE.clear()
+        disable_pacing(self)
+        self.fake_redis = FakeRedis()
+        self.fake_api = FakeTikTokApi({"hot": [["1"]], "fresh": [["2"]], "aging": [["3"]], "seed": [["4"]]})
+        for patcher in (
+            patch('crawler.redis_client', self.fake_redis),
+            patch('crawler.TikTokApi', self.fake_api),
+            patch('crawler.POOL_SIZE', 0),
+            patch('crawler.DEFAULT_KEYWORD', ["seed"]),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _popular(self, member, score):
+        self.fake_redis.zincrby(POPULAR_KEY, score, member)
+
+    def test_crawls_missing_and_aging_keywords_within_budget(self):
+        get_tiktok_videos(["fresh"], 10)
+        self.fake_redis.set("tiktok:aging", cache_codec.encode(
+            [crawler._video_row(_video("3"))], next_cursor=None, limit=10, cached_at=time.time() - 3500
+        ))
+        self.fake_api.requests.clear()
+        for member, score in (("10:hot", 5), ("10:fresh,aging", 3)):
+            self._popular(member, score)
+
+        with patch('crawler.CACHE_TTL', 3600):
+            report = warmer.warm(top=10, budget=2, lead=300)
+
+        self.assertEqual(report.considered, 4)
+        self.assertEqual(report.warmed, ["hot", "aging"])
+        self.assertEqual(report.over_budget, ["seed"])
+        self.assertEqual(sorted(k for k, _ in self.fake_api.requests), ["aging", "hot"])
+        self.assertIsNotNone(self.fake_redis.get("tiktok:hot"))
+
+    def test_seeds_default_keyword_after_a_flush(self):
+        report = warmer.warm(top=10, budget=5)
+        self.assertEqual(report.warmed, ["seed"])
+
+    def test_cli_mode(self):
+        with patch('warmer.warm', return_value=warmer.WarmReport(considered=1, warmed=["seed"])) as warm:
+            self.assertEqual(crawler.main(["--warm", "--warm-budget", "3", "--warm-interval", "0"]), 0)
+        self.assertEqual(warm.call_args.kwargs["budget"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()